@@ -0,0 +1,188 @@
+"""
+Нагрузочный тест DevicesCommander / DeviceManagement на локальном парке fake_routeros.FakeSshFleet.
+Парк запускается в отдельном процессе, сценарии выполняются функциями main.py, вывод в консоль подавляется.
+
+Для каждого размера парка и сценария (sysname, config, icmp, stats) выводит:
+devices/s, commands/s, p50/p99 задержки одной команды, пиковую память и общее время выполнения (makespan).
+Пиковая память - пик выделений Python (tracemalloc) за время сценария: трассировка запускается перед каждым
+сценарием и останавливается после него, поэтому память предыдущих сценариев и размеров парка не учитывается.
+Трассировка замедляет сценарии, --no-memory - замер только времени.
+
+    python bench_devicecontrol.py
+    python bench_devicecontrol.py --devices 100 1000 --workflows sysname icmp --latency 0.05 --ping-delay 0.01
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import devicecontrol as dc
+import fake_routeros
+import main
+
+WORKFLOWS = ('sysname', 'config', 'icmp', 'stats')
+DEVICES = (100, 1000, 5000)
+
+
+class CommandTimer:
+    """
+    Замеряет время каждого DeviceManagement.send_command на время блока with
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self._send_command = None
+
+    def __enter__(self):
+        self._send_command = send_command_original = dc.DeviceManagement.send_command
+        latencies = self.latencies
+
+        async def send_command(runner, *args, **kwargs):
+            now = time.perf_counter()
+            try:
+                return await send_command_original(runner, *args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - now)
+
+        dc.DeviceManagement.send_command = send_command
+        return self
+
+    def __exit__(self, *exc):
+        dc.DeviceManagement.send_command = self._send_command
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+
+def raise_open_files_limit():
+    """Каждое устройство держит SSH сессии в пуле - на 5000 устройств не хватает лимита открытых файлов"""
+    if resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def get_devices(ports, username, password):
+    devices = dc.Devices()
+    for i, port in enumerate(ports):
+        config = devices.config_example.copy()
+        config.update(host='127.0.0.1', port=port, auth_username=username, auth_password=password)
+        devices.device_list.append(dc.Device(connect_param=config, city='bench', name=f'CM-{i}', id=str(i)))
+    return devices
+
+
+def set_icmp_targets(devices, ping_ips):
+    """Списки IP для сценария icmp, без парсинга конфигурации"""
+    for device in devices:
+        device.mikroconfig = SimpleNamespace(
+            ip_free=[fake_routeros.FakeDevice.remote_ip(i) for i in range(ping_ips)],
+            ip_in_tu=[fake_routeros.FakeDevice.remote_ip(ping_ips + i) for i in range(ping_ips // 2)],
+            icmp_false=set(), icmp_true=set(), icmp_ip_in_tu_false=set(), icmp_ip_in_tu_true=set())
+
+
+def run_stats(devcom, devices, stats_ips):
+    ip_list = [fake_routeros.FakeDevice.remote_ip(i) for i in range(stats_ips)]
+    for device in devices:
+        devcom.append_coroutine(dc.CommandRunner_Get(device).get_stats_by_ip(ip_list, False, False, bulk=True),
+                                device=device)
+    devcom.run()
+
+
+def run_workflow(workflow, devcom, devices, args):
+    if workflow == 'sysname':
+        main.devices_get_sysname(devcom, devices, print_result=False, check_enabled=False)
+    elif workflow == 'config':
+        main.devices_get_config(devcom, devices)
+    elif workflow == 'icmp':
+        set_icmp_targets(devices, args.ping_ips)
+        main.devices_check_icmp(devcom, devices)
+    elif workflow == 'stats':
+        run_stats(devcom, devices, args.stats_ips)
+
+
+def bench(count, args):
+    parent_conn, child_conn = multiprocessing.Pipe()
+    fleet = multiprocessing.Process(target=fake_routeros.run_fleet, args=(count, child_conn),
+                                    kwargs=dict(username=args.username, password=args.password,
+                                                latency=args.latency, handshake=args.handshake,
+                                                ping_delay=args.ping_delay, objects=args.objects),
+                                    daemon=True)
+    fleet.start()
+    ports = parent_conn.recv()
+    results = []
+    try:
+        devices = get_devices(ports, args.username, args.password)
+        with dc.DevicesCommander(devices) as devcom, open(os.devnull, 'w') as devnull:
+            for workflow in args.workflows:
+                if args.memory:
+                    tracemalloc.start()
+                with CommandTimer() as timer, contextlib.redirect_stdout(devnull):
+                    now = time.perf_counter()
+                    run_workflow(workflow, devcom, devices.device_list, args)
+                    makespan = time.perf_counter() - now
+                # пик выделений с начала сценария в МБ
+                peak_memory = tracemalloc.get_traced_memory()[1] / 2 ** 20 if args.memory else float('nan')
+                tracemalloc.stop()
+                results.append(dict(devices=count, workflow=workflow,
+                                    devices_s=count / makespan,
+                                    commands_s=len(timer.latencies) / makespan,
+                                    p50=timer.percentile(50) * 1000,
+                                    p99=timer.percentile(99) * 1000,
+                                    memory=peak_memory,
+                                    makespan=makespan,
+                                    commands=len(timer.latencies)))
+                print_result(results[-1])
+    finally:
+        parent_conn.send('stop')
+        fleet.join(timeout=30)
+    return results
+
+
+def print_header():
+    print(f'{"devices":>8} {"workflow":>8} {"devices/s":>10} {"commands/s":>11} {"p50, ms":>9} {"p99, ms":>9} '
+          f'{"memory, MB":>11} {"makespan, s":>12} {"commands":>9}')
+
+
+def print_result(res):
+    print(f'{res["devices"]:>8} {res["workflow"]:>8} {res["devices_s"]:>10.1f} {res["commands_s"]:>11.1f} '
+          f'{res["p50"]:>9.1f} {res["p99"]:>9.1f} {res["memory"]:>11.1f} {res["makespan"]:>12.2f} '
+          f'{res["commands"]:>9}')
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Benchmark DevicesCommander on a fake RouterOS fleet')
+    parser.add_argument('--devices', type=int, nargs='+', default=list(DEVICES))
+    parser.add_argument('--workflows', nargs='+', choices=WORKFLOWS, default=list(WORKFLOWS))
+    parser.add_argument('--latency', type=float, default=0.01, help='задержка ответа на команду, сек')
+    parser.add_argument('--handshake', type=float, default=0.05, help='задержка подключения, сек')
+    parser.add_argument('--ping-delay', type=float, default=0.005, help='время ping одного IP, сек')
+    parser.add_argument('--objects', type=int, default=200, help='кол-во EOIP/PPP на устройстве (размер вывода)')
+    parser.add_argument('--ping-ips', type=int, default=100, help='кол-во IP ip_free на устройство для icmp')
+    parser.add_argument('--stats-ips', type=int, default=100, help='кол-во IP на устройство для stats')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='без замера пиковой памяти tracemalloc (замер замедляет сценарии)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    os.makedirs('log', exist_ok=True)
+    raise_open_files_limit()
+    print_header()
+    for count in args.devices:
+        bench(count, args)
@@ -0,0 +1,87 @@
+"""
+Бенчмарк парсинга export compact (parse_config) на синтетических конфигурациях parse_config.export_generator.
+Только стандартная библиотека, запускается локально без устройств.
+
+Для каждого размера конфигурации выводит:
+    время MikrotikConfig (разбор ExportConfig + граф интерфейсов + IP), пик памяти (tracemalloc),
+    стоимость каждой секции: ExportConfig по тексту только этой секции и regex_example.parse_section
+    по всей конфигурации (старый разбор регулярными выражениями, для сравнения)
+
+    python bench_parse_config.py
+    python bench_parse_config.py --objects 1000 10000 --repeat 5 --no-legacy
+"""
+import argparse
+import time
+import tracemalloc
+
+from parse_config import regex_example
+from parse_config.export_generator import ExportGenerator, get_counts
+from parse_config.export_parser import ExportConfig
+from parse_config.parse_config import MikrotikConfig
+
+OBJECTS = (1000, 10000, 100000)
+
+# секция export compact -> поле regex_example.regex_section
+LEGACY_SECTIONS = {'interface bridge': 'interface_bridge',
+                   'interface eoip': 'interface_eoip',
+                   'interface vlan': 'interface_vlan',
+                   'interface bonding': 'interface_bonding',
+                   'interface bridge port': 'interface_bridge_port',
+                   'ip address': 'ip_address',
+                   'ppp secret': 'ppp_secret'}
+
+
+def timeit(func, repeat):
+    """Лучшее время из repeat запусков, сек"""
+    best = float('inf')
+    for _ in range(repeat):
+        now = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - now)
+    return best
+
+
+def get_peak_memory(func):
+    """Пик памяти, выделенной во время func, МБ"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def bench(objects, repeat, legacy):
+    generator = ExportGenerator(get_counts(objects))
+    sections = generator.get_sections()
+    config = generator.join(sections)
+    lines = sum(len(section_lines) for section_lines in sections.values())
+    parse_time = timeit(lambda: MikrotikConfig(config), repeat)
+    peak_memory = get_peak_memory(lambda: MikrotikConfig(config))
+    print(f'\n{objects} objects, {lines} lines, {len(config) / 2 ** 20:.1f} MB: '
+          f'MikrotikConfig {parse_time * 1000:.1f} ms, {lines / parse_time:.0f} lines/s, '
+          f'peak memory {peak_memory:.1f} MB')
+    print(f'{"section":>24} {"objects":>8} {"ExportConfig, ms":>17} {"us/object":>10} {"regex_example, ms":>18}')
+    for section, section_lines in sections.items():
+        section_config = generator.join({section: section_lines})
+        section_time = timeit(lambda: ExportConfig(section_config), repeat)
+        legacy_time = ''
+        if legacy:
+            regex_section = getattr(regex_example.regex_section, LEGACY_SECTIONS[section])
+            legacy_time = f'{timeit(lambda: regex_example.parse_section(regex_section, config), repeat) * 1000:.1f}'
+        print(f'{section:>24} {len(section_lines):>8} {section_time * 1000:>17.1f} '
+              f'{section_time * 10 ** 6 / len(section_lines):>10.2f} {legacy_time:>18}')
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Benchmark parse_config on synthetic export compact')
+    parser.add_argument('--objects', type=int, nargs='+', default=list(OBJECTS))
+    parser.add_argument('--repeat', type=int, default=3, help='кол-во запусков, берется лучшее время')
+    parser.add_argument('--no-legacy', action='store_true', help='не замерять regex_example.parse_section')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    for objects in args.objects:
+        bench(objects, args.repeat, not args.no_legacy)
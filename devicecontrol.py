@@ -1,20 +1,34 @@
-import os, re, logging, asyncio, json, yaml
+import os, re, logging, asyncio, yaml
 
 from datetime import date, datetime
+from heapq import heappush, heappop
+from itertools import count
 import time
+from collections import deque, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from threading import Lock
 from typing import List, Coroutine
 
-import pandas
 from numpy import where
 from scrapli.exceptions import ScrapliException
 from scrapli import AsyncScrapli
 
+import reports
+import routeros_api
+import routeros_output
 import tools
-from parse_config.parse_config import MikrotikConfig, GeneralParam
+from export_archive import ExportArchive, ArchivedExport
+from icmp_history import IcmpHistory, ICMP_RECEIVED_MIN, get_icmp_text
+from parse_config.parse_config import MikrotikConfig, MikrotikParseResult, GeneralParam, parse_config_result
 
 SLEEP = 0.1
 TIME_OUT = 50
+GLOBAL_LIMIT = 200  # максимальное кол-во одновременно выполняемых корутин на всех устройствах
+DEVICE_LIMIT = 4  # максимальное кол-во одновременно выполняемых корутин (SSH сессий) на одном устройстве
+SESSION_IDLE_MAX = DEVICE_LIMIT  # максимальное кол-во простаивающих сессий в пуле на одно устройство
+SESSION_IDLE_TIMEOUT = 300  # сек, после которых простаивающая сессия не переиспользуется, а закрывается
+API_TRANSPORTS = ('api', 'api-ssl')  # transport в инвентаре для команд чтения через RouterOS API
+MAX_COMMAND_LENGTH = 2000  # максимальная длина одной команды CLI при объединении многих элементов в одну команду
 
 
 class SingletonMeta(type):
@@ -91,7 +105,120 @@ class Logger(metaclass=SingletonMeta):
         return logger
 
 
+class SessionPool(metaclass=SingletonMeta):
+    """
+    Пул открытых сессий, общий для всех DeviceManagement.
+    Сессии хранятся по ключу устройства и переиспользуются между фазами и вызовами DevicesCommander.run(),
+    вместо открытия нового SSH соединения на каждую команду.
+    """
+
+    def __init__(self):
+        self._idle = dict()  # {key: [(session, loop, released_at), ...]}
+        self._prompts = dict()  # {session: prompt} - prompt сессии, полученный при первом обращении
+        self._api = dict()  # {key: (task открытия RouterOsApi, loop)} - одно API соединение на устройство
+        self.opened = 0
+        self.reused = 0
+
+    @staticmethod
+    def get_key(device):
+        return device.ip, device.connect_param.get('port')
+
+    def acquire(self, device):
+        """
+        Возвращает живую простаивающую сессию устройства или None, если её нет.
+        Сессии, открытые в другом event loop или простаивающие дольше SESSION_IDLE_TIMEOUT, отбрасываются.
+        """
+        loop = asyncio.get_running_loop()
+        idle = self._idle.get(self.get_key(device), [])
+        while idle:
+            session, session_loop, released_at = idle.pop()
+            if session_loop is loop and session.isalive() and time.time() - released_at < SESSION_IDLE_TIMEOUT:
+                self.reused += 1
+                return session
+            self.discard(session)
+        return None
+
+    async def release(self, device, session, broken=False):
+        """
+        Возвращает сессию в пул. Сломанные, мертвые и лишние сессии закрываются.
+        """
+        idle = self._idle.setdefault(self.get_key(device), [])
+        if not broken and session.isalive() and len(idle) < SESSION_IDLE_MAX:
+            idle.append((session, asyncio.get_running_loop(), time.time()))
+        else:
+            self.discard(session)
+            if session.isalive():
+                await session.close()
+
+    def discard(self, session):
+        self._prompts.pop(session, None)
+
+    async def get_prompt(self, session):
+        prompt = self._prompts.get(session)
+        if prompt is None:
+            prompt = await session.get_prompt()
+            self._prompts[session] = prompt
+        return prompt
+
+    @staticmethod
+    def is_api_alive(task):
+        return task.done() and not task.cancelled() and task.exception() is None and task.result().isalive()
+
+    async def open_api(self, device):
+        param = device.connect_param
+        api = routeros_api.RouterOsApi(device.ip, device.api_port, use_ssl=device.api_transport == 'api-ssl',
+                                       timeout=param.get('timeout_socket', TIME_OUT))
+        try:
+            await api.open(param['auth_username'], param['auth_password'])
+        except BaseException:
+            await api.close()
+            raise
+        self.opened += 1
+        return api
+
+    async def get_api(self, device):
+        """
+        API соединение устройства в текущем event loop. Соединение одно на устройство,
+        запросы всех корутин выполняются на нем параллельно (по .tag). Ошибка открытия передается всем ожидающим,
+        следующий вызов открывает соединение заново
+        """
+        loop = asyncio.get_running_loop()
+        key = self.get_key(device)
+        task, api_loop = self._api.get(key, (None, None))
+        if task is None or api_loop is not loop or (task.done() and not self.is_api_alive(task)):
+            task = loop.create_task(self.open_api(device))
+            self._api[key] = (task, loop)
+        elif task.done():
+            self.reused += 1
+        return await asyncio.shield(task)
+
+    async def close_all(self):
+        """
+        Закрывает все простаивающие сессии и API соединения текущего event loop
+        """
+        loop = asyncio.get_running_loop()
+        api_list, self._api = self._api, dict()
+        for task, api_loop in api_list.values():
+            if api_loop is not loop:
+                continue
+            if self.is_api_alive(task):
+                await task.result().close()
+            elif not task.done():
+                task.cancel()
+        idle_list, self._idle = self._idle, dict()
+        for idle in idle_list.values():
+            for session, session_loop, _ in idle:
+                self.discard(session)
+                if session_loop is loop and session.isalive():
+                    try:
+                        await session.close()
+                    except (ScrapliException, OSError) as err:
+                        Logger().error.error(f'! Close pooled session error {session.host} - {err}')
+
+
 class Devices:
+    # индексы устройств: поле поиска -> атрибут Device. name - имя из инвентаря (get_sysname меняет Device.name)
+    INDEX_FIELDS = {'ip': 'ip', 'id': 'id', 'name': 'zubbix_name', 'city': 'city'}
     config_example = dict()
     config_example['host'] = ''
     config_example['auth_username'] = ''
@@ -105,10 +232,15 @@ class Devices:
     def __init__(self):
         self.device_list: List[Device] = []
         self.dir_export_compact = 'export_compact'
+        self.export_archive = ExportArchive(self.dir_export_compact)  # отпечатки для get_config(archive=...)
+        self._index = {field: defaultdict(list) for field in self.INDEX_FIELDS}  # {field: {value: [Device]}}
+        self._indexed = 0  # кол-во устройств device_list в индексах
         self.dir_tu = 'tu'
         self.dir_output_parse = 'output_parse'
         self.dir_output_icmp_ip_free = 'output_icmp_ip_free'
         self.dir_output_icmp_ip_in_tu = 'output_icmp_ip_in_tu'
+        self.file_icmp_history = 'icmp_history.sqlite'  # история ICMP по дням, см. icmp_history
+        self.report_format = 'xlsx'  # формат сводных отчетов: xlsx | csv | parquet | sqlite, см. reports
         self.logger = Logger()
 
     def load_from_yaml(self, filename):
@@ -120,55 +252,140 @@ class Devices:
         for config in config_yaml:
             dev = Device(config)
             dev.ip = config['host']
-            self.device_list.append(dev)
+            self.add_device(dev)
             # self.logger.root.setLevel(logging.INFO)
-            self.logger.tu.info(f'load_from_yaml: ip={dev.ip}, transport={config["transport"]}')
-
-    def load_from_excel(self, filename):
-        """
-        Заполняет device_list на основе данных в Excel файле
-        """
-        data = pandas.read_excel(filename)
-        for node in data.iloc:
-            config = self.config_example.copy()
-            config['host'] = node['IP_DEVICE']
-            config['auth_username'] = node['LOGIN']
-            config['auth_password'] = node['PASSWORD']
-            dev = Device(connect_param=config.copy(),
-                         city=node['Город'],
-                         name=node['NAME_DEVICE'],
-                         id=str(node['ID']))
-            if ('run' in node) and (str(node['run']).lower() == 'false'):
+            self.logger.tu.info(f'load_from_yaml: ip={dev.ip}, transport={dev.api_transport or config["transport"]}')
+
+    def load_from_excel(self, filename, cache_dir=tools.DIR_CACHE):
+        """
+        Заполняет device_list на основе данных в Excel файле.
+        Разобранный файл кэшируется в cache_dir (см. tools.read_excel_columns), cache_dir='' - без кэша
+        """
+        columns = tools.read_excel_columns(filename, cache_dir)
+        count = len(columns['IP_DEVICE'])
+        transports = columns.get('TRANSPORT', [None] * count)
+        runs = columns.get('run', [None] * count)
+        errors = columns.get('error', [None] * count)
+        for host, username, password, transport, city, name, id, run, error in zip(
+                columns['IP_DEVICE'], columns['LOGIN'], columns['PASSWORD'], transports,
+                columns['Город'], columns['NAME_DEVICE'], columns['ID'], runs, errors):
+            config = dict(self.config_example, host=host, auth_username=username, auth_password=password)
+            if str(transport) in API_TRANSPORTS:
+                config['transport'] = transport
+            dev = Device(connect_param=config, city=city, name=name, id=str(id))
+            if str(run).lower() == 'false':
                 dev.enabled = False
-                if ('error' in node):
-                    dev.connect_error = node['error']
+                if 'error' in columns:
+                    dev.connect_error = error
             self.device_list.append(dev)
-            # self.logger.root.setLevel(logging.INFO)
-            self.logger.tu.info(f'load_from_excel: {dev.city} {dev.ip} ({node["NAME_DEVICE"]}) ,'
-                                f' transport={config["transport"]}')
+        self.update_index()
+        api_count = sum(str(transport) in API_TRANSPORTS for transport in transports)
+        self.logger.tu.info(f'load_from_excel: {filename} - {count} devices, {api_count} via RouterOS API')
+
+    def add_device(self, device):
+        self.device_list.append(device)
+        self.update_index()
+
+    def update_index(self):
+        """
+        Добавляет в индексы устройства, добавленные в device_list после последней индексации.
+        Если device_list уменьшился - индексы строятся заново
+        """
+        if self._indexed > len(self.device_list):
+            self._index = {field: defaultdict(list) for field in self.INDEX_FIELDS}
+            self._indexed = 0
+        for device in self.device_list[self._indexed:]:
+            for field, attr in self.INDEX_FIELDS.items():
+                self._index[field][getattr(device, attr)].append(device)
+        self._indexed = len(self.device_list)
+
+    def find_devices(self, field, value):
+        """
+        Список устройств с field == value, field - ключ INDEX_FIELDS
+        :return: List[Device]
+        """
+        self.update_index()
+        return list(self._index[field].get(value, []))
 
     def find_devices_by_ip(self, ip):
         """
         Возвращает список device из device_list с ip address == ip
         :return: List[Device]
         """
-        # device_list = []
-        # for device in self.device_list:
-        #     if device.ip == ip:
-        #         device_list.append(device)
-        device_list = [device for device in self.device_list if device.ip == ip]
+        return self.find_devices('ip', ip)
+
+    def find_devices_by_ips(self, ip_list):
+        """
+        Устройства для всех ip из ip_list, без повторов, в порядке ip_list
+        :return: List[Device]
+        """
+        device_list = []
+        for ip in dict.fromkeys(ip_list):
+            device_list += self.find_devices('ip', ip)
         return device_list
 
-    def load_export_compact_from_files(self, dir_='', date_=''):
+    def find_device_by_id(self, id):
+        devices = self.find_devices('id', str(id))
+        return devices[0] if devices else None
+
+    def find_devices_by_name(self, name):
+        return self.find_devices('name', name)
+
+    def find_devices_by_city(self, city):
+        return self.find_devices('city', city)
+
+    def select(self, devices=None, city=None, enabled=None, has_config=None, has_parse_result=None):
+        """
+        Устройства devices (по-умолчанию все из device_list), удовлетворяющие всем заданным условиям:
+        city - город, enabled - доступность, has_config - есть export compact, has_parse_result - есть mikroconfig
+        :return: List[Device]
         """
-        DONE Метод загружает конфигурацию каждого устройства из отдельного файла в выделенном каталоге dir
+        if devices is None:
+            devices = self.find_devices_by_city(city) if city is not None else self.device_list
+        elif city is not None:
+            devices = [device for device in devices if device.city == city]
+        return [device for device in devices
+                if (enabled is None or device.enabled == enabled)
+                and (has_config is None or device.has_export_compact() == has_config)
+                and (has_parse_result is None or (device.mikroconfig is not None) == has_parse_result)]
+
+    def load_export_compact_from_files(self, dir_='', date_='', lazy=False):
+        """
+        DONE Метод загружает конфигурацию каждого устройства из архива export_archive (снимок на дату date_,
+        по-умолчанию последний) в каталоге dir. Если снимка нет - из отдельных файлов каталога dir/date_ (старый формат)
+        lazy - не читать конфигурации, а только сослаться на них в архиве (Device.export_handle)
         """
         self.logger.root.info(f'Load "export compact" from files...')
         print(time.strftime("%H:%M:%S"), 'Load "export compact" from files...')
         if not dir_:
             dir_ = self.dir_export_compact
-        if date_:
-            dir_ = os.path.join(dir_, date_)
+        archive = self.export_archive if dir_ == self.export_archive.dir else ExportArchive(dir_)
+        dates = archive.get_dates()
+        if date_ in dates or (not date_ and dates):
+            # снимки до перехода на ключ host:port - по IP устройства
+            keys = [key for dev in self.device_list for key in (dev.key, dev.ip)]
+            if lazy:
+                handles = archive.load_handles(date_ or None, keys)
+                for dev in self.device_list:
+                    dev.set_export_handle(handles.get(dev.key, handles.get(dev.ip)))
+            else:
+                snapshot = archive.load_snapshot(date_ or None, keys)
+                for dev in self.device_list:
+                    dev.export_compact = snapshot.get(dev.key, snapshot.get(dev.ip, ''))
+            for dev in self.device_list:
+                if dev.has_export_compact():
+                    self.logger.export_compact.info(f'device with ip:{dev.ip} load config from archive {dir_}')
+                else:
+                    self.logger.export_compact.warning(f'device with ip:{dev.ip} don''t have config in archive {dir_}')
+        else:
+            self.load_export_compact_from_text_files(os.path.join(dir_, date_) if date_ else dir_)
+        self.logger.root.info(f'Load "export compact" success.')
+        print(time.strftime("%H:%M:%S"), 'Load "export compact" success.')
+
+    def load_export_compact_from_text_files(self, dir_):
+        """
+        Загрузка конфигураций из отдельных текстовых файлов каталога dir (до перехода на export_archive)
+        """
         if os.path.exists(dir_):
             for dev in self.device_list:
                 filename = tools.get_file_name(dev.city + '_' + dev.name, suffix=self.dir_export_compact, dir=dir_)
@@ -183,27 +400,37 @@ class Devices:
                     self.logger.export_compact.warning(f'Could not load config from "{filename}". File does not exist.')
         else:
             self.logger.error.error(f'! Dir "{dir_}" does not exist. Call method: "load_export_compact_from_files"')
-        self.logger.root.info(f'Load "export compact" success.')
-        print(time.strftime("%H:%M:%S"), 'Load "export compact" success.')
 
-    def save_export_compact_to_files(self, dir_=''):
+    def save_export_compact_to_files(self, dir_='', date_=''):
         """
-        Метод сохраняет конфигурации каждого устройства в отдельный файл в выделенном каталоге dir
+        Метод сохраняет конфигурации устройств в архив export_archive в каталоге dir:
+        каждая уникальная конфигурация - один сжатый объект, + снимок на дату date_ (по-умолчанию сегодня)
         """
         self.logger.root.info(f'Save "export compact" to files...')
         print(time.strftime("%H:%M:%S"), 'Save "export compact" to files...')
         if not dir_:
-            dir_ = os.path.join(self.dir_export_compact, str(date.today()))
-        if not os.path.exists(dir_):
-            os.mkdir(dir_)
+            dir_ = self.dir_export_compact
+        if not date_:
+            date_ = str(date.today())
+        archive = self.export_archive if dir_ == self.export_archive.dir else ExportArchive(dir_)
+        manifest = dict()
         for dev in self.device_list:
-            if dev.export_compact:
-                filename = tools.get_file_name(dev.city + '_' + dev.name, suffix=self.dir_export_compact, dir=dir_)
-                with open(filename, 'wt') as file:
-                    file.write(dev.export_compact)
-                self.logger.export_compact.info(f'device with ip:{dev.ip} save config to {filename}')
+            if dev.export_handle is not None and \
+                    dev.export_handle.filename == archive.get_object_name(dev.export_handle.hash):
+                hash_ = dev.export_handle.hash  # загружена потоком в этот же архив
+            elif dev.has_export_compact():
+                hash_ = archive.put(dev.export_compact)
+            else:
+                hash_ = None
+            if hash_ is not None:
+                manifest[dev.key] = dict(hash=hash_, city=dev.city, name=dev.name)
+                if dev.config_fingerprint is not None:
+                    archive.update(dev.key, hash_, *dev.config_fingerprint)
+                self.logger.export_compact.info(f'device with ip:{dev.ip} save config to {dir_}, hash {hash_}')
             else:
                 self.logger.export_compact.warning(f'device with ip:{dev.ip} don''t have config')
+        archive.save_manifest(date_, manifest)
+        archive.save()
         self.logger.root.info(f'Save "export compact" success.')
         print(time.strftime("%H:%M:%S"), 'Save "export compact" success.')
 
@@ -223,11 +450,11 @@ class Devices:
             if dev.mikroconfig is not None:
                 general_param = GeneralParam(dev.mikroconfig)
                 output_msg, text_for_output_in_file = general_param.get_output_info()
-                dev.result_parsing = output_msg % (dev.name, dev.ip, dev.city) + text_for_output_in_file
-                if dev.result_parsing:
+                result_parsing = output_msg % (dev.name, dev.ip, dev.city) + text_for_output_in_file
+                if result_parsing:
                     filename = tools.get_file_name(dev.city + '_' + dev.name, suffix=self.dir_output_parse, dir=dir_)
                     with open(filename, 'wt') as file:
-                        file.write(dev.result_parsing)
+                        file.write(result_parsing)
                     self.logger.output_parse.info(f'device with ip:{dev.ip} save result parse config to {filename}')
                     summary.append(dev.get_summary_parse_result())
                 else:
@@ -235,17 +462,15 @@ class Devices:
             else:
                 summary.append(dev.get_summary_parse_result())
         file_name = 'summary_' + str(date.today())
-        file_summary = tools.get_file_name(file_name, suffix=self.dir_output_parse, dir=dir_, ext='xlsx')
+        file_summary = tools.get_file_name(file_name, suffix=self.dir_output_parse, dir=dir_, ext=self.report_format)
         ind = 0
         while os.path.exists(file_summary):
             ind += 1
             file_name_new = file_name + f'({str(ind)})'
-            file_summary = tools.get_file_name(file_name_new, suffix=self.dir_output_parse, dir=dir_, ext='xlsx')
+            file_summary = tools.get_file_name(file_name_new, suffix=self.dir_output_parse, dir=dir_,
+                                               ext=self.report_format)
         try:
-            summary_json = json.dumps(summary)
-            summary_data_frame = pandas.read_json(summary_json)
-            summary_data_frame.to_excel(file_summary, index=0)
-            # pandas.read_json(json.dumps(summary)).sort_values('City').to_excel(file_summary)
+            reports.write_records(file_summary, summary)
         except Exception as err:
             msg = f'! Error save file summary {file_summary} with parse result: {err}'
             print(msg)
@@ -253,112 +478,179 @@ class Devices:
         self.logger.root.info(f'Save parse config success.')
         print(time.strftime("%H:%M:%S"), 'Save parse config success.')
 
-    def parse_config(self):
+    def parse_config(self, processes=1):
+        """
+        processes - кол-во процессов для параллельного парсинга, None - по кол-ву ядер.
+        При параллельном парсинге из процессов возвращается только MikrotikParseResult, без текста конфигурации
+        """
         self.logger.root.info(f'Parse config...')
         print(time.strftime("%H:%M:%S"), 'Parse config...')
-        for dev in self.device_list:
-            if dev.export_compact:
-                file_tu = tools.get_file_name(dev.city, suffix=self.dir_tu, dir=self.dir_tu)
-                if not os.path.exists(file_tu):
-                    self.logger.tu.warning(f'! File with IP from TU {file_tu} not exists')
-                    file_tu = ''
-                dev.mikroconfig = MikrotikConfig(dev.export_compact, file_tu, dev.ip_ppp_active)
-                # general_param = GeneralParam(dev.mikroconfig)
-                #
-                # output_msg, text_for_output_in_file = general_param.get_output_info()
-                # dev.result_parsing = output_msg % (dev.name, dev.ip, dev.city) + text_for_output_in_file
+        if processes == 1:
+            for dev in self.device_list:
+                self.parse_device_config(dev)
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = {executor.submit(parse_config_result, *self.get_parse_args(dev, lazy=True)): dev
+                           for dev in self.select(has_config=True)}
+                for future in as_completed(futures):
+                    dev = futures[future]
+                    try:
+                        dev.mikroconfig = future.result()
+                    except Exception as err:
+                        msg = f'! Error parse config {dev.city} {dev.ip} ({dev.name}): {err!r}'
+                        print(msg)
+                        self.logger.error.error(msg)
         self.logger.root.info(f'Parse config success.')
         print(time.strftime("%H:%M:%S"), 'Parse config success.')
 
-    def save_icmp_result_to_files(self, type_ip_list):
-        self.logger.root.info(f'Save ICMP {type_ip_list} result to files...')
-        print(time.strftime("%H:%M:%S"), f'Save ICMP {type_ip_list} result to files...')
-        if not os.path.exists(self.dir_output_icmp_ip_free):
-            os.mkdir(self.dir_output_icmp_ip_free)
-        if not os.path.exists(self.dir_output_icmp_ip_in_tu):
-            os.mkdir(self.dir_output_icmp_ip_in_tu)
+    def get_parse_args(self, dev, lazy=False):
+        """
+        Аргументы для MikrotikConfig / parse_config_result одного устройства.
+        lazy - для parse_config_result вместо текста передается export_handle, текст читается в процессе парсинга
+        """
+        file_tu = tools.get_file_name(dev.city, suffix=self.dir_tu, dir=self.dir_tu)
+        if not os.path.exists(file_tu):
+            self.logger.tu.warning(f'! File with IP from TU {file_tu} not exists')
+            file_tu = ''
+        config = dev.export_handle if lazy and dev.export_handle is not None else dev.export_compact
+        return config, file_tu, dev.ip_ppp_active
+
+    def parse_device_config(self, dev):
+        """
+        Парсинг конфигурации одного устройства
+        """
+        if dev.has_export_compact():
+            dev.mikroconfig = MikrotikConfig(*self.get_parse_args(dev)).get_result()
+            # general_param = GeneralParam(dev.mikroconfig)
+            #
+            # output_msg, text_for_output_in_file = general_param.get_output_info()
+            # dev.result_parsing = output_msg % (dev.name, dev.ip, dev.city) + text_for_output_in_file
+
+    def get_dir_output_icmp(self, type_ip_list):
+        if type_ip_list == 'ip_free':
+            return self.dir_output_icmp_ip_free
+        elif type_ip_list == 'ip_in_tu':
+            return self.dir_output_icmp_ip_in_tu
+        return ''
+
+    def save_icmp_result_to_files(self, type_ip_list, date_=''):
+        """
+        Дописывает результаты ICMP за дату date_ (по-умолчанию сегодня) в историю file_icmp_history,
+        прежние дни не перечитываются и не перезаписываются. Отчеты по устройствам - save_icmp_history_to_files
+        """
+        self.logger.root.info(f'Save ICMP {type_ip_list} result to history...')
+        print(time.strftime("%H:%M:%S"), f'Save ICMP {type_ip_list} result to {self.file_icmp_history}...')
+        date_ = date_ or str(date.today())
+        rows = []
         for device in self.device_list:
-            ip_result = ''
-            dir_output = ''
-            if type_ip_list == 'ip_free':
-                ip_result = device.icmp_ip_free_result
-                dir_output = self.dir_output_icmp_ip_free
-            elif type_ip_list == 'ip_in_tu':
-                ip_result = device.icmp_ip_in_tu_result
-                dir_output = self.dir_output_icmp_ip_in_tu
-            if ip_result and dir_output:
-                file_icmp = tools.get_file_name(device.city + '_' + device.name, suffix=dir_output,
-                                                dir=dir_output, ext='xlsx')
-                new_file_icmp = tools.get_file_name(device.city + '_' + device.zubbix_name, suffix=dir_output,
-                                                    dir=dir_output + '_new', ext='xlsx')
-                res_json = json.dumps({str(date.today()): ip_result})
-                new_data = pandas.read_json(res_json)
-                if os.path.exists(file_icmp):
-                    old_data = pandas.read_excel(file_icmp, index_col=0)
-                    data = old_data.merge(new_data, left_index=True, right_index=True, how='outer')
-                else:
-                    data = new_data
-                try:
-                    # data.to_excel(file_icmp)
+            if device.has_results():
+                icmp = device.results.get_icmp(type_ip_list)
+                rows += ((device.city, device.zubbix_name, device.ip, ip, sent, received)
+                         for ip, (sent, received) in icmp.items())
+        try:
+            with IcmpHistory(self.file_icmp_history) as history:
+                rows_count = history.append(type_ip_list, date_, rows)
+            print(time.strftime("%H:%M:%S"), f'save {rows_count} rows to {self.file_icmp_history}')
+        except Exception as err:
+            msg = f'! Error save ICMP result to {self.file_icmp_history}. Call method: "save_icmp_result_to_files"\n' \
+                  f'{err}'
+            print(msg)
+            self.logger.error.error(msg)
+        self.logger.root.info(f'Save ICMP result success.')
+        print(time.strftime("%H:%M:%S"), f'Save ICMP {type_ip_list} result success.')
 
-                    data['City'] = device.city
-                    data['CMikroTik Name'] = device.zubbix_name
-                    data['CMikroTik IP'] = device.ip
-                    data.to_excel(new_file_icmp)
+    def save_icmp_history_to_files(self, type_ip_list):
+        """
+        Отчеты истории ICMP по устройствам из file_icmp_history: строка - IP, столбец - дата,
+        в каталог <dir_output_icmp>_new в формате report_format
+        """
+        self.logger.root.info(f'Save ICMP {type_ip_list} history to files...')
+        print(time.strftime("%H:%M:%S"), f'Save ICMP {type_ip_list} history to files...')
+        dir_output = self.get_dir_output_icmp(type_ip_list)
+        with IcmpHistory(self.file_icmp_history) as history:
+            for device in self.device_list:
+                ip_history = history.get_device_history(type_ip_list, device.ip)
+                if not ip_history:
+                    continue
+                file_icmp = tools.get_file_name(device.city + '_' + device.zubbix_name, suffix=dir_output,
+                                                dir=dir_output + '_new', ext=self.report_format)
+                dates = sorted({date_ for results in ip_history.values() for date_ in results})
+                columns = ['IP', *dates, 'City', 'CMikroTik Name', 'CMikroTik IP']
+                try:
+                    with reports.ReportWriter(file_icmp, columns) as report:
+                        report.write_rows((ip, *(results.get(date_) for date_ in dates),
+                                           device.city, device.zubbix_name, device.ip)
+                                          for ip, results in ip_history.items())
                     print(time.strftime("%H:%M:%S"), f'save file {file_icmp}')
                 except Exception as err:
-                    msg = f'! Error save file {file_icmp} with icmp result. Call method: "save_icmp_result2files"\n' \
-                          f'{err}'
+                    msg = f'! Error save file {file_icmp} with icmp history. Call method: "save_icmp_history_to_files"' \
+                          f'\n{err}'
                     print(msg)
                     self.logger.error.error(msg)
-        self.logger.root.info(f'Save ICMP result success.')
-        print(time.strftime("%H:%M:%S"), f'Save ICMP {type_ip_list} result success.')
+        self.logger.root.info(f'Save ICMP history success.')
+        print(time.strftime("%H:%M:%S"), f'Save ICMP {type_ip_list} history success.')
 
     def save_summary_icmp_result(self, type_ip_list):
         self.logger.root.info(f'Save summary ICMP {type_ip_list} result to files...')
         print(time.strftime("%H:%M:%S"), f'Save summary ICMP {type_ip_list} result to files...')
-        dir_output = ''
-        if type_ip_list == 'ip_free':
-            dir_output = self.dir_output_icmp_ip_free
-        elif type_ip_list == 'ip_in_tu':
-            dir_output = self.dir_output_icmp_ip_in_tu
+        dir_output = self.get_dir_output_icmp(type_ip_list)
         if not os.path.exists(dir_output):
             os.mkdir(dir_output)
-        file_summary_icmp = os.path.join(dir_output, 'summary_' + type_ip_list + '.xlsx')
-        if os.path.exists(file_summary_icmp):
-            os.remove(file_summary_icmp)
-        data = None
-        for device in self.device_list:
-            ip_result = ''
-            if type_ip_list == 'ip_free':
-                ip_result = device.icmp_ip_free_result
-            elif type_ip_list == 'ip_in_tu':
-                ip_result = device.icmp_ip_in_tu_result
-            if ip_result and dir_output:
-                # Город	Name MikroTik	IP MikroTik	remote IP	ICMP
-                res_json = json.dumps({'City': device.city,
-                                       'CMikroTik Name': device.zubbix_name,
-                                       'CMikroTik IP': device.ip,
-                                       'ICMP remote CPE': ip_result
-                                       })
-                new_data = pandas.read_json(res_json)
-                if data is None:
-                    data = new_data
-                else:
-                    data = pandas.concat([data, new_data])
-                try:
-                    data.to_excel(file_summary_icmp)
-                    print(time.strftime("%H:%M:%S"), f'save file {file_summary_icmp}')
-                except Exception as err:
-                    msg = f'! Error save file {file_summary_icmp} with summary icmp result.Call:"save_summary_icmp_result"\n' \
-                          f'{err}'
-                    print(msg)
-                    self.logger.error.error(msg)
+        file_summary_icmp = os.path.join(dir_output, f'summary_{type_ip_list}.{self.report_format}')
+        # remote IP	Город	Name MikroTik	IP MikroTik	ICMP - все устройства одним проходом, файл пишется один раз
+        columns = ['IP remote CPE', 'City', 'CMikroTik Name', 'CMikroTik IP', 'ICMP remote CPE']
+        try:
+            with reports.ReportWriter(file_summary_icmp, columns) as report:
+                for device in self.device_list:
+                    if device.has_results():
+                        report.write_rows((ip, device.city, device.zubbix_name, device.ip, result)
+                                          for ip, result in device.results.get_icmp_result(type_ip_list).items())
+            print(time.strftime("%H:%M:%S"), f'save file {file_summary_icmp}, {report.rows} rows')
+        except Exception as err:
+            msg = f'! Error save file {file_summary_icmp} with summary icmp result.Call:"save_summary_icmp_result"\n' \
+                  f'{err}'
+            print(msg)
+            self.logger.error.error(msg)
         self.logger.root.info(f'Save summary ICMP result success.')
         print(time.strftime("%H:%M:%S"), f'Save summary ICMP {type_ip_list} result success.')
 
 
+class DeviceResults:
+    """
+    Результаты опроса устройства для отчетов. Создаются при первом обращении к Device.results,
+    освобождаются Device.clear_results() после сохранения отчетов
+    """
+    __slots__ = ('icmp_ip_free', 'icmp_ip_in_tu', 'ip_stats', 'all_ip_with_mask_30')
+
+    def __init__(self):
+        self.icmp_ip_free = dict()  # {ip: (sent, received)}
+        self.icmp_ip_in_tu = dict()  # {ip: (sent, received)}
+        self.ip_stats = dict()  # {ip: {'tx-byte': 0, 'rx-byte': 0, 'disabled': False}}
+        self.all_ip_with_mask_30 = None  # [(ip, interface)]
+
+    def get_icmp(self, type_ip_list):
+        """
+        type_ip_list = [ 'ip_free' | 'ip_in_tu' ] -> {ip: (sent, received)}
+        """
+        return self.icmp_ip_free if type_ip_list == 'ip_free' else self.icmp_ip_in_tu
+
+    def get_icmp_result(self, type_ip_list):
+        """
+        type_ip_list = [ 'ip_free' | 'ip_in_tu' ] -> {ip: текст результата для отчета}
+        """
+        return {ip: get_icmp_text(sent, received) for ip, (sent, received) in self.get_icmp(type_ip_list).items()}
+
+
 class Device:
+    """
+    Параметры и состояние одного устройства. Текст конфигурации - в export_compact (в т.ч. лениво из архива),
+    результаты опроса - в results, результат парсинга - MikrotikParseResult без текста конфигурации
+    """
+    __slots__ = ('connect_error', 'connect_param', 'city', 'name', 'zubbix_name', 'id', 'board_name', 'version',
+                 'serial', 'uptime', 'enabled', 'ip', '_export_compact', 'export_handle', 'config_fingerprint',
+                 'ip_ppp_active', 'mikroconfig', 'count_interface', 'count_interface_active',
+                 'count_interface_disabled', 'count_ppp_active', 'logger', '_results', 'probe_latency',
+                 'api_transport', 'api_port')
     count = -1
 
     # def __new__(cls, *args, **kwargs):
@@ -376,22 +668,65 @@ class Device:
         self.version = ''
         self.serial = ''
         self.uptime = ''
-        self.false_icmp_list = []
         self.enabled = True
         self.ip = connect_param['host']
-        self.result_parsing = ''
-        self.icmp_ip_free_result = dict()
-        self.icmp_ip_in_tu_result = dict()
-        self.ip_stats = dict()  # {ip: {'tx-byte': 0, 'rx-byte': 0, 'disabled': False}}
-        self.export_compact = ''
+        self._export_compact = ''
+        self.export_handle: ArchivedExport = None  # конфигурация в архиве, вместо текста в памяти
+        self.config_fingerprint = None  # (fingerprint, uptime, дата загрузки) из get_config(archive=...)
         self.ip_ppp_active = set()
-        self.mikroconfig: MikrotikConfig = None
+        self.mikroconfig: MikrotikParseResult = None
         self.count_interface = -1
         self.count_interface_active = -1
         self.count_interface_disabled = -1
         self.count_ppp_active = -1
         self.logger = Logger()
-        self.all_ip_with_mask_30 = None
+        self._results: DeviceResults = None
+        self.probe_latency = None  # сек на один IP при проверке ICMP или получении статистики, см. DeviceWorkQueue
+        # 'api' | 'api-ssl' - команды чтения через RouterOS API, export и скрипты через SSH (connect_param)
+        self.api_transport = ''
+        self.api_port = connect_param.pop('api_port', None)
+        if connect_param.get('transport') in API_TRANSPORTS:
+            self.api_transport = connect_param['transport']
+            connect_param['transport'] = Devices.config_example['transport']
+
+    @property
+    def results(self):
+        if self._results is None:
+            self._results = DeviceResults()
+        return self._results
+
+    def has_results(self):
+        return self._results is not None
+
+    def clear_results(self):
+        self._results = None
+
+    @property
+    def key(self):
+        """Ключ устройства: host:port - на одном IP могут быть разные устройства (проброс портов)"""
+        return f'{self.ip}:{self.connect_param.get("port", 22)}'
+
+    @property
+    def export_compact(self):
+        """
+        Текст конфигурации. Если конфигурация в архиве (export_handle) - читается из архива при каждом обращении
+        """
+        if self.export_handle is not None:
+            return self.export_handle.read()
+        return self._export_compact
+
+    @export_compact.setter
+    def export_compact(self, text):
+        self._export_compact = text
+        self.export_handle = None
+
+    def set_export_handle(self, handle: ArchivedExport):
+        self._export_compact = ''
+        self.export_handle = handle
+
+    def has_export_compact(self):
+        """Есть ли конфигурация, без чтения её из архива"""
+        return self.export_handle is not None or bool(self._export_compact)
 
     def get_summary_parse_result(self):
         res = dict()
@@ -430,18 +765,30 @@ class DeviceManagement:
     Класс отвечает за асинхронное выполнение команд на одном устройстве
     """
 
+    # все EOIP устройства одной командой, каждая запись выводится строкой "key=value;key=value"
+    GET_ALL_EOIP_REMOTE = ':foreach r in=[/interface eoip print as-value proplist=name,remote-address] do={:put $r}'
+    # команды RouterOS API: (command, attrs, queries)
+    API_GET_ALL_EOIP_REMOTE = ('/interface/eoip/print', {'.proplist': 'name,remote-address'}, None)
+    TIMEOUT_GET_ALL = 120
+
     def __init__(self, device: Device):
         self.device = device
         self.session = None  # self.open_session()
+        self.session_broken = False  # сессия в неизвестном состоянии после ошибки, в пул не возвращается
 
     async def open_session(self, get_error=False):
-        try:
-            if self.session is None:
-                self.session = AsyncScrapli(**self.device.connect_param)
-            elif not self.session.isalive():
-                self.session = AsyncScrapli(**self.device.connect_param)
-        except AttributeError:
-            self.session = AsyncScrapli(**self.device.connect_param)
+        """
+        Берет сессию устройства из SessionPool, новое соединение открывается только если в пуле нет живой сессии
+        """
+        pool = SessionPool()
+        if self.session is not None and not self.session.isalive():
+            pool.discard(self.session)
+            self.session = None
+        if self.session is None:
+            self.session = pool.acquire(self.device)
+        if self.session is not None:
+            return self.session
+        self.session = AsyncScrapli(**self.device.connect_param)
         await asyncio.sleep(SLEEP)
         try:
             id = self.device.id
@@ -449,6 +796,7 @@ class DeviceManagement:
             # print(msg)
             # self.device.logger.terminal_output.info(msg)
             await self.session.open()
+            pool.opened += 1
             # if self.session.isalive():
             #     msg = f'[{id}]: Connected to {self.device.city}({self.session.host})'
             #           # f'via {self.session.transport_name}:{self.session.port}'
@@ -465,19 +813,26 @@ class DeviceManagement:
         return self.session
 
     async def close_session(self):
+        """
+        Возвращает сессию в SessionPool. Соединение закрывается пулом, если сессия сломана или лишняя
+        """
+        if self.session is None:
+            return None
         try:
             id = self.device.id
-            await self.session.close()
+            await SessionPool().release(self.device, self.session, broken=self.session_broken)
             # msg = f'[{id}]: Host {self.session.host} disconnected'
             #       # f' via {self.session.transport_name}:{self.session.port}'
             # print(msg)
             # self.device.logger.terminal_output.info(msg)
-        except ScrapliException or OSError as err:
+        except (ScrapliException, OSError) as err:
             msg = f'[{id}]: ! Close error from {self.session.host}- {err}'
             # f' via {self.session.transport_name}:{self.session.port}'
             print(msg)
             self.device.logger.terminal_output.warning(msg)
             self.device.logger.error.error(msg)
+        self.session = None
+        self.session_broken = False
         return None
 
     async def send_command(self, command, print_result=True, is_need_open=True, timeout=None, get_error=False):
@@ -487,7 +842,7 @@ class DeviceManagement:
         if self.session.isalive():
             try:
                 id = self.device.id
-                pr = await self.session.get_prompt()
+                pr = await SessionPool().get_prompt(self.session)
                 await asyncio.sleep(SLEEP)
                 if timeout:
                     response = await self.session.send_command(command, timeout_ops=timeout)
@@ -521,6 +876,7 @@ class DeviceManagement:
                 # f'{err}'
                 print(msg)
                 self.device.logger.error.error(msg)
+                self.session_broken = True
                 # if get_error:
                 #     response = err
             finally:
@@ -528,6 +884,142 @@ class DeviceManagement:
                     await self.close_session()
         return response
 
+    async def read_to_writer(self, command, writer):
+        """
+        Отправляет команду в канал сессии и пишет вывод в writer полными строками по мере чтения,
+        в памяти остается только незавершенная последняя строка. -> кол-во записанных байт
+        """
+        channel = self.session.channel
+        prompt = re.compile(self.session.comms_prompt_pattern.encode(), flags=re.M | re.I)
+        channel.write(command)
+        channel.send_return()
+        buf = b''
+        echoed = False
+        size = 0
+        while True:
+            buf += await channel.read()
+            if not echoed:
+                # первая строка - эхо команды
+                pos = buf.find(b'\n')
+                if pos < 0:
+                    continue
+                buf = buf[pos + 1:]
+                echoed = True
+            pos = buf.rfind(b'\n') + 1
+            done = prompt.search(buf[pos:]) is not None
+            lines = buf[:pos]
+            # пробельные символы в конце не пишутся, пока не придет следующий текст - как strip в send_command
+            data = lines.rstrip()
+            if size == 0:
+                data = data.lstrip()
+            if data:
+                writer.write(data)
+                size += len(data)
+            if done:
+                return size
+            buf = lines[len(lines.rstrip()):] + buf[pos:]
+
+    async def send_command_to_writer(self, command, writer, print_result=True, timeout=None):
+        """
+        Как send_command, но вывод не накапливается в памяти, а пишется в writer (export_archive.ExportWriter)
+        по мере чтения из канала. -> кол-во записанных байт или None при ошибке
+        """
+        self.session = await self.open_session(get_error=True)
+        size = None
+        if self.session.isalive():
+            try:
+                id = self.device.id
+                await SessionPool().get_prompt(self.session)
+                await asyncio.sleep(SLEEP)
+                now = time.time()
+                size = await asyncio.wait_for(self.read_to_writer(command, writer), timeout or TIME_OUT)
+                if print_result:
+                    msg = f'{"-" * 50}\n[{id}]: Result from {self.session.host}: {command}\n' \
+                          f'{size} bytes written, elapsed time = {time.time() - now}'
+                    print(msg)
+                    self.device.logger.terminal_output.info(msg)
+            except Exception as err:
+                msg = f'[{id}]: !Error send command "{command}" on {self.device.city} {self.session.host}- {err!r}'
+                print(msg)
+                self.device.logger.error.error(msg)
+                self.session_broken = True  # остаток вывода в канале
+                size = None
+            finally:
+                await self.close_session()
+        return size
+
+    async def api_command(self, command, attrs=None, queries=None, print_result=True, timeout=None):
+        """
+        Запрос RouterOS API (device.api_transport), вывод как у send_command. None - при ошибке
+        """
+        response = None
+        try:
+            api = await SessionPool().get_api(self.device)
+            response = await api.talk(command, attrs, queries, timeout)
+            if print_result:
+                msg = f'{"-" * 50}\n[{self.device.id}]: API result from {self.device.ip}:\n{response.channel_input}\n' \
+                      f'{response.result}\nelapsed time = {response.elapsed_time}'
+                print(msg)
+                self.device.logger.terminal_output.info(msg)
+        except (routeros_api.ApiError, asyncio.TimeoutError, OSError) as err:
+            msg = f'[{self.device.id}]: !Error API command "{command}" on {self.device.city} {self.device.ip}- {err}'
+            print(msg)
+            self.device.logger.error.error(msg)
+        return response
+
+    @staticmethod
+    def get_records(response):
+        """
+        Записи ответа: RouterOS API - ApiResponse.records как есть, SSH - разбор вывода "print as-value"
+        """
+        if isinstance(response, routeros_api.ApiResponse):
+            return response.records
+        return routeros_output.iter_as_value(response.result)
+
+    @staticmethod
+    def get_record(response):
+        """
+        Одна запись ответа: RouterOS API - первая запись ApiResponse.records, SSH - разбор вывода "print" (key: value)
+        """
+        if isinstance(response, routeros_api.ApiResponse):
+            return response.records[0] if response.records else dict()
+        return routeros_output.parse_key_value(response.result)
+
+    async def api_commands(self, commands, print_result=True, get_error=False):
+        """
+        Запросы RouterOS API commands = [(command, attrs, queries), ...] выполняются одновременно
+        на одном соединении. None - если соединение не открыто
+        """
+        try:
+            await SessionPool().get_api(self.device)
+        except (routeros_api.ApiError, asyncio.TimeoutError, OSError) as err:
+            msg = f'[{self.device.id}]: ! Open API error {self.device.city} {self.device.ip}- {err}'
+            print(msg)
+            if get_error:
+                self.device.connect_error += str(err) + '\n'
+            self.device.logger.error.error(msg)
+            return None
+        return list(await asyncio.gather(*[self.api_command(*command, print_result=print_result)
+                                           for command in commands]))
+
+    async def get_eoip_names_by_remote_ip(self, print_result=False):
+        """
+        Имена EOIP по remote ip одной командой: {remote_ip: [name, ...]}. None - если команда не выполнена.
+        Для SSH сессия должна быть открыта
+        """
+        if self.device.api_transport:
+            response = await self.api_command(*self.API_GET_ALL_EOIP_REMOTE, print_result=print_result,
+                                              timeout=self.TIMEOUT_GET_ALL)
+        else:
+            response = await self.send_command(self.GET_ALL_EOIP_REMOTE, print_result=print_result,
+                                               is_need_open=False, timeout=self.TIMEOUT_GET_ALL)
+        if response is None:
+            return None
+        names_by_ip = dict()
+        for item in self.get_records(response):
+            names_by_ip.setdefault(item.get('remote-address'), []).append(item.get('name'))
+        return names_by_ip
+
     async def send_commands(self, commands, print_result=True, get_error=False):
         response_list = []
         self.session = await self.open_session(get_error=get_error)
@@ -549,19 +1041,41 @@ class DeviceManagement:
         return response_list
 
 
-def get_dict_from_strings(strings):
-    res = dict([l.strip().split(': ') for l in strings.split('\n') if l.find(': ') != -1])
-    return res
-
-
 class CommandRunner_Get(DeviceManagement):
     """
     Класс реализует расширенное выполнение команд чтения на одном устройстве
     """
     GET_IP = '/ip address print'
     SEND_PING = '/ping %s count=5'
+    PING_COUNT = 5
+    PING_BATCH = 50  # максимальное кол-во IP в одной команде SEND_PING_BATCH
+    PING_BATCH_WAIT = 5  # сек, которые скрипт SEND_PING_BATCH ждет результаты ping всех IP пачки
+    PING_BATCH_TIMEOUT = 0.1  # сек на один IP к таймауту команды SEND_PING_BATCH сверх PING_BATCH_WAIT (вывод)
+    # ping всех IP пачки одновременно: на каждый IP фоновое задание :execute, [/ping] в задании возвращает
+    # кол-во полученных ответов в глобальный массив %(var)s {ip: received}. Скрипт ждет, пока в массиве
+    # появятся все IP (не дольше %(ticks)s * 200ms), выводит на каждый IP строку "ip;received" и удаляет массив
+    SEND_PING_BATCH = ':global %(var)s [:toarray ""];' \
+                      ' :foreach ip in={%(ips)s} do={:execute (":global %(var)s; :set (\\$%(var)s->\\"" . $ip .' \
+                      ' "\\") [/ping " . $ip . " count=' + str(PING_COUNT) + ' interval=200ms]")};' \
+                      ' :local t 0; :while ([:len $%(var)s] < %(count)s && $t < %(ticks)s) do={' \
+                      ':delay 200ms; :set t ($t + 1)};' \
+                      ' :foreach ip,received in=$%(var)s do={:put ($ip . ";" . $received)};' \
+                      ' /system script environment remove [find name="%(var)s"]'
+    _ping_batch_ids = count()  # имена глобальных массивов SEND_PING_BATCH для одновременных пачек на устройстве
     GET_CONFIG = '/export compact'
     TIMEOUT_GET_CONFIG = 120
+    # отпечаток конфигурации для get_config(archive=...): длина "/export compact", посчитанная на устройстве
+    # (экспорт пишется в файл на устройстве, по сети передается только его размер), кол-во записей истории
+    # изменений (/system history, сбрасывается при перезагрузке - поэтому uptime). Заголовок экспорта с датой
+    # имеет постоянную длину. Экономится только передача и разбор экспорта - устройство выполняет экспорт
+    # полностью, как и без архива. Правка, не меняющая длину экспорта и не попавшая в историю, отпечаток
+    # не меняет - такая конфигурация загружается полностью не позже чем через export_archive.MAX_AGE дней
+    FILE_CONFIG_FINGERPRINT = 'remoteget_fingerprint'
+    GET_CONFIG_FINGERPRINT = '/export compact file=%(file)s;' \
+                             ' :put ("uptime=" . [/system resource get uptime] .' \
+                             ' ";length=" . [/file get [find name="%(file)s.rsc"] size] .' \
+                             ' ";history=" . [/system history print count-only]);' \
+                             ' /file remove [find name="%(file)s.rsc"]' % dict(file=FILE_CONFIG_FINGERPRINT)
     GET_PPP_ACTIVE = '/ppp active pr detail'
     GET_NAME = '/system identity print'
     GET_ROUTERBOARD = '/system routerboard print'
@@ -573,6 +1087,19 @@ class CommandRunner_Get(DeviceManagement):
     GET_COUNT_INTERFACE_DISABLED = '/interface print count-only where disabled'
     GET_COUNT_PPP_ACTIVE = '/ppp active print count-only'
 
+    # команды RouterOS API для устройств с api_transport: (command, attrs, queries)
+    API_GET_PPP_ACTIVE = ('/ppp/active/print', {'.proplist': 'address'}, None)
+    API_GET_SYSNAME = [('/system/identity/print', None, None),
+                       ('/system/resource/print', None, None),
+                       ('/system/routerboard/print', None, None)]
+    API_GET_COUNTING = [('/interface/print', {'count-only': ''}, None),
+                        ('/interface/print', {'count-only': ''}, ['?running=true']),
+                        ('/interface/print', {'count-only': ''}, ['?disabled=true']),
+                        ('/ppp/active/print', {'count-only': ''}, None)]
+    API_GET_ALL_IP = ('/ip/address/print', {'.proplist': 'address,interface'}, ['?disabled=false'])
+    API_GET_ALL_EOIP_STATS = ('/interface/print', {'.proplist': 'name,rx-byte,tx-byte,disabled,running'},
+                              ['?type=eoip-tunnel'])
+
     # {1}=last-link-down-time|last-link-up-time|
     #    link-downs|
     #    rx-byte|tx-byte|
@@ -591,46 +1118,82 @@ class CommandRunner_Get(DeviceManagement):
                                        '($txorrx+([/interface get [find where name =$eoip->"name"] %s])) }; ' \
                                        ':put $txorrx ;'
 
+    # bulk режим get_stats_by_ip: счетчики всех EOIP интерфейсов одной командой,
+    # каждая запись выводится строкой "key=value;key=value"
+    GET_ALL_EOIP_STATS = ':foreach r in=[/interface print stats as-value proplist=name,rx-byte,tx-byte,disabled,running' \
+                         ' where type="eoip-tunnel"] do={:put $r}'
+    STATS_SUM_ITEMS = ('rx-byte', 'tx-byte')
+
     def __init__(self, device):
         super().__init__(device)
         self.logger = Logger()
 
-    async def check_icmp(self, ip_list, type_ip_list, print_result=True, check_enabled=False):
-        """type_ip_list = [ 'ip_free' | 'ip_in_tu' ]"""
+    async def check_icmp(self, ip_list, type_ip_list, print_result=True, check_enabled=False, batch=False):
+        """
+        type_ip_list = [ 'ip_free' | 'ip_in_tu' ]
+        batch - проверять IP пачками по PING_BATCH одним скриптом на устройстве (SEND_PING_BATCH),
+        IP пачки пингуются одновременно, вместо отдельной команды /ping на каждый IP по очереди
+        """
         if (not check_enabled) or self.device.enabled:
-            regx = r'sent=(\d)+.*received=(\d)+.*packet-loss=(\d+%)'
             result = dict()
             count = 0
             true_icmp = set()
             false_icmp = set()
             if not (type(ip_list) == list or type(ip_list) == set):
                 ip_list = [ip_list]
+
+            def set_icmp_result(ip, sent, received):
+                msg = f'Check {count}/{len(ip_list)} ICMP from {self.device.ip} to host {ip} - %s'
+                result[ip] = (sent, received)
+                if received >= ICMP_RECEIVED_MIN:
+                    true_icmp.add(ip)
+                    print(msg % 'TRUE')
+                    self.logger.output_icmp.info(msg % 'TRUE')
+                else:
+                    false_icmp.add(ip)
+                    print(msg % 'FALSE')
+                    self.logger.output_icmp.info(msg % 'FALSE')
+
             try:
                 await self.open_session()
-                if self.session.isalive():
+                if self.session.isalive() and batch:
+                    for slice_ip_list in tools.list_split(ip_list, self.PING_BATCH):
+                        if not slice_ip_list:
+                            continue
+                        var = f'remotegetping{os.getpid()}x{next(self._ping_batch_ids)}'
+                        command = self.SEND_PING_BATCH % dict(var=var,
+                                                              ips=';'.join(slice_ip_list),
+                                                              count=len(slice_ip_list),
+                                                              ticks=self.PING_BATCH_WAIT * 5)
+                        timeout = self.PING_BATCH_WAIT + 1 + self.PING_BATCH_TIMEOUT * len(slice_ip_list)
+                        response = await self.send_command(command,
+                                                           print_result=print_result,
+                                                           is_need_open=False,
+                                                           timeout=timeout)
+                        ping_counts = dict(routeros_output.iter_fields(response.result, 2)) if response else {}
+                        for ip in slice_ip_list:
+                            count += 1
+                            if ip in ping_counts:
+                                set_icmp_result(ip, self.PING_COUNT, int(ping_counts[ip]))
+                            else:
+                                msg = f'Check {count}/{len(ip_list)} ICMP from {self.device.ip} to host {ip} - ' \
+                                      f'Error, no result in batch. Call method: "check_icmp"'
+                                self.logger.output_icmp.error(msg)
+                                self.logger.error.error(msg)
+                                print(msg)
+                elif self.session.isalive():
                     for ip in ip_list:
                         count += 1
-                        msg = f'Check {count}/{len(ip_list)} ICMP from {self.device.ip} to host {ip} - %s'
                         response = await self.send_command(self.SEND_PING % ip,
                                                            print_result=print_result,
                                                            is_need_open=False)
-                        # TODO IndexError: list index out of range
+                        ping_count = None
                         try:
-                            ping_count = re.findall(regx, response.result)
-                            if int(ping_count[0][1]) >= 3:
-                                date.today()
-                                result.update({ip: 'Успешно {1} из {0}. Потерь - {2}'.format(*ping_count[0])})
-                                true_icmp.add(ip)
-                                print(msg % 'TRUE')
-                                self.logger.output_icmp.info(msg % 'TRUE')
-                            else:
-                                result.update({ip: 'FALSE'})
-                                false_icmp.add(ip)
-                                self.device.false_icmp_list.append(ip)
-                                print(msg % 'FALSE')
-                                self.logger.output_icmp.info(msg % 'FALSE')
+                            ping_count = routeros_output.parse_summary(response.result, 'sent')
+                            set_icmp_result(ip, int(ping_count['sent']), int(ping_count['received']))
                         except Exception as err:
-                            msg = msg % 'Error' + str(ping_count) + 'Call method: "check_icmp"'
+                            msg = f'Check {count}/{len(ip_list)} ICMP from {self.device.ip} to host {ip} - ' \
+                                  f'Error{ping_count}Call method: "check_icmp"'
                             self.logger.output_icmp.error(msg)
                             self.logger.error.error(msg)
                             print(msg)
@@ -641,22 +1204,64 @@ class CommandRunner_Get(DeviceManagement):
                 self.logger.root.info(message)
                 await self.close_session()
             if type_ip_list == 'ip_free':
-                self.device.icmp_ip_free_result.update(result)
+                self.device.results.icmp_ip_free.update(result)
                 self.device.mikroconfig.icmp_false.update(false_icmp)
                 self.device.mikroconfig.icmp_true.update(true_icmp)
             elif type_ip_list == 'ip_in_tu':
-                self.device.icmp_ip_in_tu_result.update(result)
+                self.device.results.icmp_ip_in_tu.update(result)
                 self.device.mikroconfig.icmp_ip_in_tu_false.update(false_icmp)
                 self.device.mikroconfig.icmp_ip_in_tu_true.update(true_icmp)
 
-    async def get_config(self, print_result=False, check_enabled=False):
+    async def get_config_fingerprint(self, print_result=False):
+        """
+        (отпечаток конфигурации, uptime в секундах) или None. Экспорт на устройстве занимает столько же,
+        сколько при полной загрузке, - поэтому timeout как у GET_CONFIG
+        """
+        response = await self.send_command(self.GET_CONFIG_FINGERPRINT, print_result=print_result,
+                                           timeout=self.TIMEOUT_GET_CONFIG)
+        if response is None:
+            return None
+        fingerprint = routeros_output.parse_as_value(response.result)
+        if not {'uptime', 'length', 'history'}.issubset(fingerprint):
+            return None
+        uptime = routeros_output.parse_duration(fingerprint.pop('uptime'))
+        return ';'.join(f'{key}={value}' for key, value in fingerprint.items()), uptime
+
+    async def get_config(self, print_result=False, check_enabled=False, archive: ExportArchive = None,
+                         incremental=True, stream=False):
+        """
+        archive + incremental - инкрементальная загрузка: сначала запрашивается отпечаток конфигурации
+        (GET_CONFIG_FINGERPRINT), если он не изменился с последней сохраненной в архив конфигурации -
+        она берется из архива. Экономит передачу экспорта по сети, но не время экспорта на устройстве.
+        archive + stream - вывод "/export compact" пишется в архив по мере чтения из канала,
+        в Device остается только ссылка на архив (export_handle)
+        """
         if (not check_enabled) or self.device.enabled:
             now = time.time()
-            response = await self.send_command(self.GET_CONFIG,
-                                               print_result=print_result,
-                                               timeout=self.TIMEOUT_GET_CONFIG)
+            fingerprint = None
+            if archive is not None and incremental:
+                fingerprint = await self.get_config_fingerprint(print_result)
+                entry = archive.get(self.device.key, *fingerprint) if fingerprint is not None else None
+                if entry is not None:
+                    self.device.set_export_handle(archive.get_handle(entry['hash']))
+                    self.device.config_fingerprint = (*fingerprint, entry['date'])
+                    msg = f'Host with IP {self.device.ip} {self.device.city} ({self.device.name}) ' \
+                          f'config not changed since {entry["date"]}, load from archive. ' \
+                          f'Elapsed {"%.3s" % (time.time() - now)} seconds.'
+                    self.logger.device_com.info(msg)
+                    print(time.strftime("%H:%M:%S"), msg)
+                    return
+            if archive is not None and stream:
+                response = await self.get_config_to_archive(archive, print_result)
+            else:
+                response = await self.send_command(self.GET_CONFIG,
+                                                   print_result=print_result,
+                                                   timeout=self.TIMEOUT_GET_CONFIG)
+                if response is not None:
+                    self.device.export_compact = response.result
             if response is not None:
-                self.device.export_compact = response.result
+                if fingerprint is not None:
+                    self.device.config_fingerprint = (*fingerprint, str(date.today()))
                 msg = f'Host with IP {self.device.ip} {self.device.city} ({self.device.name}) ' \
                       f'return config. ' \
                       f'Elapsed {"%.3s" % (time.time() - now)} seconds.'
@@ -670,13 +1275,30 @@ class CommandRunner_Get(DeviceManagement):
                 self.logger.device_com.warning(msg)
                 print(time.strftime("%H:%M:%S"), msg)
 
+    async def get_config_to_archive(self, archive: ExportArchive, print_result=False):
+        """
+        "/export compact" потоком в архив -> хэш конфигурации или None при ошибке
+        """
+        writer = archive.open_writer()
+        size = await self.send_command_to_writer(self.GET_CONFIG, writer, print_result=print_result,
+                                                 timeout=self.TIMEOUT_GET_CONFIG)
+        if not size:
+            writer.abort()
+            return None
+        hash_ = writer.close()
+        self.device.set_export_handle(archive.get_handle(hash_))
+        return hash_
+
     async def get_ppp_active(self, print_result=False, check_enabled=False):
-        regx = r'address=((?:\d+\.){3}\d+)'
         if (not check_enabled) or self.device.enabled:
-            response = await self.send_command(self.GET_PPP_ACTIVE, print_result=print_result)
+            if self.device.api_transport:
+                response = await self.api_command(*self.API_GET_PPP_ACTIVE, print_result=print_result)
+                records = response.records if response is not None else []
+            else:
+                response = await self.send_command(self.GET_PPP_ACTIVE, print_result=print_result)
+                records = routeros_output.iter_detail(response.result) if response is not None else []
             if response is not None:
-                res = re.findall(regx, response.result)
-                self.device.ip_ppp_active = set(res)
+                self.device.ip_ppp_active = {ppp['address'] for ppp in records if 'address' in ppp}
                 self.logger.device_com.info(f'Host with IP {self.device.ip} ({self.device.name})'
                                             f' return ppp active')
             else:
@@ -685,11 +1307,14 @@ class CommandRunner_Get(DeviceManagement):
 
     async def get_counting(self, print_result=False, check_enabled=False):
         if (not check_enabled) or self.device.enabled:
-            response_list = await self.send_commands([self.GET_COUNT_INTERFACE,
-                                                      self.GET_COUNT_INTERFACE_ACTIVE,
-                                                      self.GET_COUNT_INTERFACE_DISABLED,
-                                                      self.GET_COUNT_PPP_ACTIVE
-                                                      ], print_result=print_result)
+            if self.device.api_transport:
+                response_list = await self.api_commands(self.API_GET_COUNTING, print_result=print_result)
+            else:
+                response_list = await self.send_commands([self.GET_COUNT_INTERFACE,
+                                                          self.GET_COUNT_INTERFACE_ACTIVE,
+                                                          self.GET_COUNT_INTERFACE_DISABLED,
+                                                          self.GET_COUNT_PPP_ACTIVE
+                                                          ], print_result=print_result)
             try:
                 self.device.count_interface = response_list[0].result
                 self.device.count_interface_active = response_list[1].result
@@ -709,39 +1334,37 @@ class CommandRunner_Get(DeviceManagement):
         """
         if (not check_enabled) or self.device.enabled:
             self.device.enabled = False  # Устанавлием в Ложь, чтоб затем установить в Истину в случае получения ответа
-            response = await self.send_commands([self.GET_NAME,
-                                                 self.GET_RESOURCE,
-                                                 self.GET_ROUTERBOARD],
-                                                print_result, get_error=True)
+            if self.device.api_transport:
+                response = await self.api_commands(self.API_GET_SYSNAME, print_result, get_error=True)
+            else:
+                response = await self.send_commands([self.GET_NAME,
+                                                     self.GET_RESOURCE,
+                                                     self.GET_ROUTERBOARD],
+                                                    print_result, get_error=True)
             if response is not None:
                 self.device.enabled = True
-                resource = ''
-                routerboard = ''
+                resource = None
+                routerboard = None
                 try:
-                    self.device.name = response[0].result.strip().lstrip('name:').strip()
-                    resource = response[1].result
-                    routerboard = response[2].result
+                    self.device.name = self.get_record(response[0]).get('name', '')
+                    resource = response[1]
+                    routerboard = response[2]
                 except:
                     pass
 
                 try:
-                    resource_dict = get_dict_from_strings(resource)
+                    resource_dict = self.get_record(resource)
                     self.device.board_name = resource_dict['board-name']
                     self.device.version = resource_dict['version']
-                    uptime_ = resource_dict['uptime']
-                    week = re.findall(r'(\d*)w', uptime_)
-                    week = int(week[0]) if week else 0
-                    day = re.findall(r'(\d*)d', uptime_)
-                    day = int(day[0]) if day else 0
-                    self.device.uptime = 7 * week + day
+                    self.device.uptime = routeros_output.parse_duration(resource_dict['uptime']) // 86400
                 except:
-                    self.device.connect_error += 'resource=\n' + resource + '\n'
+                    self.device.connect_error += 'resource=\n' + getattr(resource, 'result', '') + '\n'
 
                 try:
-                    routerboard_dict = get_dict_from_strings(routerboard)
+                    routerboard_dict = self.get_record(routerboard)
                     self.device.serial = routerboard_dict['serial-number']
                 except:
-                    self.device.connect_error += 'routerboard=\n' + routerboard + '\n'
+                    self.device.connect_error += 'routerboard=\n' + getattr(routerboard, 'result', '') + '\n'
 
                 self.logger.device_com.info(f'Host with IP {self.device.ip} return sysname: {self.device.name}, '
                                             f'board_name: {self.device.board_name}, '
@@ -775,7 +1398,55 @@ class CommandRunner_Get(DeviceManagement):
     #         print(err)
     #     except asyncio.exceptions.TimeoutError:
     #         print("asyncio.exceptions.TimeoutError", device["host"])
-    async def get_stats_by_ip(self, ip_list, print_result, check_enabled):
+    def join_stats_by_ip(self, ip_list, names_by_ip, stats_items):
+        """
+        Сопоставление remote ip -> статистика EOIP. Если на один remote ip несколько EOIP,
+        байты (STATS_SUM_ITEMS) суммируются, disabled - если отключены все, running - если работает хотя бы один
+        """
+        stats_by_name = {item.get('name'): item for item in stats_items}
+        ip_stats = dict()
+        for ip in ip_list:
+            names = names_by_ip.get(ip)
+            if not names:
+                ip_stats[ip] = 'ip not found in CM'
+                continue
+            stats = [stats_by_name[name] for name in names if name in stats_by_name]
+            if not stats:
+                ip_stats[ip] = 'error get stats'
+            elif len(stats) == 1:
+                ip_stats[ip] = stats[0]
+            else:
+                resp = {'name': ','.join(stat.get('name', '') for stat in stats)}
+                for item in self.STATS_SUM_ITEMS:
+                    resp[item] = str(sum(int(stat.get(item) or 0) for stat in stats))
+                resp['disabled'] = str(all(stat.get('disabled') == 'true' for stat in stats)).lower()
+                resp['running'] = str(any(stat.get('running') == 'true' for stat in stats)).lower()
+                ip_stats[ip] = resp
+        return ip_stats
+
+    async def get_stats_by_ip_bulk(self, ip_list, print_result):
+        """
+        Статистика EOIP по всем ip из ip_list двумя командами на устройство, сопоставление выполняется локально
+        """
+        if self.device.api_transport:
+            names_by_ip, stats_response = await asyncio.gather(
+                self.get_eoip_names_by_remote_ip(print_result),
+                self.api_command(*self.API_GET_ALL_EOIP_STATS, print_result=print_result, timeout=self.TIMEOUT_GET_ALL))
+        else:
+            names_by_ip = await self.get_eoip_names_by_remote_ip(print_result)
+            stats_response = await self.send_command(self.GET_ALL_EOIP_STATS, print_result=print_result,
+                                                     is_need_open=False, timeout=self.TIMEOUT_GET_ALL)
+        if names_by_ip is None or stats_response is None:
+            self.device.results.ip_stats.update({ip: 'error get stats' for ip in ip_list})
+            return
+        self.device.results.ip_stats.update(self.join_stats_by_ip(ip_list, names_by_ip,
+                                                                  self.get_records(stats_response)))
+
+    async def get_stats_by_ip(self, ip_list, print_result, check_enabled, bulk=False):
+        """
+        bulk - получить все EOIP и их счетчики двумя командами (get_stats_by_ip_bulk),
+        вместо отдельного скрипта на каждый ip
+        """
         async def get_stats_many_int_by_ip(self, ip, items, print_result):
             """
             Считает суммарную статистику по нескольким интерфейсам.
@@ -792,8 +1463,13 @@ class CommandRunner_Get(DeviceManagement):
         if (not check_enabled) or self.device.enabled:
             try:
                 count = 0
+                if bulk and self.device.api_transport:
+                    await self.get_stats_by_ip_bulk(ip_list, print_result)
+                    return
                 await self.open_session()
-                if self.session.isalive():
+                if self.session.isalive() and bulk:
+                    await self.get_stats_by_ip_bulk(ip_list, print_result)
+                elif self.session.isalive():
                     for ip in ip_list:
                         count += 1
                         msg = f'Get {count}/{len(ip_list)} stats EOIP from {self.device.ip} for remote ip {ip}'
@@ -808,10 +1484,10 @@ class CommandRunner_Get(DeviceManagement):
                                     resp = await get_stats_many_int_by_ip(self, ip, ['rx-byte'],
                                                                           print_result=print_result)
                                 else:
-                                    resp = dict([stat_item.split('=', 1) for stat_item in response.result.split(';')])
+                                    resp = next(routeros_output.iter_as_value(response.result))
                             except Exception:
                                 resp = 'error get stats'
-                            self.device.ip_stats.update({ip: resp})
+                            self.device.results.ip_stats.update({ip: resp})
             finally:
                 message = f'Get stats EOIP for {len(ip_list)} host from {self.device.ip} ({self.device.name}) complete!'
                 print(message)
@@ -819,15 +1495,17 @@ class CommandRunner_Get(DeviceManagement):
                 await self.close_session()
 
     async def get_all_ip_with_mask_30(self, print_result=False, check_enabled=False):
-        regx = r'.+address=((?:\d+\.){3}\d+)(?:.+?)interface=(.+?);'
         if (not check_enabled) or self.device.enabled:
-            response = await self.send_command(self.GET_ALL_IP_WITH_MASK_30, print_result=print_result)
-            res = re.findall(regx, response.result)
+            if self.device.api_transport:
+                response = await self.api_command(*self.API_GET_ALL_IP, print_result=print_result)
+            else:
+                response = await self.send_command(self.GET_ALL_IP_WITH_MASK_30, print_result=print_result)
             if response is not None:
-                # response_dict = dict([item.split('=') for item in response.result.split(';')])
-                # address = res[0]
-                # interface = res[1]
-                self.device.all_ip_with_mask_30 = res
+                # API возвращает все адреса, SSH скрипт - только /30
+                self.device.results.all_ip_with_mask_30 = [(ip['address'].split('/')[0], ip['interface'])
+                                                           for ip in self.get_records(response)
+                                                           if ip.get('address', '').endswith('/30')
+                                                           and 'interface' in ip]
                 self.logger.device_com.info(f'Host with IP {self.device.ip} ({self.device.name})'
                                             f' return all_ip_with_mask_30')
             else:
@@ -866,36 +1544,49 @@ class CommandRunner_Put(DeviceManagement):
 
     RESET_MANY_EOIP_STATS_BY_REMOTE_IP = ':local eoipnames [/interface eoip print as-value where remote-address=%s];' \
                                          ' :foreach eoip in=$eoipnames do={/interface reset-counters ($eoip->"name") };'
+    # batch режим set_status_*: {0} - массив элементов через ";", {1} - путь меню, {2} - action, {3} - where_by
+    PUT_BATCH = ':foreach i in={{{0}}} do={{{1} {2} [find where {3}=$i]}}'
+    # проверка после batch: на каждый элемент строка "элемент;найдено;отключено"
+    PRINT_BATCH_CHECK = ':foreach i in={{{0}}} do={{:put ("$i;" . [:len [{1} find where {3}=$i]] . ";" . ' \
+                        '[:len [{1} find where {3}=$i and disabled]])}}'
+
+    # bulk режим reset_stats_by_ip: имена EOIP через запятую, длина команды ограничена MAX_COMMAND_LENGTH
+    RESET_COUNTERS_BY_NAMES = '/interface reset-counters %s'
 
     def __init__(self, device):
         super().__init__(device)
         self.logger = Logger()
 
-    async def set_status_interfaces(self, action, print_result, check_enabled):
+    async def set_status_interfaces(self, action, print_result, check_enabled, batch=False):
         if self.device.mikroconfig:
             bridges = self.device.mikroconfig.br_empty | self.device.mikroconfig.br_single
-            await self.set_status_interfaces_by_name(action, 'bridge', bridges,
-                                                     print_result, check_enabled)  # set_status bridge empty and single
+            await self.set_status_interfaces_by_name(action, 'bridge', bridges, print_result=print_result,
+                                                     check_enabled=check_enabled,
+                                                     batch=batch)  # set_status bridge empty and single
 
             eoip_single = [int for int, type in self.device.mikroconfig.int_single_dict.items() if type == 'eoip']
-            await self.set_status_interfaces_by_name(action, 'eoip', eoip_single,
-                                                     print_result, check_enabled)  # set_status eoip single
+            await self.set_status_interfaces_by_name(action, 'eoip', eoip_single, print_result=print_result,
+                                                     check_enabled=check_enabled,
+                                                     batch=batch)  # set_status eoip single
 
             vlan_single = [int for int, type in self.device.mikroconfig.int_single_dict.items() if type == 'vlan']
-            await self.set_status_interfaces_by_name(action, 'vlan', vlan_single,
-                                                     print_result, check_enabled)  # set_status vlan single
+            await self.set_status_interfaces_by_name(action, 'vlan', vlan_single, print_result=print_result,
+                                                     check_enabled=check_enabled,
+                                                     batch=batch)  # set_status vlan single
 
             eoips = self.device.mikroconfig.eoip_free
-            await self.set_status_interfaces_by_name(action, 'eoip', eoips,
-                                                     print_result=print_result)  # set_status eoip free
+            await self.set_status_interfaces_by_name(action, 'eoip', eoips, print_result=print_result,
+                                                     check_enabled=check_enabled,
+                                                     batch=batch)  # set_status eoip free
 
             vlans = self.device.mikroconfig.vlans_free
-            await self.set_status_interfaces_by_name(action, 'vlan', vlans,
-                                                     print_result, check_enabled)  # set_status vlan free
+            await self.set_status_interfaces_by_name(action, 'vlan', vlans, print_result=print_result,
+                                                     check_enabled=check_enabled,
+                                                     batch=batch)  # set_status vlan free
 
             bridge_ports = self.device.mikroconfig.int_single_dict.keys()
             await self.set_status_bridge_port_by_name(action, 'interface', bridge_ports,
-                                                      print_result, check_enabled)  # set_status bridge ports
+                                                      print_result, check_enabled, batch)  # set_status bridge ports
 
             # """int_from_vlans_unknow = self.device.mikroconfig.int_from_vlans_unknow
             # await self.set_status_interfaces_by_name(action, 'vlan', int_from_vlans_unknow, where_by='interface',
@@ -903,21 +1594,25 @@ class CommandRunner_Put(DeviceManagement):
 
             ip_ppp = self.device.mikroconfig.ip_ppp_free
             await self.set_status_ppp_secret_by_ip(action, 'ppp secret', ip_ppp,
-                                                   print_result, check_enabled)  # set_status ip_ppp free
+                                                   print_result, check_enabled, batch)  # set_status ip_ppp free
 
-    async def set_status_ip_free(self, action, ip_list, print_result, check_enabled):
+    async def set_status_ip_free(self, action, ip_list, print_result, check_enabled, batch=False):
         await self.set_status_ppp_secret_by_ip(action, 'ppp secret', ip_list,
-                                               print_result, check_enabled)  # set_status ppp ip_free
+                                               print_result, check_enabled, batch)  # set_status ppp ip_free
         await self.set_status_eoip_by_ip(action, 'eoip', ip_list,
-                                         print_result, check_enabled)  # set_status eoip ip_free
+                                         print_result, check_enabled, batch)  # set_status eoip ip_free
 
     async def set_status_interfaces_by_name(self, action, type_int, int_list, where_by=None,
-                                            print_result=True, check_enabled=False):
+                                            print_result=True, check_enabled=False, batch=False):
         if (not check_enabled) or self.device.enabled:
             if not where_by:
                 where_by = 'name'
             if type(int_list) is set:
                 int_list = list(int_list)
+            if batch:
+                await self.send_command_batch(action, type_int, int_list, f'/interface {type_int}', where_by,
+                                              print_result=print_result)
+                return
             set_status_command = ''
             if action == 'disable':
                 set_status_command = self.PUT_DISABLE_INTERFACE_BY_NAME
@@ -954,10 +1649,81 @@ class CommandRunner_Put(DeviceManagement):
             await self.close_session()
             # DONE отправка команды на ЦМ - set_status_command
 
-    async def set_status_ppp_secret_by_ip(self, action, type_int, ip_ppp, print_result=True, check_enabled=False):
+    @staticmethod
+    def check_batch_item(action, found, disabled):
+        """
+        Ошибка по результату PRINT_BATCH_CHECK для одного элемента, '' - если ошибки нет
+        """
+        if found == 0:
+            return 'not found'
+        if action == 'disable' and disabled < found:
+            return 'not disabled'
+        if action == 'enable' and disabled > 0:
+            return 'not enabled'
+        return ''
+
+    async def send_command_batch(self, action, type_int, int_list, path, where_by, quote=True, print_result=True):
+        """
+        Пакетная запись: элементы int_list объединяются в массив RouterOS (имена в кавычках, IP без кавычек),
+        action выполняется одной командой PUT_BATCH на часть не длиннее MAX_COMMAND_LENGTH,
+        затем результат проверяется одной командой PRINT_BATCH_CHECK на часть.
+        action = 'print' - только проверка.
+        Возвращает {int: ошибка} для элементов, которые не найдены или не перешли в нужное состояние
+        """
+        failed = dict()
+        int_list = list(int_list)
+        if not int_list:
+            return failed
+        # имена из ExportConfig - в виде из "/export", с escape-последовательностями RouterOS
+        items = [routeros_output.quote(str(item), escaped=True) if quote else str(item) for item in int_list]
+        reserve = len(self.PRINT_BATCH_CHECK.format('', path, action, where_by))
+        parts = tools.list_split_by_length(items, MAX_COMMAND_LENGTH - reserve, sep=';')
+        try:
+            await self.open_session()
+            if self.session.isalive():
+                start = 0
+                for part_no, items_part in enumerate(parts, 1):
+                    int_part = int_list[start:start + len(items_part)]
+                    start += len(items_part)
+                    array = ';'.join(items_part)
+                    msg = f'{part_no}/{len(parts)} {action} {len(items_part)} {type_int} in {self.device.city}: ' \
+                          f'{self.device.ip}({self.device.name})'
+                    print(msg)
+                    self.logger.command_put.info(msg)
+                    if action != 'print':
+                        await self.send_command(self.PUT_BATCH.format(array, path, action, where_by),
+                                                print_result=print_result, is_need_open=False)
+                    response = await self.send_command(self.PRINT_BATCH_CHECK.format(array, path, action, where_by),
+                                                       print_result=print_result, is_need_open=False)
+                    checks = [fields[1:] for fields in routeros_output.iter_fields(response.result, 3)] \
+                        if response is not None else []
+                    if len(checks) != len(int_part):
+                        failed.update({item: 'error check' for item in int_part})
+                        continue
+                    for item, (found, disabled) in zip(int_part, checks):
+                        error = self.check_batch_item(action, int(found), int(disabled))
+                        if error:
+                            failed[item] = error
+        finally:
+            for item, error in failed.items():
+                self.logger.command_put.warning(f'{action} {type_int} {item} in {self.device.city}: '
+                                                f'{self.device.ip}({self.device.name}) - {error}')
+            msg = f'Сomplete {action} {type_int} in {self.device.city}: ' \
+                  f'{self.device.ip}({self.device.name}) for {len(int_list)} interfaces, failed - {len(failed)}.'
+            print(msg)
+            self.logger.command_put.info(msg)
+            await self.close_session()
+        return failed
+
+    async def set_status_ppp_secret_by_ip(self, action, type_int, ip_ppp, print_result=True, check_enabled=False,
+                                          batch=False):
         if (not check_enabled) or self.device.enabled:
             if type(ip_ppp) is set:
                 ip_ppp = list(ip_ppp)
+            if batch:
+                await self.send_command_batch(action, type_int, ip_ppp, '/ppp secret', 'remote-address',
+                                              quote=False, print_result=print_result)
+                return
             set_status_command = ''
             if action == 'disable':
                 set_status_command = self.PUT_DISABLE_PPP_SECRET
@@ -968,10 +1734,15 @@ class CommandRunner_Put(DeviceManagement):
             if set_status_command:
                 await self.send_command_run(action, type_int, ip_ppp, set_status_command, print_result)
 
-    async def set_status_eoip_by_ip(self, action, type_int, remote_ip_eoip, print_result=True, check_enabled=False):
+    async def set_status_eoip_by_ip(self, action, type_int, remote_ip_eoip, print_result=True, check_enabled=False,
+                                    batch=False):
         if (not check_enabled) or self.device.enabled:
             if type(remote_ip_eoip) is set:
                 remote_ip_eoip = list(remote_ip_eoip)
+            if batch:
+                await self.send_command_batch(action, type_int, remote_ip_eoip, '/interface eoip', 'remote-address',
+                                              quote=False, print_result=print_result)
+                return
             set_status_command = ''
             if action == 'disable':
                 set_status_command = self.PUT_DISABLE_EOIP_BY_REMOTE_IP
@@ -984,10 +1755,14 @@ class CommandRunner_Put(DeviceManagement):
                 await self.send_command_run(action, type_int, remote_ip_eoip, set_status_command, print_result)
 
     async def set_status_bridge_port_by_name(self, action, type_int, br_port_list,
-                                             print_result=True, check_enabled=False):
+                                             print_result=True, check_enabled=False, batch=False):
         if (not check_enabled) or self.device.enabled:
             if type(br_port_list) is set:
                 br_port_list = list(br_port_list)
+            if batch:
+                await self.send_command_batch(action, 'bridge port', br_port_list, '/interface bridge port', type_int,
+                                              print_result=print_result)
+                return
             set_status_command = ''
             if action == 'disable':
                 set_status_command = self.PUT_DISABLE_BRIDGE_PORT
@@ -998,7 +1773,43 @@ class CommandRunner_Put(DeviceManagement):
             if set_status_command:
                 await self.send_command_run(action, type_int, br_port_list, set_status_command, print_result)
 
-    async def reset_stats_by_ip(self, ip_list, print_result, check_enabled):
+    async def reset_stats_by_ip_bulk(self, ip_list, print_result):
+        """
+        Сброс счетчиков EOIP по всем ip из ip_list: имена EOIP берутся одним списком,
+        reset-counters выполняется сразу по многим именам частями не длиннее MAX_COMMAND_LENGTH.
+        Возвращает {'not found': [ip, ...], 'single': [ip, ...], 'many': [ip, ...]}
+        """
+        names_by_ip = await self.get_eoip_names_by_remote_ip(print_result)
+        if names_by_ip is None:
+            return None
+        matched = {'not found': [], 'single': [], 'many': []}
+        names = []
+        for ip in ip_list:
+            ip_names = names_by_ip.get(ip, [])
+            if not ip_names:
+                matched['not found'].append(ip)
+            elif len(ip_names) == 1:
+                matched['single'].append(ip)
+            else:
+                matched['many'].append(ip)
+            # имена из вывода устройства - без экранирования RouterOS
+            names += [routeros_output.quote(name) for name in ip_names]
+        max_length = MAX_COMMAND_LENGTH - len(self.RESET_COUNTERS_BY_NAMES)
+        for names_part in tools.list_split_by_length(names, max_length):
+            await self.send_command(self.RESET_COUNTERS_BY_NAMES % ','.join(names_part),
+                                    print_result=print_result, is_need_open=False)
+        for type_match, ips in matched.items():
+            if ips:
+                msg = f'Reset counters EOIP from {self.device.ip} ({self.device.name}) - {type_match} EOIP ' \
+                      f'for {len(ips)} remote ip: {", ".join(ips)}'
+                self.logger.command_put.info(msg)
+        return matched
+
+    async def reset_stats_by_ip(self, ip_list, print_result, check_enabled, bulk=False):
+        """
+        bulk - сбросить счетчики всех EOIP из ip_list несколькими командами (reset_stats_by_ip_bulk),
+        вместо отдельного скрипта на каждый ip
+        """
         async def reset_stats_many_int_by_ip(self, ip, print_result):
             """
             Сбрасывает счетчики трафика по нескольким интерфейсам.
@@ -1010,7 +1821,12 @@ class CommandRunner_Put(DeviceManagement):
             try:
                 count = 0
                 await self.open_session()
-                if self.session.isalive():
+                if self.session.isalive() and bulk:
+                    matched = await self.reset_stats_by_ip_bulk(ip_list, print_result)
+                    if matched is not None:
+                        print(f'Reset counters EOIP from {self.device.ip}: ' +
+                              ', '.join(f'{type_match} - {len(ips)}' for type_match, ips in matched.items()))
+                elif self.session.isalive():
                     for ip in ip_list:
                         count += 1
                         msg = f'Reset counters {count}/{len(ip_list)} stats EOIP from {self.device.ip} for remote ip {ip}'
@@ -1104,33 +1920,313 @@ class CommandRunner_Remove(DeviceManagement):
                 self.logger.error.error(msg)
 
 
+class DeviceWorkQueue:
+    """
+    Очередь элементов (например IP) одного устройства, которую разбирают несколько рабочих сессий.
+    Кол-во сессий выбирается по размеру очереди, DEVICE_LIMIT и наблюдаемой задержке на один элемент,
+    размер порции - так, чтобы одна порция выполнялась около TARGET_BATCH_TIME секунд.
+    Свободная сессия сразу берет следующую порцию, поэтому большой СМ не ждет самый медленный срез.
+    """
+    TARGET_BATCH_TIME = 30  # сек на одну порцию
+    MIN_BATCH = 5
+    MAX_BATCH = 200
+    DEFAULT_LATENCY = 1.5  # сек на один элемент, пока задержка устройства не измерена
+
+    def __init__(self, device, items, job, max_workers=DEVICE_LIMIT, runner_class=None):
+        """
+        job(runner, items) - async функция обработки порции элементов на сессии runner
+        runner_class - класс CommandRunner_* рабочей сессии, по-умолчанию CommandRunner_Get
+        """
+        self.device = device
+        self.items = deque(items)
+        self.job = job
+        self.max_workers = max_workers
+        self.runner_class = runner_class or CommandRunner_Get
+
+    @property
+    def latency(self):
+        return self.device.probe_latency or self.DEFAULT_LATENCY
+
+    def get_batch_size(self):
+        return max(self.MIN_BATCH, min(self.MAX_BATCH, int(self.TARGET_BATCH_TIME / self.latency)))
+
+    def get_workers_count(self):
+        batches = -(-len(self.items) // self.get_batch_size())
+        return max(1, min(self.max_workers, batches))
+
+    def get_batch(self):
+        return [self.items.popleft() for _ in range(min(self.get_batch_size(), len(self.items)))]
+
+    def update_latency(self, elapsed, count):
+        latency = elapsed / count
+        if self.device.probe_latency is None:
+            self.device.probe_latency = latency
+        else:
+            self.device.probe_latency = 0.7 * self.device.probe_latency + 0.3 * latency
+
+    async def worker(self):
+        runner = self.runner_class(self.device)
+        while self.items:
+            batch = self.get_batch()
+            now = time.time()
+            await self.job(runner, batch)
+            self.update_latency(time.time() - now, len(batch))
+
+    def get_coroutines(self):
+        """
+        Корутины рабочих сессий для DevicesCommander
+        """
+        if not self.items:
+            return []
+        return [self.worker() for _ in range(self.get_workers_count())]
+
+
+class CommandScheduler:
+    """
+    Планировщик корутин для DevicesCommander.
+    Ограничивает общее кол-во одновременно выполняемых корутин (global_limit) и кол-во корутин
+    на одном устройстве (device_limit). Очередь каждого устройства упорядочена по приоритету (меньше - раньше),
+    при равном приоритете - FIFO.
+    """
+
+    def __init__(self, global_limit=GLOBAL_LIMIT, device_limit=DEVICE_LIMIT):
+        self.global_limit = global_limit
+        self.device_limit = device_limit
+        self._seq = count()
+        self._queues = dict()  # {key: [(priority, seq, coroutine, future), ...]}
+        self._ready = []  # [(priority, seq, key), ...] - кандидаты на запуск
+        self._dispatch_scheduled = False
+        self.queued = 0
+        self.in_flight = 0
+        self.in_flight_by_device = dict()  # {key: count}
+        self.done = 0
+        self.errors = 0
+
+    @staticmethod
+    def get_key(device):
+        """Ключ устройства для лимита device_limit, None - корутина не привязана к устройству"""
+        return device.key if device is not None else None
+
+    def submit(self, coroutine, device=None, priority=0):
+        """
+        Ставит корутину в очередь и возвращает future с её результатом.
+        device - устройство, на котором выполняется корутина (лимит device_limit),
+        None - корутина ограничивается только global_limit
+        """
+        future = asyncio.get_running_loop().create_future()
+        key = self.get_key(device)
+        seq = next(self._seq)
+        heappush(self._queues.setdefault(key, []), (priority, seq, coroutine, future))
+        heappush(self._ready, (priority, seq, key))
+        self.queued += 1
+        if not self._dispatch_scheduled:
+            # запуск откладывается до следующей итерации loop, чтобы корутины, поставленные в очередь
+            # одной пачкой, запускались с учетом приоритета
+            self._dispatch_scheduled = True
+            asyncio.get_running_loop().call_soon(self._dispatch)
+        return future
+
+    def _dispatch(self):
+        self._dispatch_scheduled = False
+        while self._ready and self.in_flight < self.global_limit:
+            _, _, key = heappop(self._ready)
+            queue = self._queues.get(key)
+            if not queue or key is not None and self.in_flight_by_device.get(key, 0) >= self.device_limit:
+                continue  # устройство снова станет кандидатом после завершения одной из его корутин
+            _, _, coroutine, future = heappop(queue)
+            self.queued -= 1
+            self.in_flight += 1
+            self.in_flight_by_device[key] = self.in_flight_by_device.get(key, 0) + 1
+            task = asyncio.ensure_future(coroutine)
+            task.add_done_callback(lambda task_, key_=key, future_=future: self._on_done(key_, future_, task_))
+
+    def _on_done(self, key, future, task):
+        self.in_flight -= 1
+        self.in_flight_by_device[key] -= 1
+        if not self.in_flight_by_device[key]:
+            del self.in_flight_by_device[key]
+        self.done += 1
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            self.errors += 1
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+        queue = self._queues.get(key)
+        if queue:
+            priority, seq, *_ = queue[0]
+            heappush(self._ready, (priority, seq, key))
+        elif queue is not None:
+            del self._queues[key]
+        self._dispatch()
+
+    def get_stats(self):
+        return {'queued': self.queued,
+                'in_flight': self.in_flight,
+                'devices_in_flight': len(self.in_flight_by_device),
+                'done': self.done,
+                'errors': self.errors}
+
+
 class DevicesCommander:
     """
     Класс реализует асинхронное выполнение команд сразу на нескольких устройствах
     """
 
-    def __init__(self, devices: Devices, coroutines: List[Coroutine] = None):
+    def __init__(self, devices: Devices, coroutines: List[Coroutine] = None,
+                 global_limit=GLOBAL_LIMIT, device_limit=DEVICE_LIMIT):
         self.devices = devices
-        self._coroutines = []
+        self._coroutines = []  # [(coroutine, device, priority), ...]
+        self.loop = None  # один event loop на все вызовы run(), чтобы сессии из SessionPool оставались живыми
+        self.scheduler = CommandScheduler(global_limit, device_limit)
         if not (coroutines is None):
             self.set_coroutines(coroutines)
 
-    def append_coroutine(self, coroutine: Coroutine):
-        self._coroutines.append(coroutine)
+    def append_coroutine(self, coroutine: Coroutine, device=None, priority=0):
+        """
+        priority - меньше значение, раньше запуск
+        device - устройство для ограничения DEVICE_LIMIT, None - без ограничения на устройство
+        """
+        self._coroutines.append((coroutine, device, priority))
 
-    def add_coroutines(self, coroutines: List[Coroutine]):
-        self._coroutines += coroutines
+    def add_coroutines(self, coroutines: List[Coroutine], priority=0, device=None):
+        """Корутины одного устройства device, см. append_coroutine"""
+        self._coroutines += [(coroutine, device, priority) for coroutine in coroutines]
 
     def set_coroutines(self, coroutines: List[Coroutine]):
-        self._coroutines = coroutines
+        self.clear_coroutines()
+        self.add_coroutines(coroutines)
 
     def clear_coroutines(self):
         self._coroutines = []
 
-    async def get_coroutines_for_run(self):
-        return await asyncio.gather(*self._coroutines)
+    def get_stats(self):
+        """
+        Глубина очереди и кол-во выполняемых корутин планировщика
+        """
+        return self.scheduler.get_stats()
+
+    async def get_coroutines_for_run(self, coroutines=None):
+        if coroutines is None:
+            coroutines, self._coroutines = self._coroutines, []
+        futures = [self.scheduler.submit(coroutine, device, priority) for coroutine, device, priority in coroutines]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                msg = f'! Error in coroutine: {result!r}'
+                print(msg)
+                self.devices.logger.error.error(msg)
+        msg = f'Run {len(coroutines)} coroutines complete. Scheduler stats: {self.get_stats()}'
+        self.devices.logger.root.info(msg)
+        return results
+
+    def get_loop(self):
+        if self.loop is None or self.loop.is_closed():
+            self.loop = asyncio.new_event_loop()
+        return self.loop
+
+    async def run_async(self, coroutines: List[Coroutine] = None, priority=0, device=None):
+        """
+        Выполняет корутины из очереди, либо только переданные coroutines устройства device, и возвращает их результаты.
+        Несколько вызовов могут выполняться одновременно (например, разные фазы) - лимиты планировщика общие
+        """
+        if coroutines is not None:
+            coroutines = [(coroutine, device, priority) for coroutine in coroutines]
+        return await self.get_coroutines_for_run(coroutines)
+
+    def run_until_complete(self, coroutine: Coroutine):
+        """
+        Выполняет coroutine в event loop DevicesCommander, например async функцию со всеми фазами задания
+        """
+        return self.get_loop().run_until_complete(coroutine)
 
     def run(self):
-        run_coroutines = self.get_coroutines_for_run()
-        asyncio.run(run_coroutines)
-        self.clear_coroutines()
+        return self.run_until_complete(self.run_async())
+
+    async def close_async(self):
+        pool = SessionPool()
+        await pool.close_all()
+        msg = f'Sessions opened - {pool.opened}, reused from pool - {pool.reused}.'
+        self.devices.logger.root.info(msg)
+        print(time.strftime("%H:%M:%S"), msg)
+
+    def close(self):
+        """
+        Закрывает все сессии из SessionPool и event loop
+        """
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.run_until_complete(self.close_async())
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    def __enter__(self):
+        self.get_loop()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close_async()
+
+
+class DevicePipeline:
+    """
+    Конвейер стадий для каждого устройства.
+    Стадия устройства запускается, как только на этом устройстве завершились её зависимости,
+    без ожидания остальных устройств. Стадия, вернувшая False или завершившаяся ошибкой,
+    останавливает зависящие от неё стадии этого устройства.
+    """
+
+    def __init__(self, devcom: DevicesCommander):
+        self.devcom = devcom
+        self.stages = dict()  # {name: (func, depends)}
+
+    def add_stage(self, name, func, depends=()):
+        """
+        func(device) - функция или async функция стадии
+        depends - имена ранее добавленных стадий, после которых запускается стадия
+        """
+        for depend in depends:
+            if depend not in self.stages:
+                raise ValueError(f'Unknown stage "{depend}" in depends of stage "{name}"')
+        self.stages[name] = (func, tuple(depends))
+        return self
+
+    async def _run_stage(self, device, name, func, depends):
+        if not all(await asyncio.gather(*depends)):
+            return False
+        try:
+            result = func(device)
+            if asyncio.iscoroutine(result):
+                result = await result
+        except Exception as err:
+            msg = f'! Error in stage "{name}" on {device.city} {device.ip} ({device.name}): {err!r}'
+            print(msg)
+            self.devcom.devices.logger.error.error(msg)
+            return False
+        return result is not False
+
+    async def run_device(self, device):
+        """
+        Выполняет все стадии одного устройства, возвращает {name: True|False}
+        """
+        tasks = dict()
+        for name, (func, depends) in self.stages.items():
+            tasks[name] = asyncio.ensure_future(self._run_stage(device, name, func, [tasks[d] for d in depends]))
+        return dict(zip(tasks, await asyncio.gather(*tasks.values())))
+
+    async def run_async(self, devices):
+        results = await asyncio.gather(*(self.run_device(device) for device in devices))
+        complete = {name: sum(result[name] for result in results) for name in self.stages}
+        msg = f'Pipeline for {len(devices)} hosts complete: {complete}'
+        self.devcom.devices.logger.root.info(msg)
+        print(time.strftime("%H:%M:%S"), msg)
+        return results
+
+    def run(self, devices):
+        return self.devcom.run_until_complete(self.run_async(devices))
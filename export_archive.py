@@ -0,0 +1,239 @@
+"""
+Архив "export compact" с адресацией по содержимому:
+    objects/<2 символа хэша>/<sha256>.gz - сжатый текст конфигурации, одинаковые конфигурации хранятся один раз
+    manifests/<дата>.json               - снимок на дату {ключ устройства: {'hash', 'city', 'name'}}
+    fingerprints.json                   - {ключ устройства: {'fingerprint', 'uptime', 'date', 'hash'}}
+Ключ устройства - Device.key (host:port): на одном IP могут быть разные устройства (проброс портов).
+Место на диске растет с кол-вом изменений конфигураций, а не с кол-вом дней * устройств.
+Хэш считается без первой строки экспорта "# <дата> by RouterOS ..." - она меняется при каждой загрузке.
+Объект хранит заголовок первой загрузки этого содержимого.
+По отпечатку CommandRunner_Get.get_config(archive=...) определяет, изменилась ли конфигурация с последней загрузки,
+и берет неизменившуюся конфигурацию из архива вместо полного "/export compact"
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+FILE_FINGERPRINTS = 'fingerprints.json'
+DIR_OBJECTS = 'objects'
+DIR_MANIFESTS = 'manifests'
+MAX_AGE = 2  # дней, после которых конфигурация загружается полностью, даже если отпечаток не изменился
+COMPRESS_LEVEL = 6  # 0 - без сжатия (объекты остаются в формате gzip)
+GZIP_WBITS = 31  # формат gzip - объекты читаются zcat
+ENCODING = 'utf-8'
+
+regex_header = re.compile(rb'\s*# [^\n]* by RouterOS[^\n]*\n')  # "# jul/11/2022 10:00:01 by RouterOS 6.48.6"
+
+
+def get_header_length(data):
+    """Длина строки-заголовка экспорта с датой в начале data (bytes), 0 - если заголовка нет"""
+    match = regex_header.match(data)
+    return match.end() if match else 0
+
+
+def write_file(filename, data):
+    """Запись через временный файл, чтобы прерванная запись не оставила обрезанный объект или манифест"""
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_filename, filename)
+
+
+def read_object(filename):
+    with open(filename, 'rb') as file:
+        return zlib.decompress(file.read(), GZIP_WBITS).decode(ENCODING)
+
+
+class ArchivedExport:
+    """
+    Ленивая ссылка на конфигурацию в архиве (Device.export_compact): текст читается при каждом обращении
+    и в памяти не хранится. Передается в процессы парсинга вместо текста
+    """
+    __slots__ = ('filename', 'hash')
+
+    def __init__(self, filename, hash_):
+        self.filename = filename
+        self.hash = hash_
+
+    def read(self):
+        return read_object(self.filename)
+
+
+class ExportWriter:
+    """
+    Потоковая запись объекта в архив: данные пишутся частями по мере чтения из канала,
+    хэш и сжатие считаются по ходу записи. close() -> хэш, abort() - отмена записи
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        dir_ = os.path.join(archive.dir, DIR_OBJECTS)
+        os.makedirs(dir_, exist_ok=True)
+        fd, self.tmp_filename = tempfile.mkstemp(suffix='.tmp', dir=dir_)
+        self.file = os.fdopen(fd, 'wb')
+        self.hash = hashlib.sha256()
+        self.compress = zlib.compressobj(archive.compress_level, zlib.DEFLATED, GZIP_WBITS)
+        self.size = 0
+        self._head = b''  # начало вывода до конца первой строки - заголовок в хэш не входит
+
+    def write(self, data):
+        if self._head is not None:
+            self._head += data
+            if b'\n' in self._head.lstrip():
+                self.update_head()
+        else:
+            self.hash.update(data)
+        self.file.write(self.compress.compress(data))
+        self.size += len(data)
+
+    def update_head(self):
+        self.hash.update(self._head[get_header_length(self._head):])
+        self._head = None
+
+    def close(self):
+        if self._head is not None:
+            self.update_head()
+        self.file.write(self.compress.flush())
+        self.file.close()
+        hash_ = self.hash.hexdigest()
+        filename = self.archive.get_object_name(hash_)
+        if os.path.exists(filename):
+            os.remove(self.tmp_filename)
+        else:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            os.replace(self.tmp_filename, filename)
+        return hash_
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_filename)
+
+
+class ExportArchive:
+
+    def __init__(self, dir_='export_compact', max_age=MAX_AGE, workers=None, compress_level=COMPRESS_LEVEL):
+        """workers - кол-во потоков распаковки в load_snapshot, None - по-умолчанию ThreadPoolExecutor"""
+        self.dir = dir_
+        self.max_age = max_age
+        self.workers = workers
+        self.compress_level = compress_level
+        self.filename = os.path.join(dir_, FILE_FINGERPRINTS)
+        self.fingerprints = self.load()
+
+    def load(self):
+        if os.path.exists(self.filename):
+            with open(self.filename, 'rt') as file:
+                return json.load(file)
+        return dict()
+
+    def save(self):
+        os.makedirs(self.dir, exist_ok=True)
+        write_file(self.filename, json.dumps(self.fingerprints, indent=1).encode())
+
+    @staticmethod
+    def get_hash(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def get_object_name(self, hash_):
+        return os.path.join(self.dir, DIR_OBJECTS, hash_[:2], hash_ + '.gz')
+
+    def get_manifest_name(self, date_):
+        return os.path.join(self.dir, DIR_MANIFESTS, date_ + '.json')
+
+    def has_object(self, hash_):
+        return os.path.exists(self.get_object_name(hash_))
+
+    def put(self, text):
+        """Сохраняет текст, если такого еще нет в архиве -> хэш"""
+        data = text.encode(ENCODING)
+        hash_ = self.get_hash(data[get_header_length(data):])
+        filename = self.get_object_name(hash_)
+        if not os.path.exists(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            compress = zlib.compressobj(self.compress_level, zlib.DEFLATED, GZIP_WBITS)
+            write_file(filename, compress.compress(data) + compress.flush())
+        return hash_
+
+    def open_writer(self):
+        return ExportWriter(self)
+
+    def get_object(self, hash_):
+        return read_object(self.get_object_name(hash_))
+
+    def get_handle(self, hash_):
+        return ArchivedExport(self.get_object_name(hash_), hash_)
+
+    def get_dates(self):
+        """Даты сохраненных снимков по возрастанию"""
+        dir_ = os.path.join(self.dir, DIR_MANIFESTS)
+        if not os.path.exists(dir_):
+            return []
+        return sorted(name[:-len('.json')] for name in os.listdir(dir_) if name.endswith('.json'))
+
+    def save_manifest(self, date_, manifest):
+        """manifest = {ключ устройства: {'hash', 'city', 'name'}}, дополняет снимок на дату date_"""
+        os.makedirs(os.path.join(self.dir, DIR_MANIFESTS), exist_ok=True)
+        snapshot = self.load_manifest(date_)
+        snapshot.update(manifest)
+        write_file(self.get_manifest_name(date_), json.dumps(snapshot, ensure_ascii=False, indent=1).encode())
+
+    def load_manifest(self, date_):
+        filename = self.get_manifest_name(date_)
+        if not os.path.exists(filename):
+            return dict()
+        with open(filename, 'rt', encoding=ENCODING) as file:
+            return json.load(file)
+
+    def get_snapshot_manifest(self, date_=None, keys=None):
+        """Манифест снимка на дату date_ (None - последний снимок), keys - только эти устройства"""
+        if date_ is None:
+            dates = self.get_dates()
+            if not dates:
+                return dict()
+            date_ = dates[-1]
+        manifest = self.load_manifest(date_)
+        if keys is not None:
+            manifest = {key: manifest[key] for key in keys if key in manifest}
+        return manifest
+
+    def load_snapshot(self, date_=None, keys=None):
+        """
+        Конфигурации снимка -> {ключ устройства: text}, см. get_snapshot_manifest.
+        Объекты распаковываются параллельно, каждый хэш читается один раз
+        """
+        manifest = self.get_snapshot_manifest(date_, keys)
+        hashes = list({entry['hash'] for entry in manifest.values()})
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            texts = dict(zip(hashes, executor.map(self.get_object, hashes)))
+        return {key: texts[entry['hash']] for key, entry in manifest.items()}
+
+    def load_handles(self, date_=None, keys=None):
+        """Как load_snapshot, но без чтения объектов -> {ключ устройства: ArchivedExport}"""
+        manifest = self.get_snapshot_manifest(date_, keys)
+        return {key: self.get_handle(entry['hash']) for key, entry in manifest.items()}
+
+    def get(self, key, fingerprint, uptime):
+        """
+        Запись отпечатка, если конфигурация устройства key не изменилась, иначе None.
+        Перезагрузка (uptime меньше сохраненного) сбрасывает историю изменений на устройстве - считается изменением
+        """
+        entry = self.fingerprints.get(key)
+        if entry is None or entry['fingerprint'] != fingerprint or uptime < entry['uptime']:
+            return None
+        if (date.today() - date.fromisoformat(entry['date'])).days > self.max_age:
+            return None
+        if 'hash' not in entry or not self.has_object(entry['hash']):
+            return None
+        return entry
+
+    def read(self, entry):
+        return self.get_object(entry['hash'])
+
+    def update(self, key, hash_, fingerprint, uptime, date_):
+        """date_ - дата полной загрузки конфигурации с устройства"""
+        self.fingerprints[key] = dict(fingerprint=fingerprint, uptime=uptime, date=date_, hash=hash_)
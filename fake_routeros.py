@@ -0,0 +1,252 @@
+"""
+Локальные заменители RouterOS для проверки DeviceManagement / CommandRunner_* без реальных устройств.
+
+FakeSshFleet - N виртуальных устройств RouterOS на localhost, каждое на своем SSH порту (asyncssh).
+Устройство отвечает на команды CommandRunner_Get / Put / Remove синтетическим выводом,
+задержки (latency, handshake, ping_delay) и размер вывода (objects) настраиваются.
+    fleet = FakeSshFleet(100, latency=0.02, objects=200)
+    ports = await fleet.start()
+Запуск парка в отдельном процессе - run_fleet(), используется в bench_devicecontrol.py.
+Сервер RouterOS API - fake_routeros_api.FakeApiServer (без asyncssh)
+"""
+import asyncio
+import re
+import zlib
+
+import asyncssh
+
+
+class FakeDevice:
+    """
+    Синтетическое состояние одного устройства: objects EOIP с бриджами и вланами, PPP secrets и активные сессии.
+    Команды сопоставляются с обработчиками по регулярным выражениям COMMANDS (первое совпадение)
+    """
+    PING_COUNT = 5
+
+    COMMANDS = [
+        (r':foreach ip in=\{(.*?)\} do=\{:execute .*/ping', 'ping_batch'),
+        (r'^/ping (\S+)', 'ping'),
+        (r'^:foreach i in=\{(.*?)\} do=\{:put', 'batch_check'),
+        (r'^:foreach i in=\{(.*?)\} do=\{\S.*? (disable|enable) \[find', 'batch_write'),
+        (r'^:foreach r in=\[/interface eoip print', 'eoip_remote'),
+        (r'^:foreach r in=\[/interface print stats', 'eoip_stats'),
+        (r'^:local ips \[/ip address print', 'ip_mask_30'),
+        (r'^:local eoipname .*remote-address=(\S+?)\].*:put', 'eoip_stats_by_ip'),
+        (r'^:local txorrx', 'eoip_sum_by_ip'),
+        (r'^/export compact file=', 'config_fingerprint'),
+        (r'count-only', 'count'),
+        (r'^/export compact', 'export'),
+        (r'^/ppp active pr', 'ppp_active'),
+        (r'^/system identity print', 'identity'),
+        (r'^/system resource print', 'resource'),
+        (r'^/system routerboard print', 'routerboard'),
+        (r'reset-counters| (disable|enable|remove) \[find| print where', 'empty'),
+    ]
+
+    def __init__(self, index, objects=100, latency=0.0, ping_delay=0.0, ping_loss=0.1):
+        self.index = index
+        self.name = f'CM-{index}'
+        self.objects = objects
+        self.latency = latency
+        self.ping_delay = ping_delay
+        self.ping_loss = ping_loss
+        self.disabled = set()
+        self.history = 0  # кол-во изменений конфигурации (/system history)
+        self.commands = [(re.compile(regex), getattr(self, handler)) for regex, handler in self.COMMANDS]
+
+    @staticmethod
+    def remote_ip(i):
+        return f'10.{(i // 250) // 250 % 250}.{(i // 250) % 250}.{i % 250 + 1}'
+
+    def received(self, ip):
+        # детерминированная "недоступность" части адресов
+        return 0 if zlib.crc32(ip.encode()) % 100 < self.ping_loss * 100 else self.PING_COUNT
+
+    async def answer(self, command):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for regex, handler in self.commands:
+            match = regex.search(command)
+            if match:
+                return await handler(match)
+        return f'bad command name {command.split(" ")[0]}'
+
+    async def ping_batch(self, match):
+        # IP пачки пингуются одновременно (задания :execute) - время одного ping на всю пачку
+        ips = [ip for ip in match.group(1).split(';') if ip]
+        await asyncio.sleep(self.ping_delay)
+        return '\n'.join(f'{ip};{self.received(ip)}' for ip in ips)
+
+    async def ping(self, match):
+        await asyncio.sleep(self.ping_delay)
+        received = self.received(match.group(1))
+        loss = 100 * (self.PING_COUNT - received) // self.PING_COUNT
+        return f'  SEQ HOST                                     SIZE TTL TIME  STATUS\n' \
+               f'    sent={self.PING_COUNT} received={received} packet-loss={loss}%'
+
+    async def batch_check(self, match):
+        items = [item.strip('"') for item in match.group(1).split(';') if item]
+        return '\n'.join(f'{item};1;{int(item in self.disabled)}' for item in items)
+
+    async def batch_write(self, match):
+        items = {item.strip('"') for item in match.group(1).split(';') if item}
+        if match.group(2) == 'disable':
+            self.disabled |= items
+        else:
+            self.disabled -= items
+        self.history += 1
+        return ''
+
+    async def eoip_remote(self, match):
+        return '\n'.join(f'.id=*{i:X};name=eoip-{i};remote-address={self.remote_ip(i)}' for i in range(self.objects))
+
+    async def eoip_stats(self, match):
+        return '\n'.join(f'.id=*{i:X};disabled={str(f"eoip-{i}" in self.disabled).lower()};name=eoip-{i};'
+                         f'running=true;rx-byte={i * 1000};tx-byte={i * 100}' for i in range(self.objects))
+
+    async def ip_mask_30(self, match):
+        return '\n'.join(f'.id=*{i:X};address=172.16.{i // 64}.{i % 64 * 4 + 1}/30;disabled=false;'
+                         f'interface=vlan-{i}' for i in range(self.objects // 4))
+
+    async def eoip_stats_by_ip(self, match):
+        return '.id=*1;name=eoip-1;type=eoip-tunnel;running=true;disabled=false;rx-byte=1000;tx-byte=100'
+
+    async def eoip_sum_by_ip(self, match):
+        return '1000'
+
+    async def config_fingerprint(self, match):
+        length = len((await self.export(None)).encode())
+        return f'uptime=2w3d04:05:06;length={length};history={self.history}'
+
+    async def count(self, match):
+        return str(self.objects)
+
+    async def export(self, match):
+        lines = [f'# {self.name}', '/interface bridge']
+        lines += [f'add name=bridge-{i}' for i in range(self.objects)]
+        lines += ['/interface eoip']
+        lines += [f'add name=eoip-{i} remote-address={self.remote_ip(i)} tunnel-id={i}' for i in range(self.objects)]
+        lines += ['/interface vlan']
+        lines += [f'add interface=eoip-{i} name=vlan-{i} vlan-id={i % 4000 + 1}' for i in range(0, self.objects, 2)]
+        lines += ['/interface bridge port']
+        lines += [f'add bridge=bridge-{i} interface=vlan-{i}' for i in range(0, self.objects, 2)]
+        lines += ['/ppp secret']
+        lines += [f'add name=ppp-{i} remote-address={self.remote_ip(i)} service=pptp' for i in range(self.objects)]
+        return '\n'.join(lines)
+
+    async def ppp_active(self, match):
+        return 'Flags: R - RADIUS \n' + '\n'.join(
+            f' {i}   name="ppp-{i}" service=pptp caller-id="192.168.{i // 250 % 250}.{i % 250}" '
+            f'address={self.remote_ip(i)} uptime=1d2h3m \n     encoding="MPPE128 stateless" '
+            f'session-id=0x{i:X} limit-bytes-in=0 limit-bytes-out=0 ' for i in range(0, self.objects, 2))
+
+    async def identity(self, match):
+        return f'  name: {self.name}'
+
+    async def resource(self, match):
+        return '                   uptime: 2w3d04:05:06\n                  version: 6.48.6 (long-term)\n' \
+               '               board-name: CCR1036-8G-2S+\n'
+
+    async def routerboard(self, match):
+        return f'       routerboard: yes\n     serial-number: FAKE{self.index:06}\n'
+
+    async def empty(self, match):
+        return ''
+
+
+class FakeSshServer(asyncssh.SSHServer):
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    async def validate_password(self, username, password):
+        if self.fleet.handshake:
+            await asyncio.sleep(self.fleet.handshake)
+        # драйвер RouterOS может добавлять к логину параметры терминала после "+"
+        return username.split('+')[0] == self.fleet.username and password == self.fleet.password
+
+
+class FakeSshFleet:
+
+    def __init__(self, count, username='admin', password='admin', host='127.0.0.1', latency=0.0, handshake=0.0,
+                 ping_delay=0.0, objects=100):
+        """
+        latency - задержка ответа на каждую команду, handshake - задержка проверки пароля при подключении,
+        ping_delay - время ping одного IP, objects - кол-во EOIP/PPP (размер вывода) на устройстве
+        """
+        self.username = username
+        self.password = password
+        self.host = host
+        self.handshake = handshake
+        self.devices = [FakeDevice(i, objects, latency, ping_delay) for i in range(count)]
+        self.ports = []
+        self._servers = []
+
+    async def handle_process(self, device, process):
+        prompt = f'[{self.username}@{device.name}] > '
+        process.stdout.write(prompt)
+        while not process.stdin.at_eof():
+            try:
+                line = await process.stdin.readline()
+            except (asyncssh.TerminalSizeChanged, asyncssh.BreakReceived):
+                continue
+            except (asyncssh.Error, ConnectionError):
+                break
+            command = line.strip()
+            if command:
+                output = await device.answer(command)
+                if output:
+                    process.stdout.write(output.replace('\n', '\r\n') + '\r\n')
+            process.stdout.write(prompt)
+        process.exit(0)
+
+    async def start(self):
+        """Запускает SSH сервер каждого устройства на свободном порту, возвращает список портов"""
+        host_key = asyncssh.generate_private_key('ssh-ed25519')
+        for device in self.devices:
+            server = await asyncssh.create_server(lambda: FakeSshServer(self), self.host, 0,
+                                                  server_host_keys=[host_key],
+                                                  process_factory=lambda process, device=device:
+                                                  self.handle_process(device, process))
+            self._servers.append(server)
+            self.ports.append(server.sockets[0].getsockname()[1])
+        return self.ports
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+
+
+def run_fleet(count, conn, **params):
+    """
+    Парк в отдельном процессе: порты отправляются в conn (multiprocessing.Pipe), парк работает до получения
+    любого сообщения из conn
+    """
+    async def run():
+        fleet = FakeSshFleet(count, **params)
+        conn.send(await fleet.start())
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        await fleet.close()
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    import sys
+
+    async def main(count):
+        fleet = FakeSshFleet(count)
+        ports = await fleet.start()
+        print(f'{count} fake RouterOS devices on {fleet.host}, ports {ports[0]}..{ports[-1]}, '
+              f'login {fleet.username}/{fleet.password}')
+        await asyncio.Event().wait()
+
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10))
@@ -0,0 +1,122 @@
+"""
+Локальный заменитель сервера RouterOS API для проверки routeros_api и CommandRunner_* с transport: api
+без реальных устройств, только стандартная библиотека.
+
+FakeApiServer - сервер RouterOS API: /login, print по меню из tables (с .proplist, count-only и ?key=value),
+/cancel, ответы на запросы с .tag выдаются независимо, в порядке готовности.
+    server = FakeApiServer({'/ppp/active': [{'name': 'u1', 'address': '10.0.0.1'}]})
+    port = await server.start()
+"""
+import asyncio
+
+import routeros_api
+
+
+class FakeApiServer:
+
+    def __init__(self, tables=None, username='admin', password='', host='127.0.0.1', port=0, latency=0.0):
+        """
+        tables - {'/interface/eoip': [{'name': 'eoip1', 'remote-address': '10.0.0.1'}, ...]}
+        латентность latency (сек) добавляется к каждому ответу
+        """
+        self.tables = tables or dict()
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.requests = 0
+        self.cancelled = []  # теги, отмененные /cancel
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    @staticmethod
+    def match(record, queries):
+        for query in queries:
+            key, _, value = query.partition('=')
+            if record.get(key, '') != value:
+                return False
+        return True
+
+    def get_replies(self, words):
+        """
+        Ответ на одно предложение: список предложений без .tag
+        """
+        command = words[0]
+        attrs = dict()
+        queries = []
+        for word in words[1:]:
+            if word.startswith('='):
+                key, _, value = word[1:].partition('=')
+                attrs[key] = value
+            elif word.startswith('?'):
+                queries.append(word[1:])
+        if command == '/login':
+            if attrs.get('name') == self.username and attrs.get('password') == self.password:
+                return [['!done']]
+            return [['!trap', '=message=invalid user name or password (6)'], ['!done']]
+        path, _, action = command.rpartition('/')
+        if action != 'print' or path not in self.tables:
+            return [['!trap', '=message=no such command'], ['!done']]
+        records = [record for record in self.tables[path] if self.match(record, queries)]
+        if 'count-only' in attrs:
+            return [['!done', f'=ret={len(records)}']]
+        proplist = attrs['.proplist'].split(',') if '.proplist' in attrs else None
+        replies = []
+        for record in records:
+            keys = proplist if proplist is not None else record.keys()
+            replies.append(['!re'] + [f'={key}={record[key]}' for key in keys if key in record])
+        return replies + [['!done']]
+
+    async def reply(self, writer, words):
+        tag = [word for word in words if word.startswith('.tag=')]
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for sentence in self.get_replies([word for word in words if not word.startswith('.tag=')]):
+            writer.write(routeros_api.encode_sentence(sentence + tag))
+        await writer.drain()
+
+    def cancel(self, writer, words, tasks):
+        """
+        /cancel =tag=<tag>: выполнение запроса прерывается, на его тег - !trap interrupted и !done
+        """
+        _, attrs, tag = routeros_api.parse_sentence(words)
+        task = tasks.pop(attrs.get('tag'), None)
+        if task is not None and not task.done():
+            task.cancel()
+            self.cancelled.append(attrs['tag'])
+            writer.write(routeros_api.encode_sentence(
+                ['!trap', '=category=2', '=message=interrupted', f'.tag={attrs["tag"]}']))
+            writer.write(routeros_api.encode_sentence(['!done', f'.tag={attrs["tag"]}']))
+        writer.write(routeros_api.encode_sentence(['!done'] + ([f'.tag={tag}'] if tag is not None else [])))
+
+    async def handle(self, reader, writer):
+        tasks = dict()  # {tag: задача ответа}
+        try:
+            while True:
+                words = await routeros_api.read_sentence(reader)
+                if not words:
+                    continue
+                self.requests += 1
+                if words[0] == '/cancel':
+                    self.cancel(writer, words, tasks)
+                    continue
+                _, _, tag = routeros_api.parse_sentence(words)
+                task = asyncio.get_running_loop().create_task(self.reply(writer, words))
+                tasks[tag] = task
+                task.add_done_callback(lambda _, tag=tag: tasks.pop(tag, None))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            writer.close()
@@ -0,0 +1,149 @@
+"""
+Анализ динамики доступности IP по истории ICMP (icmp_history): история всех городов загружается одним запросом
+в матрицу IP x дата (1 - доступен, 0 - нет, NaN - проверки не было), метрики считаются по матрице целиком:
+    ICMP TOTAL, TRUE ICMP ALL TIME, TRUE ICMP LAST WEEK - как в прежней сводке analyzeDynamicICMP
+                        (LAST WEEK - по последним датам опроса своего СМ)
+    RATIO LAST <N>D   - доля успешных проверок за последние N дат проверок всех СМ (скользящее окно)
+    FAIL STREAK       - текущая серия недоступности, дат подряд до последней даты
+    MAX FAIL STREAK   - самая длинная серия недоступности
+    FLAPS             - кол-во смен состояния доступен/недоступен
+Пропуск даты (СМ не опрошен) сохраняет предыдущее состояние IP для серий и смен состояния.
+
+    python icmp_analytics.py icmp_history.sqlite summary_ip_free_dynamic.xlsx --type ip_free --windows 7 30
+"""
+import argparse
+
+import numpy
+import pandas
+
+import reports
+from icmp_history import IcmpHistory, ICMP_RECEIVED_MIN, LAST_DAYS, SUMMARY_COLUMNS
+
+WINDOWS = (LAST_DAYS, 30)  # окна RATIO LAST <N>D, дат проверок
+INFO_COLUMNS = ['Remote IP', 'CityCM', 'CMikroTik Name', 'CMikroTik IP']
+METRIC_COLUMNS = ['FAIL STREAK', 'MAX FAIL STREAK', 'FLAPS']  # после RATIO LAST <N>D
+
+
+def load_matrix(history, type_ip_list, city=None):
+    """
+    История одной выборкой по индексу -> (info, dates, matrix): info - DataFrame INFO_COLUMNS по строкам матрицы
+    (по городу, СМ и IP), dates - даты проверок по возрастанию, matrix - numpy float32 IP x дата
+    """
+    # город и имя СМ - по последней дате проверки СМ
+    cursor = history.connection.execute(
+        'SELECT last.cm_ip, icmp.city, icmp.cm_name FROM '
+        '(SELECT cm_ip, MAX(date) AS date FROM icmp WHERE type = :type GROUP BY cm_ip) AS last '
+        'JOIN icmp ON icmp.date = last.date AND icmp.type = :type AND icmp.cm_ip = last.cm_ip '
+        'GROUP BY last.cm_ip', dict(type=type_ip_list))
+    cms = pandas.DataFrame(cursor.fetchall(), columns=['cm_ip', 'city', 'cm_name']).set_index('cm_ip')
+    if city is not None:
+        cms = cms[cms['city'] == city]
+    # только столбцы индекса icmp_ip - выборка без обращения к строкам таблицы
+    query = f'SELECT date, cm_ip, ip, received >= {ICMP_RECEIVED_MIN} FROM icmp WHERE type = ?'
+    params = [type_ip_list]
+    if city is not None:
+        query += f' AND cm_ip IN ({", ".join("?" * len(cms))})'
+        params += list(cms.index)
+    cursor = history.connection.execute(query, params)
+    data = pandas.DataFrame(cursor.fetchall(), columns=['date', 'cm_ip', 'ip', 'success'])
+
+    date_codes, dates = pandas.factorize(data['date'], sort=True)
+    cm_codes, cm_ips = pandas.factorize(data['cm_ip'])
+    ip_codes, ips = pandas.factorize(data['ip'])
+    keys, rows = numpy.unique(cm_codes.astype(numpy.int64) * len(ips) + ip_codes, return_inverse=True)
+    matrix = numpy.full((len(keys), len(dates)), numpy.nan, dtype=numpy.float32)
+    matrix[rows, date_codes] = data['success'].to_numpy()
+
+    cm_ip = numpy.asarray(cm_ips, dtype=object)[keys // max(len(ips), 1)]
+    ip = numpy.asarray(ips, dtype=object)[keys % max(len(ips), 1)]
+    cms = cms.reindex(cm_ip)
+    info = pandas.DataFrame({'Remote IP': ip, 'CityCM': cms['city'].to_numpy(),
+                             'CMikroTik Name': cms['cm_name'].to_numpy(), 'CMikroTik IP': cm_ip})
+    order = numpy.lexsort((ip, cm_ip, info['CityCM'].to_numpy()))
+    return info.iloc[order].reset_index(drop=True), list(dates), matrix[order]
+
+
+def get_streaks(fail):
+    """
+    fail - bool массив IP x дата -> длина серии True, заканчивающейся на каждой дате
+    """
+    total = numpy.cumsum(fail, axis=1)
+    last_reset = numpy.maximum.accumulate(numpy.where(fail, 0, total), axis=1)
+    return total - last_reset
+
+
+def get_rolling_ratio(matrix, window):
+    """
+    Доля успешных проверок в окне из window последних дат на каждую дату, пропуски не учитываются
+    (NaN, если в окне не было проверок). Суммы окон - разность накопленных сумм
+    """
+    checked = ~numpy.isnan(matrix)
+    success = numpy.pad(numpy.cumsum(numpy.where(checked, matrix, 0), axis=1), ((0, 0), (1, 0)))
+    count = numpy.pad(numpy.cumsum(checked, axis=1), ((0, 0), (1, 0)))
+    start = numpy.maximum(numpy.arange(matrix.shape[1]) + 1 - window, 0)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return (success[:, 1:] - success[:, start]) / (count[:, 1:] - count[:, start])
+
+
+def fill_forward(matrix):
+    """Пропуск даты заменяется предыдущим состоянием IP, пропуски до первой проверки остаются NaN"""
+    columns = numpy.where(~numpy.isnan(matrix), numpy.arange(matrix.shape[1]), 0)
+    columns = numpy.maximum.accumulate(columns, axis=1)
+    return matrix[numpy.arange(matrix.shape[0])[:, None], columns]
+
+
+def get_metrics(info, matrix, windows=WINDOWS, last_days=LAST_DAYS):
+    """Сводка по матрице load_matrix -> DataFrame со столбцами icmp_history.SUMMARY_COLUMNS и метриками модуля"""
+    result = info.copy()
+    if not matrix.shape[1]:  # пустая история - те же столбцы без строк
+        columns = list(SUMMARY_COLUMNS[len(INFO_COLUMNS):])
+        columns += [f'RATIO LAST {window}D' for window in windows] + METRIC_COLUMNS
+        for column in columns:
+            result[column] = []
+        return result
+    # даты, в которые опрашивался СМ строки: ICMP TOTAL - их кол-во, TRUE ICMP LAST WEEK - по last_days последним
+    # из них, как по последним столбцам-датам прежнего отчета по устройству
+    cm_codes, _ = pandas.factorize(info['CMikroTik IP'])
+    cm_checked = pandas.DataFrame(~numpy.isnan(matrix)).groupby(cm_codes).any().to_numpy()[cm_codes]
+    cm_last = cm_checked & (numpy.cumsum(cm_checked[:, ::-1], axis=1)[:, ::-1] <= last_days)
+    result['ICMP TOTAL'] = cm_checked.sum(axis=1)
+    result['TRUE ICMP ALL TIME'] = numpy.nansum(matrix, axis=1).astype(int)
+    result['TRUE ICMP LAST WEEK'] = numpy.nansum(numpy.where(cm_last, matrix, numpy.nan), axis=1).astype(int)
+    for window in windows:
+        result[f'RATIO LAST {window}D'] = get_rolling_ratio(matrix, window)[:, -1].round(3)
+    filled = fill_forward(matrix)
+    streaks = get_streaks(filled == 0)
+    result['FAIL STREAK'] = streaks[:, -1]
+    result['MAX FAIL STREAK'] = streaks.max(axis=1)
+    result['FLAPS'] = (numpy.abs(numpy.diff(filled, axis=1)) == 1).sum(axis=1)
+    return result
+
+
+def analyze(history_file, type_ip_list='ip_free', city=None, windows=WINDOWS, last_days=LAST_DAYS):
+    with IcmpHistory(history_file) as history:
+        info, dates, matrix = load_matrix(history, type_ip_list, city)
+    return get_metrics(info, matrix, windows, last_days)
+
+
+def save_report(history_file, output_file, type_ip_list='ip_free', city=None, windows=WINDOWS,
+                last_days=LAST_DAYS):
+    """Сводка analyze в файл, формат - по расширению output_file (см. reports) -> кол-во строк"""
+    result = analyze(history_file, type_ip_list, city, windows, last_days)
+    return reports.write_columns(output_file, {column: result[column].tolist() for column in result.columns})
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='ICMP availability analytics over icmp_history')
+    parser.add_argument('history_file')
+    parser.add_argument('output_file')
+    parser.add_argument('--type', default='ip_free', choices=('ip_free', 'ip_in_tu'))
+    parser.add_argument('--city', default=None)
+    parser.add_argument('--windows', type=int, nargs='+', default=list(WINDOWS), help='окна RATIO LAST <N>D')
+    parser.add_argument('--last-days', type=int, default=LAST_DAYS, help='дат в TRUE ICMP LAST WEEK')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    rows = save_report(args.history_file, args.output_file, args.type, args.city, args.windows, args.last_days)
+    print(f'save file {args.output_file}, {rows} rows')
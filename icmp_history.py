@@ -0,0 +1,154 @@
+"""
+История проверок ICMP в SQLite: одна строка на (дата, тип списка, СМ, IP), только добавление.
+Первичный ключ начинается с даты - строки одного дня лежат рядом, запуск дописывает только сегодняшние строки,
+повторный запуск в тот же день заменяет их. Отчеты (история по устройству, сводка доступности) строятся запросами.
+
+    history = IcmpHistory('icmp_history.sqlite')
+    history.append('ip_free', '2022-07-11', [(city, cm_name, cm_ip, ip, sent, received), ...])
+    history.get_summary('ip_free')
+"""
+import glob
+import os
+import re
+import sqlite3
+from datetime import date
+
+ICMP_RECEIVED_MIN = 3  # минимальное кол-во ответов ping, при котором IP считается доступным
+PING_COUNT = 5
+LAST_DAYS = 7  # дней в TRUE ICMP LAST WEEK сводки
+
+regex_icmp_text = re.compile(r'Успешно (\d+) из (\d+)')
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS icmp (
+    date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    city TEXT,
+    cm_name TEXT,
+    cm_ip TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    sent INTEGER,
+    received INTEGER,
+    PRIMARY KEY (date, type, cm_ip, ip)
+) WITHOUT ROWID;
+-- покрывающий индекс для выборки истории по IP: date входит в индекс как часть первичного ключа
+CREATE INDEX IF NOT EXISTS icmp_ip ON icmp (type, cm_ip, ip, received);
+CREATE VIEW IF NOT EXISTS icmp_result AS
+    SELECT *, received >= {ICMP_RECEIVED_MIN} AS success FROM icmp;
+'''
+
+SUMMARY_COLUMNS = ('Remote IP', 'CityCM', 'CMikroTik Name', 'CMikroTik IP',
+                   'ICMP TOTAL', 'TRUE ICMP ALL TIME', 'TRUE ICMP LAST WEEK')
+
+
+def get_icmp_text(sent, received):
+    """Текст результата как в отчетах ICMP"""
+    if received >= ICMP_RECEIVED_MIN:
+        return f'Успешно {received} из {sent}. Потерь - {100 * (sent - received) // sent}%'
+    return 'FALSE'
+
+
+def parse_icmp_text(text):
+    """Текст результата из старых xlsx отчетов -> (sent, received) или None"""
+    match = regex_icmp_text.search(str(text))
+    if match:
+        return int(match.group(2)), int(match.group(1))
+    if str(text).upper() == 'FALSE':  # pandas.read_excel читает столбец только из FALSE как bool
+        return PING_COUNT, 0
+    return None
+
+
+class IcmpHistory:
+
+    def __init__(self, filename='icmp_history.sqlite'):
+        self.filename = filename
+        dir_ = os.path.dirname(filename)
+        if dir_:
+            os.makedirs(dir_, exist_ok=True)
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def append(self, type_ip_list, date_, rows):
+        """
+        Добавляет результаты одного дня. rows = [(city, cm_name, cm_ip, ip, sent, received)] -> кол-во строк.
+        Прежние строки этого дня по СМ из rows удаляются в той же транзакции - повторный запуск в тот же день
+        заменяет результаты СМ целиком, IP, которых нет в новом запуске, не остаются в истории
+        """
+        date_ = str(date_ or date.today())
+        rows = list(rows)
+        with self.connection:
+            self.connection.executemany(
+                'DELETE FROM icmp WHERE date = ? AND type = ? AND cm_ip = ?',
+                ((date_, type_ip_list, cm_ip) for cm_ip in {row[2] for row in rows}))
+            cursor = self.connection.executemany(
+                'INSERT OR REPLACE INTO icmp VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                ((date_, type_ip_list, *row) for row in rows))
+        return cursor.rowcount
+
+    def get_dates(self, type_ip_list):
+        return [row[0] for row in self.connection.execute(
+            'SELECT DISTINCT date FROM icmp WHERE type = ? ORDER BY date', (type_ip_list,))]
+
+    def get_device_history(self, type_ip_list, cm_ip):
+        """
+        История одного СМ в форме прежних отчетов: {ip: {дата: текст результата}}
+        """
+        history = dict()
+        for ip, date_, sent, received in self.connection.execute(
+                'SELECT ip, date, sent, received FROM icmp WHERE type = ? AND cm_ip = ? ORDER BY ip, date',
+                (type_ip_list, cm_ip)):
+            history.setdefault(ip, dict())[date_] = get_icmp_text(sent, received)
+        return history
+
+    def get_summary(self, type_ip_list, last_days=LAST_DAYS, city=None):
+        """
+        Сводка доступности IP за всё время и за последние last_days дат проверок -> [запись SUMMARY_COLUMNS].
+        ICMP TOTAL - кол-во дат проверок СМ, как кол-во столбцов-дат в прежнем отчете по устройству.
+        Последние last_days дат - свои для каждого СМ, как последние столбцы-даты прежнего отчета по устройству
+        """
+        query = f'''
+            WITH cm_dates AS (SELECT DISTINCT cm_ip, date FROM icmp WHERE type = :type),
+                 last AS (SELECT cm_ip, date,
+                                 ROW_NUMBER() OVER (PARTITION BY cm_ip ORDER BY date DESC) <= :last_days AS is_last
+                          FROM cm_dates),
+                 total AS (SELECT cm_ip, COUNT(*) AS days FROM cm_dates GROUP BY cm_ip)
+            SELECT ip, city, cm_name, icmp.cm_ip,
+                   total.days,
+                   SUM(received >= {ICMP_RECEIVED_MIN}),
+                   SUM(received >= {ICMP_RECEIVED_MIN} AND last.is_last)
+            FROM icmp JOIN total ON total.cm_ip = icmp.cm_ip
+                 JOIN last ON last.cm_ip = icmp.cm_ip AND last.date = icmp.date
+            WHERE type = :type AND (:city IS NULL OR city = :city)
+            GROUP BY icmp.cm_ip, ip
+            ORDER BY city, icmp.cm_ip, ip'''
+        cursor = self.connection.execute(query, dict(type=type_ip_list, last_days=last_days, city=city))
+        return [dict(zip(SUMMARY_COLUMNS, row)) for row in cursor]
+
+    def import_xlsx(self, type_ip_list, dir_path, file_mask):
+        """
+        Загрузка истории из прежних отчетов save_icmp_result_to_files: строка - IP, столбец - дата,
+        + столбцы City, CMikroTik Name, CMikroTik IP -> кол-во строк
+        """
+        import pandas
+        count = 0
+        for filename in glob.glob(os.path.join(dir_path, file_mask)):
+            data = pandas.read_excel(filename, index_col=0)
+            info = data[['City', 'CMikroTik Name', 'CMikroTik IP']]
+            for column in data.columns.drop(['City', 'CMikroTik Name', 'CMikroTik IP']):
+                date_ = str(pandas.Timestamp(column).date())
+                rows = []
+                for ip, text, city, cm_name, cm_ip in zip(data.index, data[column], *(info[c] for c in info)):
+                    result = parse_icmp_text(text)
+                    if result is not None:
+                        rows.append((city, cm_name, cm_ip, ip, *result))
+                count += self.append(type_ip_list, date_, rows)
+        return count
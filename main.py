@@ -1,13 +1,15 @@
-import json
+import asyncio
 import os.path
 import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 import pandas
 
 import devicecontrol as dc
+import reports
 # from devicecontrol import DevicesCommander, CommandRunner_Get
-import tools
+from parse_config.parse_config import parse_config_result
 
 # REMOTE_NODE_FILE = 'remote_node.yaml'
 REMOTE_CM_LIST = 'cm_list_for_run_new.xlsx'
@@ -24,9 +26,6 @@ FILE_NAME_PPR_IP_FREE = 'ppr_ip_free_2022-07-11.xlsx'
 # FILE_NAME_PPR_IP_FREE = 'summary_ip_free_resoult.xlsx'
 # FILE_NAME_PPR_IP_FREE = 'ppr_ip_free_test.xlsx'
 
-SLICE = 200  # максимальное кол-во ip адресов для проверки в одном потоке
-SLICE_STATS = 100  # максимальное кол-во ip адресов для получения статистики в одном потоке
-
 
 def main():
     devices = dc.Devices()
@@ -39,92 +38,96 @@ def main():
     # devices.load_from_excel(DISABLE_REMOTE_CM_LIST)
     # devices.load_from_excel(REMOVE_REMOTE_CM_LIST)
 
-    devcom = dc.DevicesCommander(devices)
-
-    # devices_for_work = devcom.devices.device_list[4:5]
-    # devices_for_work += devcom.devices.device_list[131:132]
-    devices_for_work = devcom.devices.device_list
-
-    devices_get_sysname(devcom, devices_for_work, print_result=False, check_enabled=True)  # Get "sysname"
-    # # devcom.devices.load_export_compact_from_files(date_='2022-03-09')  # Load "export compact" from files...
-    # devices_get_config(devcom, devices_for_work)  # Get "config" from Remote CM
-    # devcom.devices.save_export_compact_to_files()  # Save "export compact" to files...
-    # devcom.devices.save_export_compact_to_files(dir_='ctr_export_compact')  # Save CTR "export compact" to files...
-    # #
-    # devices_get_ppp_active_and_counting(devcom, devices_for_work, print_result=False)  # Get "ppp active" and_counting
-    # devcom.devices.parse_config()  # Parse config...
-    # #
-    # # devices_check_icmp(devcom, devices_for_work)  # Check ICMP ip_free and ip_in_tu...
-    # # #
-    # devcom.devices.save_parse_result_to_files()  # Save parse config to files...
-    # devcom.devices.save_parse_result_to_files(dir_='ctr_output_parse')  # Save CTR parse config to files...
-    # #
-    # devcom.devices.save_icmp_result_to_files('ip_free')  # Save ICMP ip_free result to files...
-    # devcom.devices.save_icmp_result_to_files('ip_in_tu')  # Save ICMP ip_in_tu result to files...
-    # # # #
-    # devcom.devices.save_summary_icmp_result('ip_free')  # Save summary ICMP ip_free result...
-    # devcom.devices.save_summary_icmp_result('ip_in_tu')  # Save summary ICMP ip_in_tu result...
-
-    # # # #
-    # devices.logger.root.info(f'REMOVE DISABLED in CM at {len(devices_for_work)} hosts...')
-    # devices_get_disabled_counting(devcom, devices_for_work, print_result=True, check_enabled=True)
-    # devices_remove_disabled(devcom, devices_for_work, print_result=True, check_enabled=True)
-    # devices.logger.root.info(f'REMOVE DISABLED in CM success.')
-    # # # #
-    # devices.logger.root.info(f'DISABLE PUT commands in CM at {len(devices_for_work)} hosts...')
-    # # devices_set_status(devcom, devices_for_work, 'print', print_result=True, check_enabled=True)
-    # devices_set_status(devcom, devices_for_work, 'disable', print_result=False, check_enabled=True)
-    # devices.logger.root.info(f'DISABLE PUT commands in CM success.')
-    # devices_get_disabled_counting(devcom, devices_for_work, print_result=True, check_enabled=True)
-
-    # devices.logger.root.info(f'ENABLE PUT commands in CM at {len(devices_for_work)} hosts...')
-    # # devices_set_status(devcom, devices_for_work, 'enable', print_result=False, check_enabled=True)
-    # # devices_run_any_command(devcom, devices_for_work, '/system identity print', print_result=True, check_enabled=True)
-    # devices_run_any_command(devcom, devices_for_work, '/interface bridge add name="bridge-temp-for-backup-2022-07-11"',
-    #                         print_result=True, )
-    # devices.logger.root.info(f'ENABLE PUT commands in CM success.')
-
-    # devices.logger.root.info(f'ENABLE PUT commands in CM at {len(devices_for_work)} hosts...')
-    file_with_ip = os.path.join(DIR_PPR_IP_FREE, FILE_NAME_PPR_IP_FREE)
-    output_file = os.path.join(DIR_PPR_IP_FREE, 'with_stats_' + FILE_NAME_PPR_IP_FREE)
-    # devices.logger.root.info(f'ENABLE IP FREE in CM for IP in {file_with_ip}...')
-    columns = None
-    # columns = ['IP remote CPE', 'City', 'CMikroTik Name', 'CMikroTik IP']
-
-    # devices_for_work_from_ip_free = get_devices_for_work_from_file_with_ip(devcom, file_with_ip, columns)
-
-    # get_stats_by_file_with_ip(devcom, file_with_ip, output_file, print_result=False, check_enabled=True, columns=None)
-
-    # # file_with_ip = os.path.join(DIR_PPR_IP_FREE, 'other_ip.xlsx')
-    # # output_file = os.path.join(DIR_PPR_IP_FREE, 'with_stats_other_ip.xlsx')
-    # # get_stats_by_file_with_ip(devcom, file_with_ip, output_file, print_result=True, check_enabled=True, columns=None)
-
-    # devices_set_status_ip_free(devcom, file_with_ip, 'print', print_result=True, check_enabled=False, columns=columns)
-    # devices_run_any_command(devcom, devices_for_work,
-    #                         '/interface bridge add name="bridge-temp-for-backup-2022-07-11"', print_result=True)
-                            # '/interface bridge remove [find where name="bridge-temp-for-backup-2022-07-11"]', print_result = True)
-
-    # devices_remove_disabled(devcom, devices_for_work, print_result=True, check_enabled=True)
-
-    # devices_set_status_ip_free(devcom, file_with_ip, 'disable', print_result=True, check_enabled=True, columns=columns)
-    # devices_get_disabled_counting(devcom, devices_for_work_from_ip_free, print_result=True, check_enabled=True)
-
-    # devices_set_status_ip_free(devcom, file_with_ip, 'enable', print_result=True, check_enabled=False, columns=columns)
-    # devices_get_disabled_counting(devcom, devices_for_work_from_ip_free, print_result=True, check_enabled=True)
-    # devices.logger.root.info(f'DISABLE IP FREE in CM success.')
-
-    file_reset_counters = os.path.join(DIR_PPR_IP_FREE, FILE_NAME_RESET_COUNTERS)
-    output_file = os.path.join(DIR_PPR_IP_FREE, 'with_stats_' + FILE_NAME_RESET_COUNTERS)
-    # devices_reset_counters(devcom, file_reset_counters, print_result=True, check_enabled=True, columns=None)
-    # get_stats_by_file_with_ip(devcom, file_reset_counters, output_file, print_result=False, check_enabled=True, columns=None)
-
-    devices_get_all_ip_with_mask_30(devcom, devices_for_work, print_result=True, check_enabled=True, output_file='all_ip_with_mask_30.xlsx')
-
-
-def devices_set_status(devcom, devices_for_work, action, print_result, check_enabled):
+    with dc.DevicesCommander(devices) as devcom:  # один event loop и пул сессий на всё задание
+        # devices_for_work = devcom.devices.device_list[4:5]
+        # devices_for_work += devcom.devices.device_list[131:132]
+        devices_for_work = devcom.devices.device_list
+
+        devices_get_sysname(devcom, devices_for_work, print_result=False, check_enabled=True)  # Get "sysname"
+        # devices_run_pipeline(devcom, devices_for_work)  # Get "sysname", "config", "ppp active", parse, check ICMP...
+        # # devcom.devices.load_export_compact_from_files(date_='2022-03-09')  # Load "export compact" from files...
+        # devices_get_config(devcom, devices_for_work)  # Get "config" from Remote CM
+        # devices_get_config(devcom, devices_for_work, incremental=True)  # Get only changed "config" from Remote CM
+        # devices_get_config(devcom, devices_for_work, stream=True)  # Get "config" directly to archive export_compact
+        # devcom.devices.save_export_compact_to_files()  # Save "export compact" to files...
+        # devcom.devices.save_export_compact_to_files(dir_='ctr_export_compact')  # Save CTR "export compact" to files...
+        # #
+        # devices_get_ppp_active_and_counting(devcom, devices_for_work, print_result=False)  # Get "ppp active" and_counting
+        # devcom.devices.parse_config(processes=None)  # Parse config in all CPU cores...
+        # #
+        # # devices_check_icmp(devcom, devices_for_work)  # Check ICMP ip_free and ip_in_tu...
+        # # #
+        # devcom.devices.save_parse_result_to_files()  # Save parse config to files...
+        # devcom.devices.save_parse_result_to_files(dir_='ctr_output_parse')  # Save CTR parse config to files...
+        # #
+        # devcom.devices.save_icmp_result_to_files('ip_free')  # Save ICMP ip_free result to files...
+        # devcom.devices.save_icmp_result_to_files('ip_in_tu')  # Save ICMP ip_in_tu result to files...
+        # devcom.devices.save_icmp_history_to_files('ip_free')  # Save ICMP ip_free history by devices...
+        # # # #
+        # devcom.devices.save_summary_icmp_result('ip_free')  # Save summary ICMP ip_free result...
+        # devcom.devices.save_summary_icmp_result('ip_in_tu')  # Save summary ICMP ip_in_tu result...
+
+        # # # #
+        # devices.logger.root.info(f'REMOVE DISABLED in CM at {len(devices_for_work)} hosts...')
+        # devices_get_disabled_counting(devcom, devices_for_work, print_result=True, check_enabled=True)
+        # devices_remove_disabled(devcom, devices_for_work, print_result=True, check_enabled=True)
+        # devices.logger.root.info(f'REMOVE DISABLED in CM success.')
+        # # # #
+        # devices.logger.root.info(f'DISABLE PUT commands in CM at {len(devices_for_work)} hosts...')
+        # # devices_set_status(devcom, devices_for_work, 'print', print_result=True, check_enabled=True)
+        # devices_set_status(devcom, devices_for_work, 'disable', print_result=False, check_enabled=True)
+        # devices.logger.root.info(f'DISABLE PUT commands in CM success.')
+        # devices_get_disabled_counting(devcom, devices_for_work, print_result=True, check_enabled=True)
+
+        # devices.logger.root.info(f'ENABLE PUT commands in CM at {len(devices_for_work)} hosts...')
+        # # devices_set_status(devcom, devices_for_work, 'enable', print_result=False, check_enabled=True)
+        # # devices_run_any_command(devcom, devices_for_work, '/system identity print', print_result=True, check_enabled=True)
+        # devices_run_any_command(devcom, devices_for_work, '/interface bridge add name="bridge-temp-for-backup-2022-07-11"',
+        #                         print_result=True, )
+        # devices.logger.root.info(f'ENABLE PUT commands in CM success.')
+
+        # devices.logger.root.info(f'ENABLE PUT commands in CM at {len(devices_for_work)} hosts...')
+        file_with_ip = os.path.join(DIR_PPR_IP_FREE, FILE_NAME_PPR_IP_FREE)
+        output_file = os.path.join(DIR_PPR_IP_FREE, 'with_stats_' + FILE_NAME_PPR_IP_FREE)
+        # devices.logger.root.info(f'ENABLE IP FREE in CM for IP in {file_with_ip}...')
+        columns = None
+        # columns = ['IP remote CPE', 'City', 'CMikroTik Name', 'CMikroTik IP']
+
+        # devices_for_work_from_ip_free = get_devices_for_work_from_file_with_ip(devcom, file_with_ip, columns)
+
+        # get_stats_by_file_with_ip(devcom, file_with_ip, output_file, print_result=False, check_enabled=True, columns=None)
+
+        # # file_with_ip = os.path.join(DIR_PPR_IP_FREE, 'other_ip.xlsx')
+        # # output_file = os.path.join(DIR_PPR_IP_FREE, 'with_stats_other_ip.xlsx')
+        # # get_stats_by_file_with_ip(devcom, file_with_ip, output_file, print_result=True, check_enabled=True, columns=None)
+
+        # devices_set_status_ip_free(devcom, file_with_ip, 'print', print_result=True, check_enabled=False, columns=columns)
+        # devices_run_any_command(devcom, devices_for_work,
+        #                         '/interface bridge add name="bridge-temp-for-backup-2022-07-11"', print_result=True)
+                                # '/interface bridge remove [find where name="bridge-temp-for-backup-2022-07-11"]', print_result = True)
+
+        # devices_remove_disabled(devcom, devices_for_work, print_result=True, check_enabled=True)
+
+        # devices_set_status_ip_free(devcom, file_with_ip, 'disable', print_result=True, check_enabled=True, columns=columns)
+        # devices_get_disabled_counting(devcom, devices_for_work_from_ip_free, print_result=True, check_enabled=True)
+
+        # devices_set_status_ip_free(devcom, file_with_ip, 'enable', print_result=True, check_enabled=False, columns=columns)
+        # devices_get_disabled_counting(devcom, devices_for_work_from_ip_free, print_result=True, check_enabled=True)
+        # devices.logger.root.info(f'DISABLE IP FREE in CM success.')
+
+        file_reset_counters = os.path.join(DIR_PPR_IP_FREE, FILE_NAME_RESET_COUNTERS)
+        output_file = os.path.join(DIR_PPR_IP_FREE, 'with_stats_' + FILE_NAME_RESET_COUNTERS)
+        # devices_reset_counters(devcom, file_reset_counters, print_result=True, check_enabled=True, columns=None)
+        # get_stats_by_file_with_ip(devcom, file_reset_counters, output_file, print_result=False, check_enabled=True, columns=None)
+
+        devices_get_all_ip_with_mask_30(devcom, devices_for_work, print_result=True, check_enabled=True, output_file='all_ip_with_mask_30.xlsx')
+
+
+def devices_set_status(devcom, devices_for_work, action, print_result, check_enabled, batch=True):
     for device in devices_for_work:
         comrun1 = dc.CommandRunner_Put(device)
-        devcom.append_coroutine(comrun1.set_status_interfaces(action, print_result, check_enabled))
+        devcom.append_coroutine(comrun1.set_status_interfaces(action, print_result, check_enabled, batch),
+                                device=device)
     devcom.run()
 
 
@@ -134,9 +137,8 @@ def read_and_group_data_from_file_with_ip(devcom, file_with_ip, columns=None, gr
     if columns:
         data = data[columns]
     framegr = data.groupby(group_by) if group_by else None
-    for cmikrotik in framegr.groups:
-        devices = devcom.devices.find_devices_by_ip(cmikrotik)
-        devices_for_work += devices
+    if framegr is not None:
+        devices_for_work = devcom.devices.find_devices_by_ips(framegr.groups)
     return data, framegr, devices_for_work
 
 
@@ -151,9 +153,9 @@ def get_stats_by_file_with_ip(devcom, file_with_ip, output_file, print_result, c
         ip_list = framegr.get_group(cmikrotik)['IP remote CPE'].to_list()
         devices = devcom.devices.find_devices_by_ip(cmikrotik)
         for device in devices:
-            for slice_ip_list in tools.list_split(ip_list, SLICE_STATS):
-                comrun1 = dc.CommandRunner_Get(device)
-                devcom.append_coroutine(comrun1.get_stats_by_ip(slice_ip_list, print_result, check_enabled))
+            comrun1 = dc.CommandRunner_Get(device)
+            devcom.append_coroutine(comrun1.get_stats_by_ip(ip_list, print_result, check_enabled, bulk=True),
+                                    device=device)
 
     devcom.run()
     for stat_item in stats:
@@ -161,21 +163,20 @@ def get_stats_by_file_with_ip(devcom, file_with_ip, output_file, print_result, c
     data['up-time CM'] = ''
     for device in devices_for_work:
         cm_data = data[data['CMikroTik IP'] == device.ip]  # фильтр всех записей для одного СМ
-        for remote_ip in device.ip_stats.keys():
-            ip_stats = device.ip_stats[remote_ip]
+        for remote_ip, ip_stats in device.results.ip_stats.items():
             ip_data = cm_data[cm_data['IP remote CPE'] == remote_ip]
             data.loc[ip_data.index, 'up-time CM'] = device.uptime
             if isinstance(ip_stats, dict):
                 for stat_item in stats:
                     data.loc[ip_data.index, stat_item] = \
-                        device.ip_stats[remote_ip].get(stat_item, f'no item {stat_item} in stats info')
+                        ip_stats.get(stat_item, f'no item {stat_item} in stats info')
             else:
                 data.loc[ip_data.index, stats[0]] = ip_stats
 
     data.to_excel(output_file)
 
 
-def devices_set_status_ip_free(devcom, file_with_ip, action, print_result, check_enabled, columns=None):
+def devices_set_status_ip_free(devcom, file_with_ip, action, print_result, check_enabled, columns=None, batch=True):
     data, framegr, devices_for_work = read_and_group_data_from_file_with_ip(devcom, file_with_ip, columns,
                                                                             'CMikroTik IP')
     for cmikrotik in framegr.groups:
@@ -183,7 +184,8 @@ def devices_set_status_ip_free(devcom, file_with_ip, action, print_result, check
         devices = devcom.devices.find_devices_by_ip(cmikrotik)
         for device in devices:
             comrun1 = dc.CommandRunner_Put(device)
-            devcom.append_coroutine(comrun1.set_status_ip_free(action, ip_list, print_result, check_enabled))
+            devcom.append_coroutine(comrun1.set_status_ip_free(action, ip_list, print_result, check_enabled, batch),
+                                    device=device)
     devcom.run()
 
 
@@ -195,7 +197,8 @@ def devices_reset_counters(devcom, file_with_ip, print_result, check_enabled, co
         devices = devcom.devices.find_devices_by_ip(cmikrotik)
         for device in devices:
             comrun1 = dc.CommandRunner_Put(device)
-            devcom.append_coroutine(comrun1.reset_stats_by_ip(ip_list, print_result, check_enabled))
+            devcom.append_coroutine(comrun1.reset_stats_by_ip(ip_list, print_result, check_enabled, bulk=True),
+                                    device=device)
     devcom.run()
 
 
@@ -206,7 +209,8 @@ def devices_get_disabled_counting(devcom, devices_for_work, print_result, check_
     print(time.strftime("%H:%M:%S"), 'Get disabled interface in:', get_device_list(devices_for_work), sep='\n')
     for device in devices_for_work:
         comrun1 = dc.CommandRunner_Remove(device)
-        devcom.append_coroutine(comrun1.get_disabled_counting(print_result=print_result, check_enabled=check_enabled))
+        devcom.append_coroutine(comrun1.get_disabled_counting(print_result=print_result, check_enabled=check_enabled),
+                                device=device)
     devcom.run()
 
 
@@ -217,7 +221,7 @@ def devices_remove_disabled(devcom, devices_for_work, print_result, check_enable
     if confirm == "Y":
         for device in devices_for_work:
             comrun1 = dc.CommandRunner_Remove(device)
-            devcom.append_coroutine(comrun1.remove_disabled(print_result))
+            devcom.append_coroutine(comrun1.remove_disabled(print_result), device=device)
         devcom.run()
         print(time.strftime("%H:%M:%S"), 'Operation for remove disabled success!')
     else:
@@ -231,20 +235,8 @@ def devices_check_icmp(devcom, devices_for_work):
     msg = f'Check ICMP from {len(devices_for_work)} CM......'
     devcom.devices.logger.root.info(msg)
     print(time.strftime("%H:%M:%S"), msg)
-    for device in devices_for_work:
-        if device.enabled and not (device.mikroconfig is None):
-            ip_list = device.mikroconfig.ip_free
-            type_ip_list = 'ip_free'
-            for slice_ip_list in tools.list_split(ip_list, SLICE):
-                comrun1 = dc.CommandRunner_Get(device)
-                devcom.append_coroutine(comrun1.check_icmp(slice_ip_list, type_ip_list))
-
-            ip_list = device.mikroconfig.ip_in_tu
-            type_ip_list = 'ip_in_tu'
-            for slice_ip_list in tools.list_split(ip_list, SLICE):
-                comrun2 = dc.CommandRunner_Get(device)
-                devcom.append_coroutine(comrun2.check_icmp(slice_ip_list, type_ip_list))
-
+    for device in devcom.devices.select(devices_for_work, enabled=True, has_parse_result=True):
+        devcom.add_coroutines(get_check_icmp_coroutines(device), device=device)
     devcom.run()
     # devcom.devices.logger.root.info(f'Check ICMP {type_ip_list} success.')
     msg = f'Check ICMP success.'
@@ -252,14 +244,81 @@ def devices_check_icmp(devcom, devices_for_work):
     print(time.strftime("%H:%M:%S"), msg)
 
 
-def devices_get_config(devcom, devices_for_work):
+def get_check_icmp_coroutines(device):
+    """
+    Корутины рабочих сессий DeviceWorkQueue для проверки ICMP ip_free и ip_in_tu одного устройства
+    """
+    coroutines = []
+    for type_ip_list in ('ip_free', 'ip_in_tu'):
+        queue = dc.DeviceWorkQueue(device, getattr(device.mikroconfig, type_ip_list),
+                                   lambda runner, items, type_ip_list=type_ip_list:
+                                   runner.check_icmp(items, type_ip_list, batch=True))
+        coroutines += queue.get_coroutines()
+    return coroutines
+
+
+def devices_run_pipeline(devcom, devices_for_work, print_result=False, check_icmp=True, processes=None,
+                         incremental=False, stream=False):
+    """
+    sysname -> config + ppp active и counting -> parse -> ICMP ip_free и ip_in_tu.
+    Каждое устройство проходит стадии независимо от остальных, без ожидания самого медленного СМ на каждой фазе
+    processes - кол-во процессов для парсинга конфигураций, None - по кол-ву ядер
+    incremental, stream - см. devices_get_config
+    """
+    archive = devcom.devices.export_archive if incremental or stream else None
+
+    async def sysname(device):
+        await devcom.run_async([dc.CommandRunner_Get(device).get_sysname(print_result, check_enabled=True)],
+                               device=device)
+        return device.enabled
+
+    async def config(device):
+        await devcom.run_async([dc.CommandRunner_Get(device).get_config(archive=archive, incremental=incremental,
+                                                                        stream=stream)],
+                               priority=-1, device=device)
+        return device.has_export_compact()
+
+    async def ppp_active_and_counting(device):
+        await devcom.run_async([dc.CommandRunner_Get(device).get_ppp_active(print_result),
+                                dc.CommandRunner_Get(device).get_counting(print_result)],
+                               priority=-1, device=device)
+
+    async def parse(device):
+        device.mikroconfig = await asyncio.get_running_loop().run_in_executor(
+            executor, parse_config_result, *devcom.devices.get_parse_args(device, lazy=True))
+        return device.mikroconfig is not None
+
+    async def icmp(device):
+        await devcom.run_async(get_check_icmp_coroutines(device), priority=-2, device=device)
+
+    msg = f'Run pipeline for {len(devices_for_work)} hosts...'
+    devcom.devices.logger.root.info(msg)
+    print(time.strftime("%H:%M:%S"), msg)
+    pipeline = dc.DevicePipeline(devcom)
+    pipeline.add_stage('sysname', sysname)
+    pipeline.add_stage('config', config, depends=['sysname'])
+    pipeline.add_stage('ppp_active', ppp_active_and_counting, depends=['sysname'])
+    pipeline.add_stage('parse', parse, depends=['config', 'ppp_active'])
+    if check_icmp:
+        pipeline.add_stage('icmp', icmp, depends=['parse'])
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pipeline.run(devices_for_work)
+
+
+def devices_get_config(devcom, devices_for_work, incremental=False, stream=False):
+    """
+    incremental - загружать только изменившиеся конфигурации, остальные брать из архива export_compact
+    (отпечатки обновляются в devcom.devices.save_export_compact_to_files)
+    stream - писать конфигурации в архив по мере загрузки, не держа их текст в памяти
+    """
     msg = f'Get "config" from {len(devices_for_work)} hosts...'
     devcom.devices.logger.root.info(msg)
     print(time.strftime("%H:%M:%S"), msg)
-    for device in devices_for_work:
-        if device.enabled:
-            comrun1 = dc.CommandRunner_Get(device)
-            devcom.append_coroutine(comrun1.get_config())
+    archive = devcom.devices.export_archive if incremental or stream else None
+    for device in devcom.devices.select(devices_for_work, enabled=True):
+        comrun1 = dc.CommandRunner_Get(device)
+        devcom.append_coroutine(comrun1.get_config(archive=archive, incremental=incremental, stream=stream),
+                                device=device)
     devcom.run()
     msg = f'Get "config" success.'
     devcom.devices.logger.root.info(msg)
@@ -270,13 +329,12 @@ def devices_get_ppp_active_and_counting(devcom, devices_for_work, print_result=F
     msg = f'Get "ppp active" and "counting" from {len(devices_for_work)} hosts...'
     devcom.devices.logger.root.info(msg)
     print(time.strftime("%H:%M:%S"), msg)
-    for device in devices_for_work:
-        if device.enabled:
-            comrun1 = dc.CommandRunner_Get(device)
-            devcom.append_coroutine(comrun1.get_ppp_active(print_result))
+    for device in devcom.devices.select(devices_for_work, enabled=True):
+        comrun1 = dc.CommandRunner_Get(device)
+        devcom.append_coroutine(comrun1.get_ppp_active(print_result), device=device)
 
-            comrun2 = dc.CommandRunner_Get(device)
-            devcom.append_coroutine(comrun2.get_counting(print_result))
+        comrun2 = dc.CommandRunner_Get(device)
+        devcom.append_coroutine(comrun2.get_counting(print_result), device=device)
     devcom.run()
     msg = f'Get "ip ppp active" and "counting" success.'
     devcom.devices.logger.root.info(msg)
@@ -299,7 +357,7 @@ def devices_get_sysname(devcom, devices_for_work, print_result, check_enabled):
     print(time.strftime("%H:%M:%S"), msg)
     for device in devices_for_work:
         comrun = dc.CommandRunner_Get(device)
-        devcom.append_coroutine(comrun.get_sysname(print_result, check_enabled=check_enabled))
+        devcom.append_coroutine(comrun.get_sysname(print_result, check_enabled=check_enabled), device=device)
     devcom.run()
     msg = f'Get "sysname" success.'
     devcom.devices.logger.root.info(msg)
@@ -312,7 +370,7 @@ def devices_run_any_command(devcom, devices_for_work, commands, print_result):
     print(time.strftime("%H:%M:%S"), msg)
     for device in devices_for_work:
         comrun = dc.CommandRunner_Get(device)
-        devcom.append_coroutine(comrun.get_any_commands(commands, print_result))
+        devcom.append_coroutine(comrun.get_any_commands(commands, print_result), device=device)
     devcom.run()
     msg = f'Run command {commands}.'
     devcom.devices.logger.root.info(msg)
@@ -320,19 +378,16 @@ def devices_run_any_command(devcom, devices_for_work, commands, print_result):
 
 
 def get_devices_for_work_from_file_with_ip(devcom, file_with_ip, columns):
-    all_devices_for_work = []
     data = pandas.read_excel(file_with_ip)
     framegr = data[['IP remote CPE', 'City', 'CMikroTik Name', 'CMikroTik IP']].groupby('CMikroTik IP')
-    for cmikrotik in framegr.groups:
-        devices_for_work = devcom.devices.find_devices_by_ip(cmikrotik)
-        all_devices_for_work += devices_for_work
-    return all_devices_for_work
+    return devcom.devices.find_devices_by_ips(framegr.groups)
 
 
 def devices_get_all_ip_with_mask_30(devcom, devices_for_work, print_result, check_enabled, output_file):
     for device in devices_for_work:
         comrun1 = dc.CommandRunner_Get(device)
-        devcom.append_coroutine(comrun1.get_all_ip_with_mask_30(print_result=print_result, check_enabled=check_enabled))
+        devcom.append_coroutine(comrun1.get_all_ip_with_mask_30(print_result=print_result, check_enabled=check_enabled),
+                                device=device)
     devcom.run()
 
     city_name_list = []
@@ -341,9 +396,9 @@ def devices_get_all_ip_with_mask_30(devcom, devices_for_work, print_result, chec
     ip_in_cpe_list = []
     interface_in_cm_list = []
     for device in devices_for_work:
-        # print(device.all_ip_with_mask_30)
-        if device.all_ip_with_mask_30:
-            for ip_int in device.all_ip_with_mask_30:
+        # print(device.results.all_ip_with_mask_30)
+        if device.results.all_ip_with_mask_30:
+            for ip_int in device.results.all_ip_with_mask_30:
                 city_name_list.append(device.city)
                 cmikrotik_name_list.append(device.zubbix_name)
                 cmikrotik_ip_list.append(device.ip)
@@ -362,8 +417,7 @@ def devices_get_all_ip_with_mask_30(devcom, devices_for_work, print_result, chec
          'Interface in CM': interface_in_cm_list
          }
 
-    data_all_ip_with_mask_30 = pandas.read_json(json.dumps(d))
-    data_all_ip_with_mask_30.to_excel(output_file)
+    reports.write_columns(output_file, d)
 
 
 
@@ -0,0 +1,138 @@
+"""
+Генератор синтетического "/export compact" RouterOS для бенчмарков и проверки парсера.
+Параметры в строках отсортированы по алфавиту, как в настоящем экспорте, длинные строки переносятся
+через "\\" с отступом, часть имен - в кавычках (с пробелами и экранированной кириллицей).
+Среди объектов есть мусор: пустые и одиночные бриджы, свободные вланы и EOIP.
+
+    config = generate_export(10000)
+    config = generate_export(counts={'interface eoip': 5000, 'ppp secret': 5000})
+"""
+import random
+
+LINE_WIDTH = 80  # ширина строки экспорта, после которой строка переносится
+QUOTED_RATIO = 0.1  # доля имен в кавычках
+
+# доли объектов по секциям для generate_export(objects)
+SECTION_RATIO = {'interface bridge': 0.12,
+                 'interface eoip': 0.35,
+                 'interface vlan': 0.2,
+                 'interface bonding': 0.005,
+                 'interface bridge port': 0.15,
+                 'ip address': 0.075,
+                 'ppp secret': 0.1}
+SECTIONS = tuple(SECTION_RATIO)  # порядок секций в экспорте
+
+
+def get_counts(objects):
+    """Кол-во объектов по секциям для общего кол-ва objects"""
+    return {section: max(1, int(objects * ratio)) for section, ratio in SECTION_RATIO.items()}
+
+
+def get_ip(i, net=10):
+    return f'{net}.{i // 62500 % 250}.{i // 250 % 250}.{i % 250 + 1}'
+
+
+def wrap_line(line, width=LINE_WIDTH):
+    """Перенос строки как в export compact: "\\" в конце и 4 пробела в начале следующей строки"""
+    if len(line) <= width:
+        return line
+    lines = []
+    current = ''
+    for word in line.split(' '):
+        if current and len(current) + len(word) + 1 > width - 2:
+            lines.append(current + ' \\')
+            current = '    ' + word
+        else:
+            current = f'{current} {word}' if current else word
+    lines.append(current)
+    return '\n'.join(lines)
+
+
+class ExportGenerator:
+
+    def __init__(self, counts, seed=0, quoted_ratio=QUOTED_RATIO, width=LINE_WIDTH):
+        self.counts = {section: counts.get(section, 0) for section in SECTIONS}
+        self.rng = random.Random(seed)
+        self.quoted_ratio = quoted_ratio
+        self.width = width
+        self.eoips = [self.get_name('eoip', i) for i in range(self.counts['interface eoip'])]
+        self.vlans = [self.get_name('vlan', i) for i in range(self.counts['interface vlan'])]
+        self.bridges = [self.get_name('bridge', i) for i in range(self.counts['interface bridge'])]
+        self.bondings = [f'bonding{i}' for i in range(self.counts['interface bonding'])]
+
+    def get_name(self, prefix, i):
+        value = self.rng.random()
+        if value < self.quoted_ratio / 2:
+            return f'"{prefix} client {i}"'
+        elif value < self.quoted_ratio:
+            return f'"\\D0\\9A{prefix}-{i}"'  # кириллица в экспорте экранируется
+        return f'{prefix}-{i}'
+
+    def add(self, **params):
+        line = 'add ' + ' '.join(f'{key.replace("_", "-")}={value}' for key, value in sorted(params.items()))
+        return wrap_line(line, self.width)
+
+    def choice(self, names):
+        return self.rng.choice(names) if names else 'ether1'
+
+    def interface_bridge(self):
+        return [self.add(name=name, protocol_mode='none') for name in self.bridges]
+
+    def interface_eoip(self):
+        return [self.add(local_address='192.168.0.1', mac_address=f'02:00:00:{i // 65536 % 256:02X}:'
+                                                                  f'{i // 256 % 256:02X}:{i % 256:02X}',
+                         name=name, remote_address=get_ip(i), tunnel_id=i)
+                for i, name in enumerate(self.eoips)]
+
+    def interface_vlan(self):
+        # вланы на EOIP, часть - на bonding
+        parents = self.eoips + self.bondings
+        return [self.add(interface=self.choice(parents), name=name, vlan_id=i % 4094 + 1)
+                for i, name in enumerate(self.vlans)]
+
+    def interface_bonding(self):
+        return [self.add(arp_ip_targets=f'{get_ip(i, 172)},{get_ip(i + 1, 172)}', mode='802.3ad', name=name,
+                         slaves=f'ether{2 * i + 2},ether{2 * i + 3}', transmit_hash_policy='layer-2-and-3')
+                for i, name in enumerate(self.bondings)]
+
+    def interface_bridge_port(self):
+        # порты распределяются по части бриджей: остальные бриджы пустые, часть получает один порт
+        ports = self.vlans + self.eoips
+        bridges = self.bridges[:max(1, len(self.bridges) * 3 // 4)]
+        return [self.add(bridge=self.choice(bridges), interface=self.choice(ports))
+                for _ in range(self.counts['interface bridge port'])]
+
+    def ip_address(self):
+        interfaces = self.vlans + self.bridges
+        return [self.add(address=f'{get_ip(4 * i, 172)}/30', interface=self.choice(interfaces),
+                         network=get_ip(4 * i, 172)) for i in range(self.counts['ip address'])]
+
+    def ppp_secret(self):
+        # каждый третий ppp - с remote-address, не используемым в EOIP
+        return [self.add(local_address='192.168.0.1', name=f'ppp-{i}', password=f'pass{i}',
+                         profile='default-encryption', remote_address=get_ip(i if i % 3 else i + 10 ** 6),
+                         service='pptp')
+                for i in range(self.counts['ppp secret'])]
+
+    def get_sections(self):
+        """{section: [строки "add ..."]} в порядке секций экспорта"""
+        return {section: getattr(self, section.replace(' ', '_'))()
+                for section in SECTIONS if self.counts[section]}
+
+    @staticmethod
+    def join(sections):
+        lines = ['# jan/02/2022 03:04:05 by RouterOS 6.48.6', '# software id = FAKE-0000', '#',
+                 '# model = CCR1036-8G-2S+', '# serial number = FAKE00000000']
+        for section, section_lines in sections.items():
+            lines.append('/' + section)
+            lines += section_lines
+        return '\n'.join(lines) + '\n'
+
+
+def generate_export(objects=1000, counts=None, seed=0, quoted_ratio=QUOTED_RATIO):
+    """
+    Текст export compact. counts - кол-во объектов по секциям {'interface eoip': 100, ...},
+    по-умолчанию распределение objects по SECTION_RATIO
+    """
+    generator = ExportGenerator(counts or get_counts(objects), seed, quoted_ratio)
+    return generator.join(generator.get_sections())
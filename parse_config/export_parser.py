@@ -0,0 +1,60 @@
+import re
+
+regex_line_continuation = re.compile(r'\\\r?\n *')  # перенос строки в export_compact
+regex_param = re.compile(r'([^\s=]+)(?:=("(?:[^"\\]|\\.)*"|\S*))?')  # key=value | key="value" | flag
+
+COMMANDS = ('add', 'set', 'remove', 'enable', 'disable')
+
+
+class ExportConfig:
+    """
+    Однопроходный разбор "/export compact" в структуру:
+    секция -> список записей "add" в виде словарей {ключ: значение}.
+    Значения в кавычках сохраняются без кавычек, экранирование RouterOS (\\", \\D0\\9F ...) не раскрывается,
+    чтобы значения можно было подставлять обратно в команды как есть.
+    """
+
+    def __init__(self, config):
+        self.sections = dict()  # {'interface bridge': [{'name': 'bridge1', 'protocol-mode': 'none'}, ...]}
+        self.parse(config)
+
+    def parse(self, config):
+        config = regex_line_continuation.sub('', config)
+        section = None
+        for line in config.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('/'):
+                # заголовок секции, возможно сразу с командой: /interface bridge add name=bridge1
+                words = line[1:].split(' ')
+                for i, word in enumerate(words):
+                    if word in COMMANDS or '=' in word:
+                        section, line = ' '.join(words[:i]), ' '.join(words[i:])
+                        break
+                else:
+                    section = line[1:]
+                    continue
+            if section is not None and line.startswith('add '):
+                self.sections.setdefault(section, []).append(self.parse_params(line[4:]))
+
+    @staticmethod
+    def parse_params(line):
+        params = dict()
+        for key, value in regex_param.findall(line):
+            if value.startswith('"') and value.endswith('"') and len(value) > 1:
+                value = value[1:-1]
+            params[key] = value
+        return params
+
+    def section(self, name):
+        """Список записей "add" секции, name без "/" - 'interface bridge port'"""
+        return self.sections.get(name, [])
+
+    def values(self, name, key):
+        """Значения ключа key всех записей секции, в которых он есть"""
+        return [entry[key] for entry in self.section(name) if key in entry]
+
+    def items(self, name, *keys):
+        """Кортежи значений ключей keys всех записей секции, в которых есть все ключи"""
+        return [tuple(entry[key] for key in keys) for entry in self.section(name) if all(key in entry for key in keys)]
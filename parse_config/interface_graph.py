@@ -0,0 +1,118 @@
+from collections import defaultdict, deque
+
+from .export_parser import ExportConfig
+
+
+class InterfaceGraph:
+    """
+    Граф зависимостей интерфейсов из export_compact:
+    bridge -> ports, vlan -> parent, bonding -> slaves, ip address -> interface, eoip -> remote ip.
+
+    find_garbage() помечает мусор обходом графа до неподвижной точки: интерфейс, который использовался
+    только мусорными интерфейсами (например влан на мусорном EOIP), сам становится мусором за один проход.
+    """
+
+    def __init__(self, export: ExportConfig):
+        self.bridges = set(export.values('interface bridge', 'name'))
+        self.vlans = set(export.values('interface vlan', 'name'))
+        self.eoips = set(export.values('interface eoip', 'name'))
+        self.bridge_ports = {bridge: [] for bridge in self.bridges}  # {bridge: [port, ...]}
+        for bridge, port in export.items('interface bridge port', 'bridge', 'interface'):
+            self.bridge_ports.setdefault(bridge, []).append(port)
+        self.vlan_parent = dict(export.items('interface vlan', 'name', 'interface'))  # {vlan: interface}
+        self.bonding_slaves = {bonding: slaves.split(',')  # {bonding: [slave, ...]}
+                               for bonding, slaves in export.items('interface bonding', 'name', 'slaves')}
+        self.ip_interfaces = set(export.values('ip address', 'interface'))
+        self.eoip_remote = dict(export.items('interface eoip', 'name', 'remote-address'))  # {eoip: remote ip}
+
+        self.users = defaultdict(set)  # {interface: {(type_user, user), ...}} - кто использует интерфейс
+        for bridge, ports in self.bridge_ports.items():
+            for port in ports:
+                self.users[port].add(('bridge', bridge))
+        for vlan, parent in self.vlan_parent.items():
+            self.users[parent].add(('vlan', vlan))
+        for bonding, slaves in self.bonding_slaves.items():
+            for slave in slaves:
+                self.users[slave].add(('bonding', bonding))
+
+        self.br_empty = set()
+        self.br_single = set()
+        self.int_single_dict = dict()  # {int: type_int}
+        self.vlans_free = set()
+        self.eoip_free = set()
+        self.garbage = set()
+
+    def get_type(self, name):
+        if name in self.eoips:
+            return 'eoip'
+        elif name in self.vlans:
+            return 'vlan'
+        elif name in self.bridges:
+            return 'bridge'
+        return ''
+
+    def get_used(self, name):
+        """Интерфейсы, которые использует name"""
+        if name in self.vlan_parent:
+            return [self.vlan_parent[name]]
+        return self.bridge_ports.get(name, [])
+
+    def find_garbage(self):
+        """
+        Бриджы без портов и без IP - br_empty
+        Бриджы с одним портом (eoip или vlan без IP, не используемым больше нигде) - br_single,
+        а их порты - int_single_dict
+        Вланы и EOIP, которые не используются ни в IP адресах, ни живыми бриджами, вланами, bonding -
+        vlans_free и eoip_free
+        """
+        live_users = {name: set(users) for name, users in self.users.items()}
+        queue = deque()
+
+        def mark(name):
+            self.garbage.add(name)
+            queue.append(name)
+
+        def check(name):
+            if name in self.garbage or name in self.ip_interfaces or live_users.get(name):
+                return
+            type_int = self.get_type(name)
+            if type_int == 'bridge':
+                ports = self.bridge_ports[name]
+                if not ports:
+                    self.br_empty.add(name)
+                    mark(name)
+                elif len(ports) == 1:
+                    port = ports[0]
+                    type_port = self.get_type(port)
+                    if type_port in ('eoip', 'vlan') and port not in self.ip_interfaces \
+                            and live_users.get(port) == {('bridge', name)}:
+                        self.br_single.add(name)
+                        self.int_single_dict[port] = type_port
+                        mark(name)
+                        mark(port)
+            elif type_int == 'vlan':
+                self.vlans_free.add(name)
+                mark(name)
+            elif type_int == 'eoip':
+                self.eoip_free.add(name)
+                mark(name)
+
+        for name in self.bridges | self.vlans | self.eoips:
+            check(name)
+        while queue:
+            name = queue.popleft()
+            type_int = self.get_type(name)
+            for used in self.get_used(name):
+                users = live_users.get(used, set())
+                users.discard((type_int, name))
+                check(used)
+                # порт, оставшийся только в бридже, может сделать бридж одиночным
+                for type_user, user in list(users):
+                    if type_user == 'bridge':
+                        check(user)
+        return self
+
+    @property
+    def live_eoip_remote(self):
+        """Remote ip живых EOIP"""
+        return {ip for eoip, ip in self.eoip_remote.items() if eoip not in self.garbage}
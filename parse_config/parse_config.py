@@ -1,7 +1,11 @@
 import re
 import os.path
 from sys import exit, argv
-from .regex_example import parse_section, regex_section, regExFindIP
+from functools import cached_property
+from typing import Union
+from .export_parser import ExportConfig
+from .interface_graph import InterfaceGraph
+from .regex_example import regExFindIP
 
 
 class MikrotikConfig:
@@ -24,17 +28,18 @@ class MikrotikConfig:
         self.file_tu = file_tu
         self.file_active = file_active
         self.config = config
+        self.export = ExportConfig(config)  # export_compact разбирается один раз, все свойства читают эту структуру
         self.ip_from_tu = set(self.getipfromfile(file_tu, regExFindIP)) if self.file_tu else set()
         if ip_active_ppp:
             self.ip_active_ppp = ip_active_ppp
         else:
             self.ip_active_ppp = set(self.getipfromfile(file_active, regExFindIP)) if self.file_active else set()
-        self.br_empty = set()  # ---br_empty
-        self.br_single = set()  # ---br_single
-        self.int_single_dict = dict()  # --intsingle = {int: type_int}
-        self.get_bridges()  # br_empty, br_single, int_single_dict
-        self.vlans_free = self.get_vlans_free()  # --vlans_free
-        self.eoip_free = self.get_eoip_free()  # --eoip_free
+        self.graph = InterfaceGraph(self.export).find_garbage()
+        self.br_empty = self.graph.br_empty  # ---br_empty
+        self.br_single = self.graph.br_single  # ---br_single
+        self.int_single_dict = self.graph.int_single_dict  # --intsingle = {int: type_int}
+        self.vlans_free = self.graph.vlans_free  # --vlans_free
+        self.eoip_free = self.graph.eoip_free  # --eoip_free
         # --ip_free; ip_in_tu - IP которые есть в ТУ, для формирования ЗМС
         # ip_ppp_free, ppp у которых remote-ip не используется ни в одном eoip
         self.ip_free, self.ip_in_tu, self.ip_ppp_free = self.get_ip()
@@ -44,43 +49,41 @@ class MikrotikConfig:
         self.icmp_ip_in_tu_true = set()  # icmp ip_in_tu true
         self.icmp_ip_in_tu_false = set()  # icmp ip_in_tu false
 
-    @property
+    @cached_property
     def all_bridges(self):
-        return set(parse_section(regex_section.interface_bridge, self.config))
+        return set(self.export.values('interface bridge', 'name'))
 
-    @property
+    @cached_property
     def bonding(self):
-        return set(parse_section(regex_section.interface_bonding, self.config))
+        """список всех slaves строкой для каждого bonding"""
+        return set(self.export.values('interface bonding', 'slaves'))
 
-    @property
+    @cached_property
     def name_eoip(self):
-        return set(parse_section(regex_section.interface_eoip, self.config))
+        return set(self.export.values('interface eoip', 'name'))
 
-    @property
+    @cached_property
     def int_ip_addr(self):
-        return set(parse_section(regex_section.ip_address, self.config))
+        return set(self.export.values('ip address', 'interface'))
 
-    @property
+    @cached_property
     def ports_only_from_bridges(self):
         """Получаем список всех интерфейсов в бридж портах """
-        res = set(parse_section(regex_section.interface_bridge_port, self.config, reg_id=2))
-        return res
+        return set(self.export.values('interface bridge port', 'interface'))
 
-    @property
+    @cached_property
     def bridge_port_from_bridges(self):
         """Получаем список bridge и interface из бридж портов """
-        return set(parse_section(regex_section.interface_bridge_port, self.config))
+        return set(self.export.items('interface bridge port', 'bridge', 'interface'))
 
-    @property
+    @cached_property
     def vlans(self):
-        return set(parse_section(regex_section.interface_vlan, self.config))
+        return set(self.export.values('interface vlan', 'name'))
 
-    @property
+    @cached_property
     def int_vlans(self):
         """список интерфейсов на которых есть влан"""
-        section_interface_vlan = regex_section.interface_vlan
-        res = parse_section(section_interface_vlan, self.config, reg_id = 2)
-        return set(res)
+        return set(self.export.values('interface vlan', 'interface'))
 
     # @property
     # def int_from_vlans_unknow(self):
@@ -88,95 +91,77 @@ class MikrotikConfig:
     #     res = [vlan for vlan in self.int_vlans if vlan.startswith('*')]
     #     return set(res)
 
-    @staticmethod
-    def exclude_int_in_bonding(int_list, slaves_list):
-        res = set(int_list)
-        for int in int_list:
-            for slaves in slaves_list:
-                if int in slaves:
-                    res.remove(int)
-                    break
-        return res
-
     @staticmethod
     def getipfromfile(filename, regex):
         """Получаем список IP адресов из текста с помощью регулярного выражения"""
         with open(filename, encoding='ANSI') as file:
             return list(re.findall(regex, file.read()))
 
+    def get_ip_values(self, section, key):
+        """IP адреса из значений key секции, в т.ч. из списков через запятую"""
+        return [ip for value in self.export.values(section, key) for ip in re.findall(regExFindIP, value)]
+
     def get_ip(self):
         """
         Сравнить IP адреса из PPP secrets и remote address из EOIP с адресами в ТУ (ip_from_address_plan.txt)
         Исключить активные PPP (ppp_active_from_cm.txt)
-        ip_ppp_free - ppp у которых remote-ip не используется ни в одном eoip
+        ip_ppp_free - ppp у которых remote-ip не используется ни в одном живом (не мусорном) eoip
         """
         ip_free_ = set()
         ip_in_tu_ = set()
-        _ip_ppp = set(parse_section(regex_section.ppp_secret, self.config))
-        _ip_eoip = set(parse_section(regex_section.interface_eoip, self.config, 3))
-        _ip_bonding = set(parse_section(regex_section.interface_bonding, self.config, 2))
-        ip_ppp_free_ = _ip_ppp - _ip_eoip - self.ip_active_ppp
+        _ip_ppp = set(self.get_ip_values('ppp secret', 'remote-address'))
+        _ip_eoip = set(self.get_ip_values('interface eoip', 'remote-address'))
+        _ip_bonding = set(self.get_ip_values('interface bonding', 'arp-ip-targets'))
+        ip_ppp_free_ = _ip_ppp - self.graph.live_eoip_remote - self.ip_active_ppp
         ip_all = (_ip_ppp | _ip_eoip | _ip_bonding)
         ip_free_.update(ip_all - self.ip_from_tu - self.ip_active_ppp)
         ip_in_tu_ = ip_all & self.ip_from_tu
         return ip_free_, ip_in_tu_, ip_ppp_free_
 
-    def get_eoip_free(self):
-        """
-        Исключить те EOIP которых нет в бридж портах, вланах, bonding
-        """
-        res = set()
-        eoip_int = self.name_eoip - self.ports_only_from_bridges - self.int_ip_addr - self.int_vlans
-        res.update(self.exclude_int_in_bonding(eoip_int, self.bonding))
-        return res
+    @property
+    def totals(self):
+        """Кол-во проанализированных интерфейсов для отчета"""
+        return {'vlans': len(self.vlans),
+                'eoip': len(self.name_eoip),
+                'bridges': len(self.all_bridges),
+                'bridge_ports': len(self.ports_only_from_bridges),
+                'bonding': len(self.bonding)}
 
-    def get_bridges(self):
-        """
-        Исключить бриджы которые участвуют в "ip addresses"
-        Найти бриджы без портов - br_empty
-        Найти бриджы с одним портом - br_single
-        Найти порты в одиночны бриджах - int_single_dict
-        """
-        br_without_ipaddr = self.all_bridges - self.int_ip_addr  # исключаем бриджы на которых есть ip
-        bridge_dict = dict(
-            [(bridge, []) for bridge in br_without_ipaddr])  # формируем словарь из бриджей, пока без портов
-        for bridge, port in self.bridge_port_from_bridges:
-            if bridge in bridge_dict:
-                bridge_dict[bridge] += [port]
-
-        for bridge, ports in bridge_dict.items():
-            if not ports:
-                self.br_empty.add(bridge)
-            elif len(ports) == 1:
-                # self.br_single.add(bridge)
-                if ports[0] not in self.int_ip_addr:
-                    # исключаем бриджы и интерфейсы, если интерфейсы есть в "ip addresss" или в bonding
-                    # DONE! переписать вычитание bonding с учетом проверки на вхождение
-                    # int_single.update(exclude_int_in_bonding([ports[0]], bonding))
-                    # int = ''.join(exclude_int_in_bonding([ports[0]], bonding))
-                    if int := ''.join(self.exclude_int_in_bonding([ports[0]], self.bonding)):
-                        type_int = ''
-                        if int in self.name_eoip:
-                            type_int = 'eoip'
-                        elif int in self.vlans:
-                            type_int = 'vlan'
-                        if type_int:
-                            self.br_single.add(bridge)
-                            self.int_single_dict.update({int: type_int})
-
-    def get_vlans_free(self):
-        """
-        Вывести вланы, не участвующие в бриджах и в "ip addresses"
-        """
-        res = set()
-        res.update(self.exclude_int_in_bonding(self.vlans - self.int_ip_addr -
-                                               self.ports_only_from_bridges - self.int_vlans, self.bonding))
-        return res
+    def get_result(self):
+        return MikrotikParseResult(self)
+
+
+class MikrotikParseResult:
+    """
+    Результат парсинга MikrotikConfig без текста конфигурации - только итоговые множества и кол-во
+    проанализированных интерфейсов. Компактен для передачи из процесса при параллельном парсинге.
+    """
+    RESULT_FIELDS = ('file_tu', 'file_active', 'br_empty', 'br_single', 'int_single_dict', 'vlans_free', 'eoip_free',
+                     'ip_free', 'ip_in_tu', 'ip_ppp_free', 'totals')
+    __slots__ = RESULT_FIELDS + ('icmp_false', 'icmp_true', 'icmp_ip_in_tu_true', 'icmp_ip_in_tu_false')
+
+    def __init__(self, mikroconfig: MikrotikConfig):
+        for field in self.RESULT_FIELDS:
+            setattr(self, field, getattr(mikroconfig, field))
+        self.icmp_false = set()  # --icmp_false
+        self.icmp_true = set()  # --icmp_true
+        self.icmp_ip_in_tu_true = set()  # icmp ip_in_tu true
+        self.icmp_ip_in_tu_false = set()  # icmp ip_in_tu false
+
+
+def parse_config_result(config, file_tu='', ip_active_ppp=''):
+    """
+    Парсинг конфигурации с возвратом только MikrotikParseResult, используется в ProcessPoolExecutor.
+    config - текст или объект с методом read() (export_archive.ArchivedExport), текст читается уже в процессе
+    """
+    if not isinstance(config, str):
+        config = config.read()
+    return MikrotikConfig(config, file_tu, ip_active_ppp).get_result()
 
 
 class GeneralParam:
 
-    def __init__(self, mikrot: MikrotikConfig):
+    def __init__(self, mikrot: Union[MikrotikConfig, MikrotikParseResult]):
         self.value = dict()
         self.mikrotik = mikrot
         self.init_general_param(mikrot)
@@ -184,7 +169,7 @@ class GeneralParam:
     def add(self, param_name, description, variable, print_command, disable_command):
         self.value.update({param_name: (description, variable, print_command + '\t' + disable_command)})
 
-    def init_general_param(self, mikrot: MikrotikConfig):
+    def init_general_param(self, mikrot: Union[MikrotikConfig, MikrotikParseResult]):
         self.add('--empty', 'Бриджы без портов', mikrot.br_empty,
                  '/interface bridge port print where bridge="{0}"',
                  '/interface bridge disable [find where name="{0}"]')
@@ -267,11 +252,12 @@ class GeneralParam:
         return res
 
     def get_output_info(self, param=None):
+        totals = self.mikrotik.totals
         output_msg = f'''--- Результат анализа конфигурации %s (%s) г. %s ---"
     Исключены remote ip находящиеся в файлах "{self.mikrotik.file_tu}" и "{self.mikrotik.file_active}" 
-    Всего проанализировано: вланов - {len(self.mikrotik.vlans)}, еоип - {len(self.mikrotik.name_eoip)}, \
-    бриджей - {len(self.mikrotik.all_bridges)}, порт бриджей - {len(self.mikrotik.ports_only_from_bridges)},\
-    бондингов - {len(self.mikrotik.bonding)} 
+    Всего проанализировано: вланов - {totals['vlans']}, еоип - {totals['eoip']}, \
+    бриджей - {totals['bridges']}, порт бриджей - {totals['bridge_ports']},\
+    бондингов - {totals['bonding']} 
     '''
         if param:
             text_for_output_in_file = self.print_interfaces(param)
@@ -0,0 +1,164 @@
+"""
+Запись табличных отчетов за один проход, строками или столбцами, без промежуточных DataFrame
+и без круговых преобразований pandas.read_json(json.dumps(...)). Формат - по расширению файла:
+    .xlsx          - потоковая запись openpyxl (write_only): память не растет с кол-вом строк, для отчетов людям
+    .csv           - csv в utf-8 с BOM, открывается Excel
+    .parquet       - pandas + pyarrow, строки накапливаются и пишутся при закрытии
+    .sqlite | .db  - таблица table в SQLite, существующая таблица заменяется
+Файл пишется во временный и заменяет filename только при успешном закрытии, таблица SQLite заменяется
+одной транзакцией. Исключение в блоке with - отчет не сохраняется, прежний файл или таблица остаются (abort).
+
+    with ReportWriter('summary.xlsx', ['City', 'IP']) as report:
+        report.write_row(['Москва', '10.0.0.1'])
+    write_columns('summary.csv', {'City': [...], 'IP': [...]})
+    write_records('summary.sqlite', [{'City': ..., 'IP': ...}, ...])
+"""
+import csv
+import os
+import sqlite3
+from datetime import date, datetime
+
+FORMATS = ('xlsx', 'csv', 'parquet', 'sqlite', 'db')
+CELL_TYPES = (str, int, float, bool, date, datetime)
+
+
+def get_format(filename):
+    ext = os.path.splitext(filename)[1].lower().lstrip('.')
+    if ext not in FORMATS:
+        raise ValueError(f'Unknown report format "{ext}", expected one of {FORMATS}')
+    return ext
+
+
+def to_cell(value):
+    """Значения, которые не пишутся в ячейку как есть (множества, словари, numpy типы без numpy), - строкой"""
+    if value is None or isinstance(value, CELL_TYPES):
+        return value
+    if hasattr(value, 'item'):  # numpy скаляры
+        return value.item()
+    return str(value)
+
+
+class ReportWriter:
+
+    def __init__(self, filename, columns, table='report', sheet='report'):
+        self.filename = filename
+        self.columns = list(columns)
+        self.table = table
+        self.format = get_format(filename)
+        self.rows = 0
+        self._file = None
+        self._writer = None
+        self._buffer = None
+        self._tmp_filename = filename + '.tmp'
+        dir_ = os.path.dirname(filename)
+        if dir_:
+            os.makedirs(dir_, exist_ok=True)
+        if self.format == 'xlsx':
+            from openpyxl import Workbook
+            self._writer = Workbook(write_only=True)
+            self._sheet = self._writer.create_sheet(sheet)
+            self._sheet.append(self.columns)
+        elif self.format == 'csv':
+            self._file = open(self._tmp_filename, 'wt', newline='', encoding='utf-8-sig')
+            self._writer = csv.writer(self._file, delimiter=';')
+            self._writer.writerow(self.columns)
+        elif self.format == 'parquet':
+            self._buffer = {column: [] for column in self.columns}
+        else:
+            self._writer = sqlite3.connect(filename)
+            self._writer.execute('BEGIN')  # DROP и CREATE - в той же транзакции, что и строки
+            columns = ', '.join(self.quote(column) for column in self.columns)
+            self._writer.execute(f'DROP TABLE IF EXISTS {self.quote(table)}')
+            self._writer.execute(f'CREATE TABLE {self.quote(table)} ({columns})')
+            self._insert = f'INSERT INTO {self.quote(table)} VALUES ({", ".join("?" * len(self.columns))})'
+
+    @staticmethod
+    def quote(name):
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def write_rows(self, rows):
+        """rows - последовательности значений в порядке columns"""
+        rows = ([to_cell(value) for value in row] for row in rows)
+        if self.format == 'xlsx':
+            for row in rows:
+                self._sheet.append(row)
+                self.rows += 1
+        elif self.format == 'csv':
+            for row in rows:
+                self._writer.writerow(row)
+                self.rows += 1
+        elif self.format == 'parquet':
+            for row in rows:
+                for column, value in zip(self.columns, row):
+                    self._buffer[column].append(value)
+                self.rows += 1
+        else:
+            rows = list(rows)
+            self._writer.executemany(self._insert, rows)
+            self.rows += len(rows)
+
+    def write_row(self, row):
+        self.write_rows([row])
+
+    def write_columns(self, columns):
+        """columns = {столбец: [значения]}, столбцы одинаковой длины"""
+        self.write_rows(zip(*(columns[column] for column in self.columns)))
+
+    def close(self):
+        """Сохраняет отчет"""
+        if self.format in ('sqlite', 'db'):
+            self._writer.commit()
+            self._writer.close()
+            return
+        if self.format == 'xlsx':
+            self._writer.save(self._tmp_filename)
+        elif self.format == 'csv':
+            self._file.close()
+        else:
+            import pandas
+            pandas.DataFrame(self._buffer, columns=self.columns).to_parquet(self._tmp_filename, index=False)
+            self._buffer = None
+        os.replace(self._tmp_filename, self.filename)
+
+    def abort(self):
+        """Отчет не сохраняется: временный файл удаляется, транзакция SQLite откатывается"""
+        if self.format in ('sqlite', 'db'):
+            self._writer.rollback()
+            self._writer.close()
+            return
+        if self.format == 'xlsx':
+            self._sheet.close()  # дописывает и закрывает временный файл листа openpyxl
+        elif self.format == 'csv':
+            self._file.close()
+        self._writer = None
+        self._buffer = None
+        if os.path.exists(self._tmp_filename):
+            os.remove(self._tmp_filename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_columns(filename, columns, **params):
+    """Отчет из столбцов {столбец: [значения]} -> кол-во строк"""
+    with ReportWriter(filename, columns, **params) as report:
+        report.write_columns(columns)
+    return report.rows
+
+
+def write_records(filename, records, columns=None, **params):
+    """
+    Отчет из записей [{столбец: значение}] -> кол-во строк.
+    columns - по-умолчанию все ключи записей в порядке появления, отсутствующие значения - пустые
+    """
+    if columns is None:
+        columns = list(dict.fromkeys(key for record in records for key in record))
+    with ReportWriter(filename, columns, **params) as report:
+        report.write_rows([record.get(column) for column in columns] for record in records)
+    return report.rows
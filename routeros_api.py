@@ -0,0 +1,244 @@
+"""
+Асинхронный клиент RouterOS API (порт 8728, api-ssl - 8729).
+Предложение - последовательность слов с префиксом длины, завершается пустым словом:
+    /interface/print  =.proplist=name,rx-byte  ?type=eoip-tunnel  .tag=1
+Ответы: !re (запись), !done (конец ответа), !trap (ошибка), !fatal (соединение закрывается).
+Каждый запрос получает свой .tag, поэтому на одном соединении одновременно выполняется много запросов,
+ответы разбираются фоновой задачей чтения по тегам.
+"""
+import asyncio
+import hashlib
+import ssl
+import time
+from binascii import unhexlify
+from itertools import count
+
+API_PORT = 8728
+API_SSL_PORT = 8729
+ENCODING = 'cp1251'  # кодировка строк RouterOS (Winbox сохраняет кириллицу в cp1251)
+
+
+class ApiError(Exception):
+    pass
+
+
+def encode_length(length):
+    if length < 0x80:
+        return bytes([length])
+    elif length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    elif length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    elif length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+
+async def read_length(reader):
+    first = (await reader.readexactly(1))[0]
+    if first < 0x80:
+        return first
+    elif first < 0xC0:
+        size, length = 1, first & 0x3F
+    elif first < 0xE0:
+        size, length = 2, first & 0x1F
+    elif first < 0xF0:
+        size, length = 3, first & 0x0F
+    else:
+        size, length = 4, 0
+    for byte in await reader.readexactly(size):
+        length = (length << 8) + byte
+    return length
+
+
+def encode_sentence(words):
+    res = bytearray()
+    for word in words:
+        word = word.encode(ENCODING, 'replace')
+        res += encode_length(len(word)) + word
+    res += b'\x00'
+    return bytes(res)
+
+
+async def read_sentence(reader):
+    words = []
+    while True:
+        length = await read_length(reader)
+        if length == 0:
+            return words
+        words.append((await reader.readexactly(length)).decode(ENCODING, 'replace'))
+
+
+def parse_sentence(words):
+    """
+    Слова ответа -> (тип ответа, {key: value}, tag). Атрибуты "=key=value" и ".tag=n"
+    """
+    attrs = dict()
+    tag = None
+    for word in words[1:]:
+        if word.startswith('='):
+            key, _, value = word[1:].partition('=')
+            attrs[key] = value
+        elif word.startswith('.tag='):
+            tag = word[5:]
+    return (words[0] if words else ''), attrs, tag
+
+
+def get_words(command, attrs=None, queries=None, tag=None):
+    """
+    command - '/interface/print', attrs - {'.proplist': 'name,rx-byte', 'count-only': ''},
+    queries - ['?type=eoip-tunnel', '?disabled=false'] или {'type': 'eoip-tunnel'}
+    """
+    words = [command]
+    words += [f'={key}={value}' for key, value in (attrs or {}).items()]
+    if isinstance(queries, dict):
+        queries = [f'?{key}={value}' for key, value in queries.items()]
+    words += list(queries or [])
+    if tag is not None:
+        words.append(f'.tag={tag}')
+    return words
+
+
+class ApiResponse:
+    """
+    Ответ на один запрос: records - записи !re, ret - значение =ret= из !done (например для count-only).
+    channel_input, result и elapsed_time - как у ответа scrapli, для вывода в send_command
+    """
+
+    def __init__(self, words):
+        self.channel_input = ' '.join(words)
+        self.records = []
+        self.ret = None
+        self.elapsed_time = 0
+        self._start = time.time()
+
+    def finish(self, done_attrs):
+        self.ret = done_attrs.get('ret')
+        self.elapsed_time = time.time() - self._start
+
+    @property
+    def result(self):
+        if self.ret is not None and not self.records:
+            return self.ret
+        return '\n'.join(';'.join(f'{key}={value}' for key, value in record.items()) for record in self.records)
+
+
+class RouterOsApi:
+    """
+    Соединение RouterOS API. Методы talk() можно вызывать одновременно из многих корутин.
+    Запрос, не завершившийся за timeout, отменяется на устройстве (/cancel)
+    """
+    CANCEL_TIMEOUT = 5
+
+    def __init__(self, host, port=None, use_ssl=False, timeout=50):
+        self.host = host
+        self.use_ssl = use_ssl
+        self.port = port or (API_SSL_PORT if use_ssl else API_PORT)
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._tags = count()
+        self._pending = dict()  # {tag: (ApiResponse, future, [trap message])}
+
+    @staticmethod
+    def get_ssl_context():
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE  # сертификаты RouterOS обычно самоподписанные или отсутствуют
+        try:
+            context.set_ciphers('DEFAULT:ADH:@SECLEVEL=0')
+        except ssl.SSLError:
+            pass
+        return context
+
+    async def open(self, username, password):
+        ssl_context = self.get_ssl_context() if self.use_ssl else None
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=ssl_context), self.timeout)
+        self._read_task = asyncio.get_running_loop().create_task(self._read_loop())
+        await self.login(username, password)
+        return self
+
+    async def login(self, username, password):
+        response = await self.talk('/login', {'name': username, 'password': password})
+        if response.ret:
+            # RouterOS до 6.43: challenge-response по md5
+            digest = hashlib.md5(b'\x00' + password.encode(ENCODING) + unhexlify(response.ret)).hexdigest()
+            await self.talk('/login', {'name': username, 'response': '00' + digest})
+
+    def isalive(self):
+        return self._writer is not None and not self._writer.is_closing() \
+               and self._read_task is not None and not self._read_task.done()
+
+    async def talk(self, command, attrs=None, queries=None, timeout=None):
+        """
+        Отправляет запрос и ждет !done. При !trap - ApiError с текстом ошибки
+        """
+        if not self.isalive():
+            raise ApiError(f'API connection to {self.host}:{self.port} is closed')
+        tag = str(next(self._tags))
+        words = get_words(command, attrs, queries, tag)
+        response = ApiResponse(words[:-1])
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tag] = (response, future, [])
+        self._writer.write(encode_sentence(words))
+        try:
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            if command != '/cancel':
+                await self.cancel(tag)
+            raise
+        finally:
+            self._pending.pop(tag, None)
+
+    async def cancel(self, tag):
+        """
+        /cancel запроса по тегу: RouterOS прекращает выполнение и отвечает на тег !trap (interrupted) и !done.
+        Пока ждем ответа на /cancel, тег остается в _pending - его ответы разбираются и отбрасываются,
+        поздние ответы после этого пропускает _read_loop как ответы неизвестного тега
+        """
+        if not self.isalive():
+            return
+        try:
+            await self.talk('/cancel', {'tag': tag}, timeout=self.CANCEL_TIMEOUT)
+        except (ApiError, asyncio.TimeoutError):
+            pass
+
+    async def _read_loop(self):
+        try:
+            while True:
+                reply, attrs, tag = parse_sentence(await read_sentence(self._reader))
+                if reply == '!fatal':
+                    raise ApiError(f'API fatal from {self.host}: {attrs.get("message", "")}')
+                if tag not in self._pending:
+                    continue
+                response, future, trap = self._pending[tag]
+                if reply == '!re':
+                    response.records.append(attrs)
+                elif reply == '!trap':
+                    trap.append(attrs.get('message', 'trap'))
+                elif reply == '!done' and not future.done():
+                    response.finish(attrs)
+                    if trap:
+                        future.set_exception(ApiError('; '.join(trap)))
+                    else:
+                        future.set_result(response)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, ApiError) as err:
+            error = err if isinstance(err, ApiError) else ApiError(f'API connection to {self.host} lost - {err}')
+            for _, future, _ in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            if self._writer is not None:
+                self._writer.close()
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError, ssl.SSLError):
+                pass
@@ -0,0 +1,160 @@
+"""
+Разбор вывода RouterOS CLI за один проход по строкам:
+    print terse        - одна запись на строку: " 0 X key=value key="value" ..."
+    print detail       - запись начинается с номера, продолжается на следующих строках с отступом
+    :put массива as-value - одна запись на строку: "key=value;key=value"
+    print (без параметров для меню-объекта) - строки "key: value"
+Функции iter_* - генераторы записей {key: value}, types = {key: функция} приводит значения к нужному типу.
+quote - обратное преобразование: значение в кавычках для подстановки в команду или скрипт.
+"""
+import re
+
+regex_pair = re.compile(r'([^\s="]+)=("(?:[^"\\]|\\.)*"|\S*)')  # key=value | key="value"
+regex_record_start = re.compile(r'^\s*(\d+)\s+([A-Z]*)\s*')  # номер записи и флаги: " 0 XR "
+regex_duration = re.compile(r'(\d+)([wdhms])')
+regex_time = re.compile(r'(\d+):(\d+):(\d+)$')
+# escape-последовательность RouterOS (\" \\ \$ \D0 ...) или символ, который в кавычках нужно экранировать
+regex_escape = re.compile(r'\\(?:[0-9A-Fa-f]{2}|[\\"$?_abfnrtv])|([\\"$])')
+regex_special = re.compile(r'([\\"$])')
+
+DURATION_SECONDS = {'w': 7 * 86400, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+
+
+def unquote(value):
+    if len(value) > 1 and value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    return value
+
+
+def quote(value, escaped=False):
+    """
+    Значение в кавычках для команды RouterOS: \\, " и $ (подстановка переменной) экранируются, как в "/export".
+    escaped - значение уже в виде из "/export" (ExportConfig): готовые escape-последовательности сохраняются,
+    экранируются только одиночные символы
+    """
+    if escaped:
+        value = regex_escape.sub(lambda match: '\\' + match.group(1) if match.group(1) else match.group(0), value)
+    else:
+        value = regex_special.sub(r'\\\1', value)
+    return f'"{value}"'
+
+
+def set_types(record, types):
+    """Приведение значений записи к типам types = {key: функция}, неприводимые значения остаются строками"""
+    if types:
+        for key, func in types.items():
+            if key in record:
+                try:
+                    record[key] = func(record[key])
+                except ValueError:
+                    pass
+    return record
+
+
+def parse_pairs(line, record=None):
+    """Пары key=value строки terse/detail вывода"""
+    if record is None:
+        record = dict()
+    for key, value in regex_pair.findall(line):
+        record[key] = unquote(value)
+    return record
+
+
+def iter_terse(text, types=None):
+    """Записи "print terse", номер записи - '.index', флаги - '.flags'"""
+    for line in text.splitlines():
+        match = regex_record_start.match(line)
+        if match:
+            record = {'.index': match.group(1), '.flags': match.group(2)}
+            yield set_types(parse_pairs(line[match.end():], record), types)
+
+
+def iter_detail(text, types=None):
+    """Записи "print detail", строки продолжения записи присоединяются к текущей записи"""
+    record = None
+    for line in text.splitlines():
+        match = regex_record_start.match(line)
+        if match:
+            if record is not None:
+                yield set_types(record, types)
+            record = parse_pairs(line[match.end():], {'.index': match.group(1), '.flags': match.group(2)})
+        elif record is not None and line.strip():
+            parse_pairs(line, record)
+    if record is not None:
+        yield set_types(record, types)
+
+
+def iter_as_value(text, types=None):
+    """
+    Записи ":put" массивов as-value: "key=value;key=value".
+    Часть без "=" считается продолжением предыдущего значения, содержащего ";"
+    """
+    for line in text.splitlines():
+        line = line.strip()
+        if '=' not in line:
+            continue
+        record = dict()
+        key = None
+        for item in line.split(';'):
+            if '=' in item:
+                key, value = item.split('=', 1)
+                record[key] = value
+            elif key is not None:
+                record[key] += ';' + item
+        yield set_types(record, types)
+
+
+def parse_as_value(text):
+    """Первая запись as-value вывода, {} - если записей нет"""
+    return next(iter_as_value(text), dict())
+
+
+def iter_fields(text, count, sep=';'):
+    """
+    Строки из count полей через sep, выводимые скриптами (":put ("$ip;" . $received)").
+    Первое поле может содержать sep, строки с другим кол-вом полей пропускаются
+    """
+    for line in text.splitlines():
+        fields = line.strip().rsplit(sep, count - 1)
+        if len(fields) == count:
+            yield fields
+
+
+def parse_key_value(text):
+    """Строки "key: value" вывода print меню-объекта (/system resource print) -> dict"""
+    res = dict()
+    for line in text.splitlines():
+        key, sep, value = line.partition(': ')
+        if sep:
+            res[key.strip()] = value.strip()
+    return res
+
+
+def parse_summary(text, key):
+    """Пары key=value последней строки, содержащей key=, например итог /ping: sent=5 received=5 packet-loss=0%"""
+    for line in reversed(text.splitlines()):
+        if key + '=' in line:
+            return parse_pairs(line)
+    return dict()
+
+
+def parse_duration(value):
+    """Длительность RouterOS в секундах: '1w2d3h4m5s' или '1w2d03:04:05'"""
+    seconds = 0
+    time_match = regex_time.search(value)
+    if time_match:
+        h, m, s = time_match.groups()
+        seconds += int(h) * 3600 + int(m) * 60 + int(s)
+        value = value[:time_match.start()]
+    for number, unit in regex_duration.findall(value):
+        seconds += int(number) * DURATION_SECONDS[unit]
+    return seconds
+
+
+def to_columns(records, keys):
+    """Записи в колонки {key: [value, ...]}, отсутствующие значения - None"""
+    columns = {key: [] for key in keys}
+    for record in records:
+        for key in keys:
+            columns[key].append(record.get(key))
+    return columns
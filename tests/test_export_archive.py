@@ -0,0 +1,45 @@
+import os
+
+from export_archive import ExportArchive
+
+BODY = '''# software id = ABCD-1234
+/interface bridge
+add name=bridge-office protocol-mode=none
+/interface eoip
+add local-address=192.168.0.1 name=eoip-office remote-address=10.0.0.1 tunnel-id=101
+'''
+MONDAY = '# jul/11/2022 10:00:01 by RouterOS 6.48.6\n' + BODY
+TUESDAY = '# jul/12/2022 10:00:07 by RouterOS 6.48.6\n' + BODY
+
+
+def get_objects(archive):
+    dir_ = os.path.join(archive.dir, 'objects')
+    return [name for _, _, names in os.walk(dir_) for name in names]
+
+
+def write_chunks(archive, text, size):
+    writer = archive.open_writer()
+    data = text.encode()
+    for i in range(0, len(data), size):
+        writer.write(data[i:i + size])
+    return writer.close()
+
+
+def test_header_date_not_hashed(tmp_path):
+    archive = ExportArchive(str(tmp_path))
+    hash_ = archive.put(MONDAY)
+    assert archive.put(TUESDAY) == hash_
+    assert len(get_objects(archive)) == 1
+    assert archive.get_object(hash_) == MONDAY
+    assert archive.put(MONDAY.replace('10.0.0.1', '10.0.0.2')) != hash_
+    assert len(get_objects(archive)) == 2
+
+
+def test_writer_hash_matches_put(tmp_path):
+    archive = ExportArchive(str(tmp_path))
+    hash_ = archive.put(MONDAY)
+    # заголовок разрезан между частями, вывод канала может начинаться с перевода строки
+    assert write_chunks(archive, TUESDAY, 7) == hash_
+    assert write_chunks(archive, '\r\n' + TUESDAY, 1) == hash_
+    assert write_chunks(archive, BODY, 5) == hash_  # без заголовка - то же содержимое
+    assert len(get_objects(archive)) == 1
@@ -0,0 +1,43 @@
+import icmp_analytics
+from icmp_history import IcmpHistory
+
+
+def get_rows(history):
+    return history.connection.execute('SELECT date, cm_ip, ip, received FROM icmp ORDER BY date, cm_ip, ip').fetchall()
+
+
+def test_rerun_replaces_day_of_written_cms():
+    with IcmpHistory(':memory:') as history:
+        history.append('ip_free', '2022-07-11', [('Москва', 'CM-1', '1.1.1.1', '10.0.0.1', 5, 5),
+                                                 ('Москва', 'CM-1', '1.1.1.1', '10.0.0.2', 5, 0),
+                                                 ('Москва', 'CM-2', '2.2.2.2', '10.0.1.1', 5, 5)])
+        history.append('ip_free', '2022-07-10', [('Москва', 'CM-1', '1.1.1.1', '10.0.0.2', 5, 5)])
+        # повторный запуск по CM-1: 10.0.0.2 больше не проверяется, CM-2 и другие даты не затрагиваются
+        assert history.append('ip_free', '2022-07-11', [('Москва', 'CM-1', '1.1.1.1', '10.0.0.1', 5, 4)]) == 1
+        assert get_rows(history) == [('2022-07-10', '1.1.1.1', '10.0.0.2', 5),
+                                     ('2022-07-11', '1.1.1.1', '10.0.0.1', 4),
+                                     ('2022-07-11', '2.2.2.2', '10.0.1.1', 5)]
+
+
+def test_summary_last_days_per_cm():
+    with IcmpHistory(':memory:') as history:
+        for date_ in ('2022-07-01', '2022-07-02', '2022-07-03', '2022-07-04'):
+            history.append('ip_free', date_, [('Москва', 'CM-1', '1.1.1.1', '10.0.0.1', 5, 5)])
+        # CM-2 не опрашивался в последние даты: его последние 2 даты - 07-01 и 07-02
+        for date_ in ('2022-07-01', '2022-07-02'):
+            history.append('ip_free', date_, [('Москва', 'CM-2', '2.2.2.2', '10.0.1.1', 5, 5)])
+        summary = {row['Remote IP']: row for row in history.get_summary('ip_free', last_days=2)}
+        info, dates, matrix = icmp_analytics.load_matrix(history, 'ip_free')
+    metrics = icmp_analytics.get_metrics(info, matrix, last_days=2).set_index('Remote IP')
+    for ip, total, last_week in (('10.0.0.1', 4, 2), ('10.0.1.1', 2, 2)):
+        assert (summary[ip]['ICMP TOTAL'], summary[ip]['TRUE ICMP LAST WEEK']) == (total, last_week)
+        assert (metrics.loc[ip, 'ICMP TOTAL'], metrics.loc[ip, 'TRUE ICMP LAST WEEK']) == (total, last_week)
+
+
+def test_metrics_columns_without_history():
+    with IcmpHistory(':memory:') as history:
+        history.append('ip_free', '2022-07-01', [('Москва', 'CM-1', '1.1.1.1', '10.0.0.1', 5, 5)])
+        full = icmp_analytics.get_metrics(*icmp_analytics.load_matrix(history, 'ip_free')[::2])
+        empty = icmp_analytics.get_metrics(*icmp_analytics.load_matrix(history, 'ip_free', city='Пермь')[::2])
+    assert len(full) == 1 and len(empty) == 0
+    assert list(empty.columns) == list(full.columns)
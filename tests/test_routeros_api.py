@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+import fake_routeros_api
+import routeros_api
+
+TABLES = {
+    '/interface': [
+        {'name': 'ether1', 'type': 'ether', 'running': 'true'},
+        {'name': 'eoip-1', 'type': 'eoip-tunnel', 'running': 'true'},
+        {'name': 'eoip-2', 'type': 'eoip-tunnel', 'running': 'false'},
+    ],
+    '/system/identity': [{'name': 'CM-1'}],
+}
+
+
+async def read_length(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return await routeros_api.read_length(reader)
+
+
+@pytest.mark.parametrize('length, size', [
+    (0, 1), (0x7F, 1),
+    (0x80, 2), (0x3FFF, 2),
+    (0x4000, 3), (0x1FFFFF, 3),
+    (0x200000, 4), (0xFFFFFFF, 4),
+    (0x10000000, 5),
+])
+def test_length_round_trip(length, size):
+    encoded = routeros_api.encode_length(length)
+    assert len(encoded) == size
+    assert asyncio.run(read_length(encoded)) == length
+
+
+def test_sentence_round_trip():
+    words = ['/interface/print', '=.proplist=name,comment', '?type=eoip-tunnel', '=comment=' + 'x' * 0x4000]
+
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(routeros_api.encode_sentence(words))
+        reader.feed_eof()
+        return await routeros_api.read_sentence(reader)
+
+    assert asyncio.run(run()) == words
+
+
+async def open_api(server, **params):
+    port = await server.start()
+    return await routeros_api.RouterOsApi('127.0.0.1', port, **params).open(server.username, server.password)
+
+
+def test_pipelined_requests():
+    async def run():
+        server = fake_routeros_api.FakeApiServer(TABLES)
+        api = await open_api(server)
+        try:
+            server.latency = 0.05
+            responses = await asyncio.gather(*(
+                [api.talk('/interface/print', {'.proplist': 'name'}, {'type': 'eoip-tunnel'}) for _ in range(20)]
+                + [api.talk('/interface/print', {'count-only': ''}), api.talk('/system/identity/print')]))
+            with pytest.raises(routeros_api.ApiError, match='no such command'):
+                await api.talk('/ip/route/print')
+        finally:
+            await api.close()
+            await server.close()
+        return responses
+
+    responses = asyncio.run(run())
+    for response in responses[:20]:
+        assert response.records == [{'name': 'eoip-1'}, {'name': 'eoip-2'}]
+    assert responses[20].ret == '3'
+    assert responses[21].records == [{'name': 'CM-1'}]
+
+
+async def handle_interleaved(reader, writer):
+    """Ответы на два запроса вперемешку: !re и !done второго запроса раньше, чем первого"""
+    login = await routeros_api.read_sentence(reader)
+    writer.write(routeros_api.encode_sentence(['!done', login[-1]]))
+    first = (await routeros_api.read_sentence(reader))[-1]
+    second = (await routeros_api.read_sentence(reader))[-1]
+    for sentence in (['!re', '=name=b1', second], ['!re', '=name=a1', first], ['!re', '=name=b2', second],
+                     ['!done', second], ['!re', '=name=a2', first], ['!done', first]):
+        writer.write(routeros_api.encode_sentence(sentence))
+    await writer.drain()
+    await reader.read()
+
+
+def test_interleaved_replies():
+    async def run():
+        server = await asyncio.start_server(handle_interleaved, '127.0.0.1', 0)
+        api = routeros_api.RouterOsApi('127.0.0.1', server.sockets[0].getsockname()[1])
+        await api.open('admin', '')
+        try:
+            first = asyncio.ensure_future(api.talk('/interface/print'))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(api.talk('/ip/address/print'))
+            return await first, await second
+        finally:
+            await api.close()
+            server.close()
+            await server.wait_closed()
+
+    first, second = asyncio.run(run())
+    assert first.records == [{'name': 'a1'}, {'name': 'a2'}]
+    assert second.records == [{'name': 'b1'}, {'name': 'b2'}]
+
+
+def test_timeout_cancels_request():
+    async def run():
+        server = fake_routeros_api.FakeApiServer(TABLES)
+        api = await open_api(server)
+        try:
+            server.latency = 1
+            with pytest.raises(asyncio.TimeoutError):
+                await api.talk('/interface/print', timeout=0.1)
+            server.latency = 0
+            assert server.cancelled == ['1']  # тег 0 - /login
+            assert not api._pending
+            response = await api.talk('/system/identity/print')
+        finally:
+            await api.close()
+            await server.close()
+        return response
+
+    assert asyncio.run(run()).records == [{'name': 'CM-1'}]
@@ -0,0 +1,123 @@
+import routeros_output
+
+INTERFACE_TERSE = '''\
+Flags: D - dynamic, X - disabled, R - running, S - slave 
+ 0  R name=ether1 default-name=ether1 type=ether mtu=1500 actual-mtu=1500 l2mtu=1598 max-l2mtu=9578 mac-address=D4:CA:6D:00:00:01 
+ 1  RS name=ether2 default-name=ether2 type=ether mtu=1500 actual-mtu=1500 l2mtu=1598 max-l2mtu=9578 mac-address=D4:CA:6D:00:00:02 
+ 2 X   name=eoip-reserve type=eoip-tunnel mtu=auto actual-mtu=1458 l2mtu=65535 mac-address=02:1A:2B:3C:4D:5E 
+ 3  R name="vlan 101" type=vlan mtu=1500 actual-mtu=1500 l2mtu=1594 mac-address=D4:CA:6D:00:00:02 
+'''
+
+EOIP_DETAIL = '''\
+Flags: X - disabled, R - running 
+ 0  R name="eoip-office" mtu=auto actual-mtu=1458 l2mtu=65535 mac-address=02:1A:2B:3C:4D:5E arp=enabled 
+      arp-timeout=auto loop-protect=default loop-protect-status=off loop-protect-send-interval=5s 
+      loop-protect-disable-time=5m local-address=0.0.0.0 remote-address=10.0.0.1 tunnel-id=101 
+      keepalive=10s,10 dscp=inherited clamp-tcp-mss=yes dont-fragment=no allow-fast-path=yes 
+
+ 1 X  ;;; reserve
+      name="eoip-reserve" mtu=auto actual-mtu=1458 l2mtu=65535 mac-address=02:1A:2B:3C:4D:5F arp=enabled 
+      local-address=0.0.0.0 remote-address=10.0.0.2 tunnel-id=102 keepalive=10s,10 
+
+'''
+
+PPP_ACTIVE_DETAIL = '''\
+Flags: R - radius 
+ 0   name="user1" service=pptp caller-id="192.0.2.10" address=10.10.0.2 uptime=1d2h3m4s 
+     encoding="MPPE128 stateless" session-id=0x81500001 limit-bytes-in=0 limit-bytes-out=0 
+
+ 1 R name="user2" service=l2tp caller-id="192.0.2.11" address=10.10.0.3 uptime=5m30s encoding="" 
+     session-id=0x81500002 limit-bytes-in=0 limit-bytes-out=0 
+'''
+
+RESOURCE = '''\
+                   uptime: 2w3d4h5m6s
+                  version: 6.48.6 (long-term)
+               build-time: Jan/19/2022 10:25:36
+              free-memory: 3822.4MiB
+                      cpu: tilegx
+               board-name: CCR1036-8G-2S+
+'''
+
+PING = '''\
+  SEQ HOST                                     SIZE TTL TIME  STATUS                                     
+    0 10.0.0.1                                   56  64 0ms  
+    1 10.0.0.1                                   56  64 0ms  
+    2 10.0.0.1                                              timeout                                    
+    sent=3 received=2 packet-loss=33% min-rtt=0ms avg-rtt=0ms max-rtt=0ms 
+'''
+
+
+def test_iter_terse():
+    records = list(routeros_output.iter_terse(INTERFACE_TERSE, types={'mtu': int}))
+    assert [record['name'] for record in records] == ['ether1', 'ether2', 'eoip-reserve', 'vlan 101']
+    assert [record['.flags'] for record in records] == ['R', 'RS', 'X', 'R']
+    assert [record['.index'] for record in records] == ['0', '1', '2', '3']
+    assert records[0]['mtu'] == 1500
+    assert records[2]['mtu'] == 'auto'  # неприводимое значение остается строкой
+    assert records[2]['type'] == 'eoip-tunnel'
+
+
+def test_iter_detail_joins_continuation_lines():
+    records = list(routeros_output.iter_detail(EOIP_DETAIL))
+    assert len(records) == 2
+    assert records[0]['name'] == 'eoip-office'
+    assert records[0]['remote-address'] == '10.0.0.1'
+    assert records[0]['allow-fast-path'] == 'yes'
+    assert records[1]['.flags'] == 'X'
+    assert records[1]['name'] == 'eoip-reserve'
+    assert records[1]['tunnel-id'] == '102'
+
+
+def test_iter_detail_quoted_values():
+    records = list(routeros_output.iter_detail(PPP_ACTIVE_DETAIL))
+    assert [record['name'] for record in records] == ['user1', 'user2']
+    assert records[0]['encoding'] == 'MPPE128 stateless'
+    assert records[0]['session-id'] == '0x81500001'
+    assert records[1]['.flags'] == 'R'
+    assert records[1]['encoding'] == ''
+
+
+def test_iter_as_value_keeps_separator_in_values():
+    text = 'name=eoip-1;remote-address=10.0.0.1\nname=a;b;remote-address=10.0.0.2\n\n'
+    assert list(routeros_output.iter_as_value(text)) == [
+        {'name': 'eoip-1', 'remote-address': '10.0.0.1'},
+        {'name': 'a;b', 'remote-address': '10.0.0.2'},
+    ]
+    assert routeros_output.parse_as_value('') == dict()
+
+
+def test_parse_key_value():
+    resource = routeros_output.parse_key_value(RESOURCE)
+    assert resource['version'] == '6.48.6 (long-term)'
+    assert resource['board-name'] == 'CCR1036-8G-2S+'
+    assert resource['build-time'] == 'Jan/19/2022 10:25:36'
+
+
+def test_parse_summary():
+    summary = routeros_output.parse_summary(PING, 'received')
+    assert summary['sent'] == '3'
+    assert summary['received'] == '2'
+    assert summary['packet-loss'] == '33%'
+
+
+def test_parse_duration():
+    assert routeros_output.parse_duration('2w3d4h5m6s') == 2 * 604800 + 3 * 86400 + 4 * 3600 + 5 * 60 + 6
+    assert routeros_output.parse_duration('2w3d04:05:06') == 2 * 604800 + 3 * 86400 + 4 * 3600 + 5 * 60 + 6
+    assert routeros_output.parse_duration('00:00:10') == 10
+    assert routeros_output.parse_duration('5m30s') == 330
+    assert routeros_output.parse_duration('1d') == 86400
+    assert routeros_output.parse_duration('') == 0
+
+
+def test_quote_raw_value():
+    assert routeros_output.quote('eoip-1') == '"eoip-1"'
+    assert routeros_output.quote('eoip "office"') == r'"eoip \"office\""'
+    assert routeros_output.quote('a\\b $x') == r'"a\\b \$x"'
+
+
+def test_quote_export_value_keeps_escapes():
+    # значения ExportConfig - как в "/export": кириллица и кавычки уже экранированы
+    assert routeros_output.quote(r'bridge \D0\9E\D1\84', escaped=True) == r'"bridge \D0\9E\D1\84"'
+    assert routeros_output.quote(r'eoip \"office\"', escaped=True) == r'"eoip \"office\""'
+    assert routeros_output.quote('eoip "office" \\ $x', escaped=True) == r'"eoip \"office\" \\ \$x"'
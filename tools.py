@@ -1,8 +1,17 @@
+import hashlib
 import json
 import os, pandas, numpy
+import pickle
 import re
 import time
 
+import reports
+import icmp_analytics
+from icmp_history import LAST_DAYS
+
+DIR_CACHE = 'cache'
+CACHE_VERSION = 1  # увеличить при изменении формата кэша read_excel_columns
+
 cities_ekt = ('Екатеринбург', 'Пермь', 'Уфа', 'Хабаровск', 'Тюмень', 'Челябинск', 'Самара', 'Нижний Тагил', 'Ижевск',
               'Тольятти', 'Каменск-Уральский', 'Магнитогорск', 'Сызрань', 'Златоуст', 'Миасс', 'Ванино', 'Киров',
               'Нижневартовск', 'Сургут', 'Курган', 'Сибай')
@@ -115,15 +124,42 @@ def get_file_name(name, suffix, dir, ext='txt'):
     return os.path.join(dir, filename)
 
 
+def read_excel_columns(filename, cache_dir=DIR_CACHE):
+    """
+    Столбцы Excel файла {столбец: [значения]}. Результат сохраняется в cache_dir (pickle) с ключом
+    (путь, mtime, размер файла): пока файл не изменился, повторный запуск не разбирает xlsx.
+    cache_dir='' - без кэша
+    """
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    key = (CACHE_VERSION, path, stat.st_mtime_ns, stat.st_size)
+    cache_file = os.path.join(cache_dir, hashlib.md5(path.encode()).hexdigest() + '.pickle') if cache_dir else ''
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as file:
+                cache_key, columns = pickle.load(file)
+            if cache_key == key:
+                return columns
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+    data = pandas.read_excel(filename)
+    columns = {column: data[column].tolist() for column in data.columns}
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'wb') as file:
+            pickle.dump((key, columns), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    return columns
+
+
 def save_list2json_file(cm_list, dir, filename):
     with open(os.path.join(dir, filename), 'wt') as file:
         file.write(json.dumps(cm_list))
 
 
 def save_list2excel_file(cm_list, dir, filename):
-    cm_json = json.dumps(cm_list)
-    data = pandas.read_json(cm_json)
-    data.to_excel(os.path.join(dir, filename))
+    reports.write_records(os.path.join(dir, filename), cm_list)
 
 
 def load_list_from_json_file(dir, filename):
@@ -150,6 +186,27 @@ def list_split(ip_list, base):
     return res
 
 
+def list_split_by_length(items, max_length, sep=','):
+    """
+    Делит список строк на части, чтобы длина каждой части, объединенной через sep, не превышала max_length
+    """
+    res = []
+    part = []
+    length = 0
+    for item in items:
+        item_length = len(item) + (len(sep) if part else 0)
+        if part and length + item_length > max_length:
+            res.append(part)
+            part = []
+            item_length = len(item)
+            length = 0
+        part.append(item)
+        length += item_length
+    if part:
+        res.append(part)
+    return res
+
+
 def extract_IP_from_tu_excel():
     dir = 'tu_excel'
     # file = 'тест - РНД.xlsx'
@@ -224,69 +281,14 @@ def extract_IP_from_tu_service():
     summary_ip_services.to_excel(os.path.join(DIR_OUTPUT, 'summary_ip_service.xlsx'))
 
 
-def analyzeDynamicICMP(dir_path, file_mask, output_file):
-    import glob
-
-    def filter_good(df, column):
-        # Отбираем успешные ICMP запросы
-        return (df[column]).values.astype(str) > 'Успешно'
-
-    def filter_bad(df, column):
-        # Отбираем не успешные ICMP запросы
-        return (df[column]).values.astype(str) < 'Успешно'
-
-    def analyze_column(df, column):
-        # Успешные ICMP запросы помечаем 1, не успешные - 0
-        df[column][filter_bad(df, column)] = 0
-        df[column][filter_good(df, column)] = 1
-
-    file_list = glob.glob1(dir_path, f'{file_mask}')
-    all_city_icmp_data = None
-    for file in file_list:
-        city_name = file[:file.find('_')]
-        city_icmp = ExtDataBase(os.path.join(dir_path, file),
-                                # columns=['Город', 'NAME_DEVICE', 'IP_DEVICE', 'LOGIN', 'PASSWORD'],
-                                # column_for_check_na='IP_DEVICE')
-                                )
-        for column in city_icmp.data.columns[1:-3]:
-            analyze_column(city_icmp.data, column)
-
-        ip_list = []
-        city_name_list = []
-        cmikrotik_name_list = []
-        cmikrotik_ip_list = []
-
-        icmp_sum_list = []
-        icmp_sum_last7_list = []
-        for row in city_icmp.data.iterrows():
-            row_val = row[1]
-            ip_list.append(row_val[0])
-            city_name_list.append(row_val['City'])
-            cmikrotik_name_list.append(row_val['CMikroTik Name'])
-            cmikrotik_ip_list.append(row_val['CMikroTik IP'])
-
-            # сумма всех значений, за исключением трех столбцов - City, CMikroTik Name, CMikroTik IP
-            icmp_sum_list.append(row_val[1:-3].sum())
-            try:
-                # сумма последних семи значений, за исключением трех столбцов - City, CMikroTik Name, CMikroTik IP
-                icmp_sum_last7_list.append(row_val[-4:-11:-1].sum())
-            except BaseException:
-                icmp_sum_last7_list.append('Error')
-
-        d = {'Remote IP': ip_list,
-             'CityCM': city_name_list,
-             'CMikroTik Name': cmikrotik_name_list,
-             'CMikroTik IP': cmikrotik_ip_list,
-             'ICMP TOTAL': len(city_icmp.data.columns) - 4,
-             'TRUE ICMP ALL TIME': icmp_sum_list,
-             'TRUE ICMP LAST WEEK': icmp_sum_last7_list}
-        city_icmp_data = pandas.read_json(json.dumps(d))
-        if all_city_icmp_data is None:
-            all_city_icmp_data = city_icmp_data
-        else:
-            all_city_icmp_data = pandas.concat([all_city_icmp_data, city_icmp_data])
-
-    all_city_icmp_data.to_excel(os.path.join(dir_path, output_file))
+def analyzeDynamicICMP(history_file, output_file, type_ip_list='ip_free', city=None, last_days=LAST_DAYS,
+                       windows=icmp_analytics.WINDOWS):
+    """
+    Сводка динамики доступности IP по истории ICMP (icmp_history): всего дат проверок, успешных за всё время
+    и за последние last_days дат, доля успешных в окнах windows, серии недоступности и смены состояния,
+    см. icmp_analytics. city - только один город
+    """
+    icmp_analytics.save_report(history_file, output_file, type_ip_list, city, windows, last_days)
 
 
 def parse_ip_remote_cpe_from_file(dir, filename, output_file):
@@ -314,16 +316,16 @@ def parse_ip_remote_cpe_from_file(dir, filename, output_file):
          'IP in CPE': ip_in_cpe_list,
          'Interface in CPE': interface_in_cpe_list
          }
-    data_with_ip_in_cpe = pandas.read_json(json.dumps(d))
-    data_with_ip_in_cpe.to_excel(os.path.join(dir, output_file))
+    reports.write_columns(os.path.join(dir, output_file), d)
 
 
 def main():
     # extract_IP_from_tu_excel()
     # extract_IP_from_tu_service()
-    # analyzeDynamicICMP('output_icmp_ip_free_new', 'Кемерово*', 'temp_summary_ip_free_dynamic.xlsx')
-    # analyzeDynamicICMP('output_icmp_ip_free_new', '[!~$]*icmp_ip_free*', 'summary_ip_free_dynamic.xlsx')
-    # analyzeDynamicICMP('output_icmp_ip_in_tu_new', '[!~$]*icmp_ip_in_tu*', 'summary_ip_in_tu_dynamic.xlsx')
+    # IcmpHistory('icmp_history.sqlite').import_xlsx('ip_free', 'output_icmp_ip_free_new', '[!~$]*icmp_ip_free*')
+    # analyzeDynamicICMP('icmp_history.sqlite', 'temp_summary_ip_free_dynamic.xlsx', 'ip_free', city='Кемерово')
+    # analyzeDynamicICMP('icmp_history.sqlite', 'summary_ip_free_dynamic.xlsx', 'ip_free')
+    # analyzeDynamicICMP('icmp_history.sqlite', 'summary_ip_in_tu_dynamic.xlsx', 'ip_in_tu')
     parse_ip_remote_cpe_from_file('ip_free_with_ping', 'ip_free.xlsx', output_file='ip_free_with_ip_in_cpe.xlsx')
 
 if __name__ == "__main__":